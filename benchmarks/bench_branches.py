@@ -0,0 +1,132 @@
+"""
+Mide cuánto gana un archivo al ejecutar sus ramas Program e IFR en dos hilos (como run_file_pipeline)
+frente a ejecutarlas una tras otra, y si ayudaría darle a cada rama su propio lector del libro.
+
+Cada rama hace el trabajo real del ETL: Program = parseo + limpieza + COPY a staging;
+IFR = transformación + COPY a staging (las versiones preparadas se descartan al final).
+Modos:
+    serial            una rama tras otra con un solo WorkbookHandle
+    threads_shared    dos hilos con un solo WorkbookHandle (las lecturas se serializan con su lock)
+    threads_separate  dos hilos, cada uno con su propio WorkbookHandle
+
+Los maestros de IFR salen del catálogo del generador. Necesita un PostgreSQL local (variables
+DATABASE_*); las tablas se crean en el esquema --schema, que se elimina al terminar.
+
+Uso:
+    PYTHONPATH=. python benchmarks/bench_branches.py --program-rows 50000 --ifr-blocks 1000 --repeat 3
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workbook", help="Libro .xlsx existente (por defecto se genera uno sintético)")
+    parser.add_argument("--program-rows", type=int, default=20_000)
+    parser.add_argument("--ifr-blocks", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--schema", default="etl_bench_branches", help="Esquema de PostgreSQL donde se crean las tablas")
+    return parser.parse_args()
+
+
+# El esquema se fija antes de importar los módulos del ETL, que leen settings al importarse
+ARGS = parse_args()
+os.environ["DATABASE_SCHEMA"] = ARGS.schema
+
+from prefect.logging import disable_run_logger
+from psycopg import sql
+
+import prefect_flows.tasks.transform as transform
+from benchmarks.check_ifr_transform import master_data_maps
+from benchmarks.workbook_generator import generate_workbook
+from database.db_file_load import discard_staged_versions
+from database.db_ifr import init_ifr_table, stage_ifr_version
+from database.db_pool import get_connection
+from database.db_program import init_products_table, stage_dataframe_to_table
+from prefect_flows.utils.workbook import WorkbookHandle
+
+
+def program_branch(workbook: WorkbookHandle, timings: dict) -> dict:
+    start = time.perf_counter()
+    df = transform.clean_dataframe.fn(transform.parse_excel_sheet.fn(workbook, "Program"), "Program")
+    timings["program_parse"] = time.perf_counter() - start
+    init_products_table(df, "program")
+    staged = stage_dataframe_to_table(df, "program", "bench.xlsx")
+    timings["program"] = time.perf_counter() - start
+    return staged
+
+
+def ifr_branch(workbook: WorkbookHandle, timings: dict) -> dict:
+    start = time.perf_counter()
+    df = transform.transform_ifr_excel.fn(workbook)
+    timings["ifr_parse"] = time.perf_counter() - start
+    init_ifr_table(df)
+    staged = stage_ifr_version(df, "bench.xlsx")
+    timings["ifr"] = time.perf_counter() - start
+    return staged
+
+
+def run(data: bytes, mode: str) -> dict:
+    """Ejecuta ambas ramas en el modo indicado; retorna los tiempos por rama y el total."""
+    timings, staged = {}, []
+    start = time.perf_counter()
+    if mode == "serial":
+        with WorkbookHandle(data) as workbook:
+            staged = [program_branch(workbook, timings), ifr_branch(workbook, timings)]
+    else:
+        handles = [WorkbookHandle(data)]
+        handles.append(handles[0] if mode == "threads_shared" else WorkbookHandle(data))
+        threads = [
+            threading.Thread(target=lambda: staged.append(program_branch(handles[0], timings))),
+            threading.Thread(target=lambda: staged.append(ifr_branch(handles[1], timings))),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for handle in set(handles):
+            handle.close()
+    timings["total"] = time.perf_counter() - start
+    discard_staged_versions(staged)
+    return timings
+
+
+def main():
+    transform.get_master_data = lambda: master_data_maps()
+    with get_connection() as conn:
+        conn.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {}").format(sql.Identifier(ARGS.schema)))
+        conn.commit()
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp, disable_run_logger():
+            path = ARGS.workbook
+            if path is None:
+                path = os.path.join(tmp, "synthetic.xlsx")
+                generate_workbook(path, ARGS.program_rows, ARGS.ifr_blocks)
+            with open(path, "rb") as f:
+                data = f.read()
+
+            run(data, "serial")  # calentamiento: crea las tablas y llena las cachés
+            modes = ("serial", "threads_shared", "threads_separate")
+            results = {mode: [run(data, mode) for _ in range(ARGS.repeat)] for mode in modes}
+
+        print(f"{'mode':<18}{'total':>8}{'program':>9}{'ifr':>8}{'parse P':>9}{'parse I':>9}")
+        for mode, runs in results.items():
+            median = {key: statistics.median(r[key] for r in runs) for key in runs[0]}
+            print(f"{mode:<18}{median['total']:>7.2f}s{median['program']:>8.2f}s{median['ifr']:>7.2f}s"
+                  f"{median['program_parse']:>8.2f}s{median['ifr_parse']:>8.2f}s")
+        serial = statistics.median(r["total"] for r in results["serial"])
+        for mode in modes[1:]:
+            print(f"speedup {mode}: x{serial / statistics.median(r['total'] for r in results[mode]):.2f}")
+    finally:
+        with get_connection() as conn:
+            conn.execute(sql.SQL("DROP SCHEMA IF EXISTS {} CASCADE").format(sql.Identifier(ARGS.schema)))
+            conn.commit()
+
+
+if __name__ == "__main__":
+    main()
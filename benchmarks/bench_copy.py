@@ -0,0 +1,84 @@
+"""
+Compara el COPY en CSV (buffer StringIO) con el COPY binario (write_row con tipos)
+sobre un DataFrame sintético con enteros nullable, floats con NaN, textos y fechas.
+Necesita las variables DATABASE_* apuntando a un PostgreSQL local.
+
+Uso:
+    PYTHONPATH=. python benchmarks/bench_copy.py --rows 200000 --repeat 3
+"""
+import argparse
+import statistics
+import time
+import numpy as np
+import pandas as pd
+from psycopg import sql
+
+from database.db_copy import copy_dataframe_binary, copy_dataframe_csv
+from database.db_pool import get_connection
+
+TABLE_NAME = "bench_copy"
+
+
+def build_dataframe(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    ids = pd.array(rng.integers(1, 1000, rows), dtype="Int64")
+    ids[rng.random(rows) < 0.05] = pd.NA
+    values = rng.random(rows) * 1000
+    values[rng.random(rows) < 0.1] = np.nan
+    return pd.DataFrame({
+        "id_product": ids,
+        "periodoequivalente": rng.integers(1, 25, rows),
+        "pais": rng.choice(["USA", "CHN", "CL", None], rows),
+        "sales": values,
+        "final_inv": rng.random(rows),
+        "loaded_at": pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 10**6, rows), unit="s"),
+    })
+
+
+def measure(copy_fn, df: pd.DataFrame, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql.SQL("TRUNCATE {}").format(sql.Identifier(TABLE_NAME)))
+                start = time.perf_counter()
+                copy_fn(cur, df, TABLE_NAME)
+                timings.append(time.perf_counter() - start)
+            conn.commit()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df = build_dataframe(args.rows)
+    with get_connection() as conn:
+        conn.execute(sql.SQL("""
+            CREATE TABLE IF NOT EXISTS {} (
+                id_product BIGINT, periodoequivalente BIGINT, pais TEXT,
+                sales DOUBLE PRECISION, final_inv DOUBLE PRECISION, loaded_at TIMESTAMP
+            )
+        """).format(sql.Identifier(TABLE_NAME)))
+        conn.commit()
+
+    try:
+        results = {
+            "csv": measure(copy_dataframe_csv, df, args.repeat),
+            "binary": measure(copy_dataframe_binary, df, args.repeat),
+        }
+    finally:
+        with get_connection() as conn:
+            conn.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(TABLE_NAME)))
+            conn.commit()
+
+    for name, timings in results.items():
+        median = statistics.median(timings)
+        print(f"{name:<7} median={median:.3f}s rows/s={args.rows / median:,.0f}")
+    print(f"speedup x{statistics.median(results['csv']) / statistics.median(results['binary']):.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Mide cada etapa del ETL (apertura del libro, parseo y limpieza de Program, clasificación y
+transformación de IFR, carga con COPY) sobre un libro sintético o uno existente.
+Reporta tiempo (mediana), filas/s y pico de memoria por etapa. Los tiempos salen de pasadas
+sin tracemalloc (que ralentiza mucho el parseo) y el pico de memoria de una pasada adicional con él.
+
+Funciona sin red: no usa MinIO ni el servidor de Prefect (las tareas se ejecutan con .fn).
+Necesita un PostgreSQL local (variables DATABASE_*); todo se crea en el esquema --schema,
+que se carga con el catálogo de maestros del generador y se elimina al terminar salvo --keep-schema.
+
+Uso:
+    PYTHONPATH=. python benchmarks/bench_pipeline.py --program-rows 20000 --ifr-blocks 500 --repeat 3
+    PYTHONPATH=. python benchmarks/bench_pipeline.py --workbook libro.xlsx
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workbook", help="Libro .xlsx existente (por defecto se genera uno sintético)")
+    parser.add_argument("--program-rows", type=int, default=10_000)
+    parser.add_argument("--ifr-blocks", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--schema", default="etl_bench", help="Esquema de PostgreSQL donde se crean las tablas")
+    parser.add_argument("--keep-schema", action="store_true")
+    return parser.parse_args()
+
+
+# El esquema se fija antes de importar los módulos del ETL, que leen settings al importarse
+ARGS = parse_args()
+os.environ["DATABASE_SCHEMA"] = ARGS.schema
+
+from prefect.logging import disable_run_logger
+from psycopg import sql
+
+from benchmarks.workbook_generator import DESTINATIONS, PACKAGING, PRODUCTS, generate_workbook
+from database.db_ifr import copy_dataframe_to_table_ifr, init_ifr_table
+from database.db_master_data import invalidate_master_data
+from database.db_pool import get_connection
+from database.db_program import copy_dataframe_to_table, init_products_table
+from prefect_flows.tasks.transform import METRICS_MAP, classify_ifr_column, clean_dataframe, parse_excel_sheet, transform_ifr_excel
+from prefect_flows.utils.ifr_layout import detect_ifr_layout
+from prefect_flows.utils.workbook import WorkbookHandle
+
+
+def seed_master_data(schema: str):
+    """Crea el esquema y carga las tablas maestras con el catálogo del generador."""
+    ident = sql.Identifier(schema)
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {}").format(ident))
+            cur.execute(sql.SQL("""
+                CREATE TABLE IF NOT EXISTS {}.products (id_product INTEGER PRIMARY KEY, product_name TEXT);
+                CREATE TABLE IF NOT EXISTS {}.packaging (id_packaging INTEGER PRIMARY KEY, packaging_code TEXT);
+                CREATE TABLE IF NOT EXISTS {}.destinations (id_destination INTEGER PRIMARY KEY, destination_name TEXT, country TEXT);
+                TRUNCATE {}.products, {}.packaging, {}.destinations;
+            """).format(*[ident] * 6))
+            cur.executemany(sql.SQL("INSERT INTO {}.products VALUES (%s, %s)").format(ident), list(enumerate(PRODUCTS)))
+            cur.executemany(sql.SQL("INSERT INTO {}.packaging VALUES (%s, %s)").format(ident),
+                            [(i, code) for i, (_, code) in enumerate(PACKAGING)])
+            cur.executemany(sql.SQL("INSERT INTO {}.destinations VALUES (%s, %s, %s)").format(ident),
+                            [(i, name.lower(), country) for i, (name, country) in enumerate(DESTINATIONS)])
+        conn.commit()
+    invalidate_master_data()
+
+
+def drop_schema(schema: str):
+    with get_connection() as conn:
+        conn.execute(sql.SQL("DROP SCHEMA IF EXISTS {} CASCADE").format(sql.Identifier(schema)))
+        conn.commit()
+
+
+def run_stage(results: dict, name: str, fn, rows_of):
+    """
+    Ejecuta una etapa y retorna su resultado. Con tracemalloc activo registra el pico de memoria
+    de la etapa; si no, su tiempo y las filas producidas.
+    """
+    stage = results.setdefault(name, {"times": [], "rows": 0, "peak": 0})
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        value = fn()
+        _, peak = tracemalloc.get_traced_memory()
+        stage["peak"] = max(stage["peak"], peak - base)
+        return value
+
+    start = time.perf_counter()
+    value = fn()
+    stage["times"].append(time.perf_counter() - start)
+    stage["rows"] = rows_of(value)
+    return value
+
+
+def run_pipeline(data: bytes, results: dict):
+    with run_stage(results, "open_workbook", lambda: WorkbookHandle(data), lambda _: 0) as workbook:
+        program = run_stage(results, "parse_program", lambda: parse_excel_sheet.fn(workbook, "Program"), len)
+        program = run_stage(results, "clean_program", lambda: clean_dataframe.fn(program, "Program"), len)
+
+        sheet = workbook.read_sheet("IFR", header=None)
+        sheet.columns = range(sheet.shape[1])
+        layout, _ = detect_ifr_layout(sheet, METRICS_MAP)
+        raw_ifr = layout.data_rows(sheet)
+        labels, mos_flags = raw_ifr[layout.label_column], raw_ifr[layout.mos_column]
+        run_stage(results, "classify_ifr", lambda: classify_ifr_column(labels, mos_flags), len)
+        ifr = run_stage(results, "transform_ifr", lambda: transform_ifr_excel.fn(workbook), len)
+
+    def load_program():
+        init_products_table(program, "program")
+        copy_dataframe_to_table(program, "program", "bench.xlsx")
+        return program
+
+    def load_ifr():
+        init_ifr_table(ifr)
+        copy_dataframe_to_table_ifr(ifr, "bench.xlsx")
+        return ifr
+
+    run_stage(results, "load_program", load_program, len)
+    run_stage(results, "load_ifr", load_ifr, len)
+
+
+def main():
+    if ARGS.workbook:
+        with open(ARGS.workbook, "rb") as f:
+            data = f.read()
+    else:
+        with tempfile.NamedTemporaryFile(suffix=".xlsx") as tmp:
+            start = time.perf_counter()
+            generated = generate_workbook(tmp.name, ARGS.program_rows, ARGS.ifr_blocks, ARGS.seed)
+            print(f"generated {generated} in {time.perf_counter() - start:.2f}s")
+            data = tmp.read()
+    print(f"workbook size {len(data) / 1024 / 1024:.1f} MB")
+
+    seed_master_data(ARGS.schema)
+    results = {}
+    try:
+        with disable_run_logger():
+            for _ in range(ARGS.repeat):
+                run_pipeline(data, results)
+            tracemalloc.start()
+            try:
+                run_pipeline(data, results)
+            finally:
+                tracemalloc.stop()
+    finally:
+        if not ARGS.keep_schema:
+            drop_schema(ARGS.schema)
+
+    print(f"{'stage':<15} {'median_s':>9} {'rows':>9} {'rows/s':>11} {'peak_mb':>8}")
+    for name, stage in results.items():
+        median = statistics.median(stage["times"])
+        rate = f"{stage['rows'] / median:,.0f}" if stage["rows"] else "-"
+        print(f"{name:<15} {median:>9.3f} {stage['rows']:>9} {rate:>11} {stage['peak'] / 1024 / 1024:>8.1f}")
+    print(f"{'total':<15} {sum(statistics.median(s['times']) for s in results.values()):>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Compara el parseo actual (dos pd.read_excel sobre los mismos bytes) con un
+WorkbookHandle que abre el libro una sola vez y entrega ambas hojas.
+
+Uso:
+    PYTHONPATH=. python benchmarks/bench_workbook.py ruta/al/libro.xlsx --repeat 5
+"""
+import argparse
+import statistics
+import time
+from io import BytesIO
+import pandas as pd
+
+from prefect_flows.utils.workbook import WorkbookHandle
+
+
+def double_parse(data: bytes):
+    """Camino original: cada rama vuelve a abrir y descomprimir el libro."""
+    program = pd.read_excel(BytesIO(data), sheet_name="Program", header=0, engine="openpyxl")
+    ifr = pd.read_excel(BytesIO(data), sheet_name="IFR", header=None, engine="openpyxl", usecols="C:AE")
+    return program, ifr
+
+
+def shared_handle(data: bytes):
+    """Camino nuevo: un solo manejador para las dos hojas."""
+    with WorkbookHandle(data) as workbook:
+        program = workbook.read_sheet("Program", header=0)
+        ifr = workbook.read_sheet("IFR", header=None, usecols="C:AE")
+    return program, ifr
+
+
+def measure(fn, data: bytes, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(data)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="Libro .xlsx con hojas 'Program' e 'IFR'")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with open(args.path, "rb") as f:
+        data = f.read()
+
+    # Ambos caminos deben producir exactamente los mismos DataFrames
+    for expected, actual in zip(double_parse(data), shared_handle(data)):
+        pd.testing.assert_frame_equal(expected, actual)
+
+    results = {
+        "double_parse": measure(double_parse, data, args.repeat),
+        "shared_handle": measure(shared_handle, data, args.repeat),
+    }
+    for name, timings in results.items():
+        print(f"{name:<15} median={statistics.median(timings):.3f}s min={min(timings):.3f}s")
+
+    speedup = statistics.median(results["double_parse"]) / statistics.median(results["shared_handle"])
+    print(f"speedup x{speedup:.2f}")
+
+
+if __name__ == "__main__":
+    main()
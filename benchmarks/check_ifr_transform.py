@@ -0,0 +1,306 @@
+"""
+Verifica que transform_ifr_excel (vectorizada) entregue el mismo DataFrame que la implementación
+original con itertuples, sobre libros sintéticos con la plantilla de 24 períodos (columnas C:AE).
+
+Además de los libros del generador, incluye uno con los casos borde: MOS como texto y con
+decimales a redondear, claves duplicadas (el mismo header repetido), la fila saltada de
+IFR_SKIPPED_ROWS y headers cuyo destino, producto o envase no existe en los maestros.
+Termina con código 1 si algún libro difiere.
+
+Los maestros salen del catálogo del generador: no usa base de datos, MinIO ni el servidor de Prefect.
+
+Uso:
+    PYTHONPATH=. python benchmarks/check_ifr_transform.py --ifr-blocks 500 --seeds 3
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import openpyxl
+import pandas as pd
+from prefect.logging import disable_run_logger
+
+import prefect_flows.tasks.transform as transform
+from benchmarks.workbook_generator import DESTINATIONS, PACKAGING, PERIODS, PRODUCTS, generate_workbook
+from config import settings
+from prefect_flows.utils.workbook import WorkbookHandle
+
+
+def master_data_maps() -> dict:
+    """Mapas de búsqueda con el mismo formato que get_master_data, a partir del catálogo del generador."""
+    return {
+        "products": {name.strip().lower(): i for i, name in enumerate(PRODUCTS)},
+        "packaging": {code.strip().lower(): i for i, (_, code) in enumerate(PACKAGING)},
+        "destinations": {
+            name.strip().lower(): {"id": i, "country": country} for i, (name, country) in enumerate(DESTINATIONS)
+        },
+    }
+
+
+def baseline_classify_row(val_a, val_f):
+    """Copia literal de la classify_row original (cascada de splits, metrics_map por llamada)."""
+    # Limpieza segura de inputs (evita errores con NaN)
+    is_a_nan = pd.isna(val_a)
+    texto = str(val_a).strip() if not is_a_nan else ""
+
+    is_f_nan = pd.isna(val_f)
+    texto_col_f = str(val_f).strip().lower() if not is_f_nan else ""
+
+    # --- 1. VALIDACIÓN DE MÉTRICAS (Literales Exactos) ---
+    # Mapeamos el texto del Excel al nombre de columna en la BD
+    metrics_map = {
+        'Arrivals + Sailed': 'arrivals_sailed',
+        'Planned (w/booking)': 'planned_wbooking',
+        'To be booked': 'to_be_booked',
+        'Sales': 'sales',
+        'Adjustments': 'adjustments',
+        'Final Inv.': 'final_inv'
+    }
+
+    if texto in metrics_map:
+        return 'metric', metrics_map[texto]
+
+    # --- 2. VALIDACIÓN MOS (Tu lógica ajustada) ---
+    # Si texto (Col C) es NaN y Col F es 'mos'
+    if is_a_nan:
+        if texto_col_f == 'mos':
+            return 'metric', 'mos'
+        return None, None # Es NaN pero no es MOS
+
+    # --- 3. VALIDACIÓN DE HEADER (Tus 3 Reglas de Split) ---
+
+    # REGLA 1: Separar por "-" debe dar longitud 1 o 2
+    partes_guion = texto.split(' - ')
+    if len(partes_guion) not in [1, 2]:
+        return None, None
+
+    # REGLA 2: Primer elemento split por espacios -> longitud 3
+    # Ejemplo: "1.1.1.1 Wil (CRY/CL"
+    primer_elemento = partes_guion[0].strip()
+    partes_espacio = primer_elemento.split()
+
+    if len(partes_espacio) != 3:
+        return None, None
+
+    # REGLA 3: Tercer elemento split por "/" -> longitud 2
+    # Ejemplo: "(CRY/CL"
+    tercer_elemento = partes_espacio[2]
+    partes_slash = tercer_elemento.split('/')
+
+    if len(partes_slash) != 2:
+        return None, None
+
+    # --- SI PASA LAS REGLAS, EXTRAEMOS LA DATA ---
+    try:
+        # Usamos las mismas partes que ya validamos
+        # partes_espacio = ['1.1.1.1', 'Wil', '(CRY/CL']
+        codigo = partes_espacio[0]
+        filial = partes_espacio[1]
+
+        # partes_slash = ['(CRY', 'CL']
+        producto = partes_slash[0].replace('(', '')
+
+        # Reconstrucción del envase
+        envase_inicio = partes_slash[1] # "CL"
+        envase_fin = partes_guion[1] if len(partes_guion) == 2 else "" # "50L)"
+
+        raw_envase = f"{envase_inicio} {envase_fin}" if envase_fin else envase_inicio
+        envase = raw_envase.replace(')', '').strip('-')
+
+        return 'header', {
+            "filial": filial,
+            "producto": producto,
+            "envase": envase
+        }
+    except Exception:
+        return None, None
+
+
+def baseline_transform_ifr(path: str, maps: dict) -> pd.DataFrame:
+    """
+    Implementación original de transform_ifr_excel (itertuples + pivot_table + baseline_classify_row),
+    sin logs.
+    Única diferencia: un destino desconocido deja el país en None (la original fallaba con
+    KeyError('pais')); pivot_table descarta esas filas, igual que la versión vectorizada.
+    """
+    df = pd.read_excel(path, sheet_name="IFR", header=None, engine="openpyxl", usecols="C:AE")
+    df = df.dropna(how='all').reset_index(drop=True)
+    column_map = {col_idx: periodo for col_idx, periodo in enumerate(PERIODS, start=5)}
+
+    processed_rows = []
+    current_ids = None
+    for row in df.itertuples(index=True):
+        val_c = row[1]
+        try:
+            val_f = row[4]
+        except IndexError:
+            val_f = None
+
+        if val_c in settings.IFR_SKIPPED_ROWS:
+            continue
+        row_type, data = baseline_classify_row(val_c, val_f)
+
+        if row_type == 'header':
+            txt_dest = str(data['filial']).strip().lower()
+            txt_prod = str(data['producto']).strip().lower()
+            txt_pack = str(data['envase']).strip().lower()
+            if not txt_prod.endswith('.00'):
+                if len(txt_prod.split()) == 1:
+                    txt_prod = txt_prod + '.00'
+
+            dest_info = maps["destinations"].get(txt_dest)
+            current_ids = {
+                "id_destination": dest_info['id'] if dest_info else None,
+                "country": dest_info['country'] if dest_info else None,
+                "id_product": maps["products"].get(txt_prod),
+                "id_packaging": maps["packaging"].get(txt_pack),
+            }
+            continue
+
+        elif row_type == 'metric':
+            if current_ids is None:
+                continue
+            metric_key = data
+            is_mos = (metric_key == 'mos')
+
+            for col_idx, periodo in column_map.items():
+                try:
+                    raw_val = row[col_idx + 1]
+                except IndexError:
+                    raw_val = 0
+
+                val = None
+                if is_mos:
+                    if pd.notnull(raw_val):
+                        try:
+                            val = str(round(float(raw_val), 2))
+                        except (TypeError, ValueError):
+                            val = str(raw_val)[:16]
+                else:
+                    try:
+                        val = float(raw_val) if pd.notnull(raw_val) else 0.0
+                    except (TypeError, ValueError):
+                        val = 0.0
+
+                processed_rows.append({
+                    "id_destination": current_ids["id_destination"],
+                    "country": current_ids["country"],
+                    "id_product": current_ids["id_product"],
+                    "id_packaging": current_ids["id_packaging"],
+                    "periodo": periodo,
+                    "periodoequivalente": col_idx - 4,
+                    "metric_type": metric_key,
+                    "value": val,
+                })
+
+    if not processed_rows:
+        return pd.DataFrame()
+
+    df_pivoted = pd.DataFrame(processed_rows).pivot_table(
+        index=["id_destination", "country", "id_product", "id_packaging", "periodo", "periodoequivalente"],
+        columns="metric_type",
+        values="value",
+        aggfunc='first'
+    ).reset_index()
+    df_pivoted.columns.name = None
+
+    for c in ["arrivals_sailed", "planned_wbooking", "to_be_booked", "sales", "adjustments", "final_inv", "mos"]:
+        if c not in df_pivoted.columns:
+            df_pivoted[c] = None
+    for col in ["id_destination", "id_product", "id_packaging"]:
+        df_pivoted[col] = df_pivoted[col].astype("Int64")
+
+    return df_pivoted.rename(columns={
+        "id_destination": "filial",
+        "id_product": "producto",
+        "id_packaging": "envase",
+        "country": "pais"
+    })
+
+
+def edge_cases_workbook(path: str, seed: int):
+    """
+    Libro del generador con bloques de casos borde insertados bajo la fila de períodos
+    (antes de los bloques generados, así sus claves son las primeras en aparecer).
+    """
+    generate_workbook(path, 10, 40, seed)
+    n = len(PERIODS)
+    rows = []
+
+    def block(header: str, mos_values: list):
+        rows.append([None, None, header])
+        for i, label in enumerate(transform.METRICS_MAP):
+            rows.append([None, None, label, None, None, None, None] + [i * 10.5 + p for p in range(n)])
+        rows.append([None, None, None, None, None, "MOS", None] + mos_values)
+
+    # MOS como texto (largo, se corta a 16), con decimales a redondear y vacíos
+    block("9.1.1.1 Wil (CRY9000.00/CL - 50L)", ["sin stock disponible en puerto"] * 4 + [1.005, 2.675, 3.14159, None] * ((n - 4) // 4))
+    # Clave duplicada: el mismo header otra vez, con otros valores (gana el primero)
+    block("9.1.1.1 Wil (CRY9000.00/CL - 50L)", [0.5] * n)
+    # Maestros inexistentes: destino, producto y envase
+    block("9.2.1.1 Nowhere (CRY9000.00/CL - 50L)", [1.0] * n)
+    block("9.2.2.1 Wil (NOPE.00/CL - 50L)", [1.0] * n)
+    block("9.2.3.1 Wil (CRY9000.00/Caja)", [1.0] * n)
+    # Fila saltada en medio de la hoja y un título que no es header
+    rows.append([None, None, settings.IFR_SKIPPED_ROWS[0]])
+    rows.append([None, None, "Resumen - por - filial"])
+
+    workbook = openpyxl.load_workbook(path)
+    sheet = workbook["IFR"]
+    sheet.insert_rows(2, len(rows))
+    for r, values in enumerate(rows, start=2):
+        for c, value in enumerate(values, start=1):
+            if value is not None:
+                sheet.cell(r, c, value)
+    workbook.save(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ifr-blocks", type=int, default=300)
+    parser.add_argument("--seeds", type=int, default=3, help="Cantidad de libros sintéticos (uno por semilla)")
+    args = parser.parse_args()
+
+    maps = master_data_maps()
+    transform.get_master_data = lambda: maps
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp, disable_run_logger():
+        workbooks = []
+        for seed in range(args.seeds):
+            path = os.path.join(tmp, f"synthetic_{seed}.xlsx")
+            generate_workbook(path, 10, args.ifr_blocks, seed)
+            workbooks.append(path)
+        path = os.path.join(tmp, "edge_cases.xlsx")
+        edge_cases_workbook(path, args.seeds)
+        workbooks.append(path)
+
+        keys = ["filial", "pais", "producto", "envase", "periodo", "periodoequivalente"]
+        for path in workbooks:
+            start = time.perf_counter()
+            expected = baseline_transform_ifr(path, maps)
+            baseline_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            with WorkbookHandle(open(path, "rb").read()) as workbook:
+                result = transform.transform_ifr_excel.fn(workbook)
+            vectorized_time = time.perf_counter() - start
+
+            expected = expected.sort_values(keys).reset_index(drop=True)
+            result = result.sort_values(keys).reset_index(drop=True)[list(expected.columns)]
+            try:
+                pd.testing.assert_frame_equal(result, expected, check_exact=True)
+                status = "ok"
+            except AssertionError as e:
+                failures += 1
+                status = f"MISMATCH: {e}"
+            print(f"{os.path.basename(path):<20} rows {len(expected):>7}  itertuples {baseline_time:.2f}s  "
+                  f"vectorized {vectorized_time:.2f}s  {status}")
+
+    print("all workbooks identical" if not failures else f"{failures} mismatches")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
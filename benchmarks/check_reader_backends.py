@@ -0,0 +1,103 @@
+"""
+Verifica que todos los backends de lectura de Excel (READER_BACKENDS) entreguen DataFrames
+idénticos sobre libros sintéticos, y reporta el tiempo de lectura de cada uno.
+
+Para cada libro se comparan, contra openpyxl, las mismas lecturas que hace el ETL:
+la hoja Program (parse_excel_sheet), la hoja IFR completa (header=None) y sus filas con las
+columnas del layout. Incluye una variante con fechas en el header de períodos y
+filas/columnas desplazadas. Termina con código 1 si algún backend difiere.
+
+No usa base de datos, MinIO ni el servidor de Prefect.
+
+Uso:
+    PYTHONPATH=. python benchmarks/check_reader_backends.py --program-rows 20000 --ifr-blocks 500
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+import openpyxl
+import pandas as pd
+from prefect.logging import disable_run_logger
+
+import benchmarks.workbook_generator as generator
+from prefect_flows.tasks.transform import METRICS_MAP, parse_excel_sheet
+from prefect_flows.utils.ifr_layout import detect_ifr_layout
+from prefect_flows.utils.workbook import FALLBACK_BACKEND, READER_BACKENDS, WorkbookHandle
+
+
+def shifted_dates_workbook(path: str, seed: int):
+    """Libro con un horizonte de 30 meses en fechas, dos filas de título arriba y una columna extra a la izquierda."""
+    periods = generator.PERIODS
+    generator.PERIODS = [datetime(2026 + m // 12, m % 12 + 1, 1) for m in range(30)]
+    try:
+        generator.generate_workbook(path, 500, 50, seed)
+    finally:
+        generator.PERIODS = periods
+    workbook = openpyxl.load_workbook(path)
+    sheet = workbook["IFR"]
+    sheet.insert_rows(1, 2)
+    sheet["A1"] = "Inventory Forecast Report"
+    sheet.insert_cols(2)
+    workbook.save(path)
+
+
+def read_all(path: str, engine: str) -> dict[str, pd.DataFrame]:
+    """Lecturas del ETL con el backend indicado."""
+    with open(path, "rb") as f, WorkbookHandle(f, engine=engine) as workbook:
+        if workbook.engine != engine:
+            raise RuntimeError(f"backend {engine!r} not available (using {workbook.engine!r})")
+        sheet = workbook.read_sheet("IFR", header=None)
+        sheet.columns = range(sheet.shape[1])
+        layout, _ = detect_ifr_layout(sheet, METRICS_MAP)
+        return {
+            "Program": parse_excel_sheet.fn(workbook, "Program"),
+            "IFR": sheet,
+            "IFR layout rows": layout.data_rows(sheet),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--program-rows", type=int, default=10_000)
+    parser.add_argument("--ifr-blocks", type=int, default=300)
+    parser.add_argument("--seeds", type=int, default=3, help="Cantidad de libros sintéticos (uno por semilla)")
+    args = parser.parse_args()
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp, disable_run_logger():
+        workbooks = []
+        for seed in range(args.seeds):
+            path = os.path.join(tmp, f"synthetic_{seed}.xlsx")
+            generator.generate_workbook(path, args.program_rows, args.ifr_blocks, seed)
+            workbooks.append(path)
+        path = os.path.join(tmp, "shifted_dates.xlsx")
+        shifted_dates_workbook(path, args.seeds)
+        workbooks.append(path)
+
+        for path in workbooks:
+            frames, timings = {}, {}
+            for engine in READER_BACKENDS:
+                start = time.perf_counter()
+                frames[engine] = read_all(path, engine)
+                timings[engine] = time.perf_counter() - start
+
+            reference = frames[FALLBACK_BACKEND]
+            for engine in READER_BACKENDS:
+                for name, expected in reference.items():
+                    try:
+                        pd.testing.assert_frame_equal(frames[engine][name], expected, check_exact=True)
+                    except AssertionError as e:
+                        failures += 1
+                        print(f"MISMATCH {os.path.basename(path)} {name} ({engine} vs {FALLBACK_BACKEND}): {e}")
+            times = "  ".join(f"{engine} {seconds:.2f}s" for engine, seconds in timings.items())
+            print(f"{os.path.basename(path):<20} {times}")
+
+    print("all backends identical" if not failures else f"{failures} mismatches")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Genera libros Excel sintéticos con hojas "Program" e "IFR" del tamaño indicado,
+con el mismo formato que espera el ETL.
+
+IFR: fila de períodos y, por cada combinación filial/producto/envase, un header en la
+columna C ("1.1.1.1 Wil (CRY9000.00/CL - 50L)") seguido de las filas de métricas
+(literales de METRICS_MAP en C) y la fila MOS ("MOS" en F), con 24 períodos en H:AE.
+
+Uso:
+    PYTHONPATH=. python benchmarks/workbook_generator.py salida.xlsx --program-rows 20000 --ifr-blocks 500
+"""
+import argparse
+import random
+from datetime import date, timedelta
+import openpyxl
+
+from config.settings import IFR_SKIPPED_ROWS
+from prefect_flows.tasks.transform import METRICS_MAP
+
+# Catálogo de maestros usado en los headers; bench_pipeline lo carga en las tablas maestras
+DESTINATIONS = [
+    ("Wil", "USA"), ("Houston", "USA"), ("Shanghai", "CHN"), ("Antwerp", "BEL"),
+    ("Santos", "BRA"), ("Rotterdam", "NLD"), ("Durban", "ZAF"), ("Manzanillo", "MEX"),
+]
+PRODUCTS = ["CRY9000.00", "MIC9000.00", "NOP.00", "SOP.00", "KNO3.00", "UP.00", "SPN.00", "QROP.00"]
+# (texto en el header, código en la tabla packaging)
+PACKAGING = [("CL - 50L)", "cl 50l"), ("BB-1000)", "bb-1000"), ("Bulk)", "bulk"), ("BB - 1250)", "bb 1250")]
+
+PERIODS = [f"{month:02d}-{year}" for year in (2025, 2026) for month in range(1, 13)]
+PROGRAM_COLUMNS = [
+    "Año", "Mes", "Filial", "País Destino", "Product", "Envase", "Cliente", "Nave",
+    "Puerto Embarque", "Fecha ETA", "MT", "Bags", "KG", "Precio USD", "Estado",
+]
+
+
+def _program_row(rng: random.Random) -> list:
+    destination, country = rng.choice(DESTINATIONS)
+    mt = round(rng.uniform(1, 500), 3)
+    return [
+        rng.choice([2025, 2026]),
+        rng.randint(1, 12),
+        destination,
+        country,
+        rng.choice(PRODUCTS),
+        rng.choice(PACKAGING)[1].upper(),
+        f"Cliente {rng.randint(1, 400)}",
+        f"Nave {rng.randint(1, 60)}",
+        rng.choice(["Tocopilla", "Antofagasta", "Mejillones"]),
+        date(2025, 1, 1) + timedelta(days=rng.randint(0, 729)),
+        mt,
+        int(mt * 1000 / rng.choice([25, 50, 1000])),
+        mt * 1000,
+        round(rng.uniform(300, 900), 2),
+        rng.choice(["Confirmado", "Planificado", None]),
+    ]
+
+
+def _metric_value(rng: random.Random):
+    # Mayoría numérica, con vacíos y algún texto como en los libros reales
+    roll = rng.random()
+    if roll < 0.15:
+        return None
+    if roll < 0.17:
+        return "n/a"
+    return round(rng.uniform(0, 2000), 2)
+
+
+def generate_workbook(path: str, program_rows: int = 10_000, ifr_blocks: int = 300, seed: int = 0) -> dict:
+    """
+    Escribe el libro en `path` y retorna el número de filas generadas por hoja.
+    `ifr_blocks` es la cantidad de headers filial/producto/envase (cada uno con 7 filas de métricas).
+    """
+    rng = random.Random(seed)
+    workbook = openpyxl.Workbook(write_only=True)
+
+    program = workbook.create_sheet("Program")
+    program.append(PROGRAM_COLUMNS)
+    for _ in range(program_rows):
+        program.append(_program_row(rng))
+
+    ifr = workbook.create_sheet("IFR")
+    ifr_rows = 0
+    # Fila de títulos: columna C y los períodos en H:AE
+    ifr.append([None, None, "IFR", None, None, "Metric", None] + PERIODS)
+    for block in range(ifr_blocks):
+        destination, _ = rng.choice(DESTINATIONS)
+        product = rng.choice(PRODUCTS)
+        # Algunos headers omiten el ".00" del producto (la transformación lo agrega)
+        if rng.random() < 0.3:
+            product = product.removesuffix(".00")
+        packaging, _ = rng.choice(PACKAGING)
+        code = f"1.{block // 100 + 1}.{block % 100 + 1}.1"
+
+        if block % 25 == 0:
+            # Títulos de sección que no son headers válidos
+            ifr.append([None, None, f"{block // 25 + 1} {destination} Total"])
+            ifr_rows += 1
+        ifr.append([None, None, f"{code} {destination} ({product}/{packaging}"])
+        for label in METRICS_MAP:
+            ifr.append([None, None, label, None, None, None, None] + [_metric_value(rng) for _ in PERIODS])
+        ifr.append([None, None, None, None, None, "MOS", None] + [round(rng.uniform(0, 6), 3) for _ in PERIODS])
+        ifr_rows += 2 + len(METRICS_MAP)
+    ifr.append([None, None, IFR_SKIPPED_ROWS[0]])
+    ifr_rows += 1
+
+    workbook.save(path)
+    return {"Program": program_rows, "IFR": ifr_rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="Ruta del .xlsx a generar")
+    parser.add_argument("--program-rows", type=int, default=10_000)
+    parser.add_argument("--ifr-blocks", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rows = generate_workbook(args.path, args.program_rows, args.ifr_blocks, args.seed)
+    print(f"{args.path}: {rows}")
+
+
+if __name__ == "__main__":
+    main()
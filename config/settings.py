@@ -20,5 +20,66 @@ DATABASE_CONN_STR = (
     f"host={DATABASE_HOST} port={DATABASE_PORT} "
     f"dbname={DATABASE_NAME} user={DATABASE_USER} password={DATABASE_PASSWORD} options='-c search_path={DATABASE_SCHEMA}'"
 )
+# Connection Pool Variables
+DATABASE_POOL_MIN_SIZE = int(os.getenv("DATABASE_POOL_MIN_SIZE", "1"))
+DATABASE_POOL_MAX_SIZE = int(os.getenv("DATABASE_POOL_MAX_SIZE", "10"))
+DATABASE_POOL_TIMEOUT = float(os.getenv("DATABASE_POOL_TIMEOUT", "30"))
+DATABASE_POOL_MAX_IDLE = float(os.getenv("DATABASE_POOL_MAX_IDLE", "300"))
+DATABASE_POOL_MAX_LIFETIME = float(os.getenv("DATABASE_POOL_MAX_LIFETIME", "3600"))
+# ETL Variables
+# Número máximo de archivos procesados en paralelo por etl_flow (1 = serial)
+ETL_MAX_CONCURRENCY = int(os.getenv("ETL_MAX_CONCURRENCY", "1"))
+# Tipo de task runner para el modo paralelo: "process" o "thread"
+ETL_TASK_RUNNER = os.getenv("ETL_TASK_RUNNER", "process")
+# Duración (segundos) del lease con que un worker reclama un archivo; vencido, otro worker puede reclamarlo
+STATE_LEASE_SECONDS = float(os.getenv("STATE_LEASE_SECONDS", "900"))
+# Intervalo (segundos) con que el worker renueva el lease mientras procesa el archivo (por defecto, un tercio del lease)
+STATE_LEASE_RENEW_SECONDS = float(os.getenv("STATE_LEASE_RENEW_SECONDS", str(STATE_LEASE_SECONDS / 3)))
+# Backend de lectura de Excel: "calamine" (rápido, requiere python-calamine) u "openpyxl" (respaldo)
+EXCEL_READER_BACKEND = os.getenv("EXCEL_READER_BACKEND", "calamine")
+# Tamaño máximo (bytes) que un archivo extraído se mantiene en memoria antes de pasar a disco
+EXTRACT_SPOOL_MAX_SIZE = int(os.getenv("EXTRACT_SPOOL_MAX_SIZE", str(32 * 1024 * 1024)))
+# Tamaño de cada chunk leído desde MinIO
+EXTRACT_CHUNK_SIZE = int(os.getenv("EXTRACT_CHUNK_SIZE", str(1024 * 1024)))
+# Verificar el MD5 contra el etag (desactivar si el bucket usa cifrado del lado del servidor)
+EXTRACT_VERIFY_CHECKSUM = os.getenv("EXTRACT_VERIFY_CHECKSUM", "true").lower() == "true"
+# Formato del COPY de carga: "binary" (sin CSV intermedio) o "csv"
+COPY_FORMAT = os.getenv("COPY_FORMAT", "binary")
+# Caché de staging de DataFrames preparados (Parquet) para reintentos: directorio local o "minio://<bucket>/<prefijo>" (vacío = desactivada)
+STAGING_CACHE_LOCATION = os.getenv("STAGING_CACHE_LOCATION", "staging_cache")
+# Tamaño máximo total (bytes) y antigüedad máxima (horas) de la caché de staging antes de eliminar las entradas más antiguas
+STAGING_CACHE_MAX_BYTES = int(os.getenv("STAGING_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+STAGING_CACHE_MAX_AGE_HOURS = float(os.getenv("STAGING_CACHE_MAX_AGE_HOURS", "72"))
+# Número de versiones (particiones) que se conservan por archivo en cada tabla program/ifr (0 = todas)
+PARTITION_RETENTION_VERSIONS = int(os.getenv("PARTITION_RETENTION_VERSIONS", "30"))
+# Carga de IFR: "full" (nueva versión completa) o "incremental" (MERGE de diferencias contra la versión previa del archivo)
+IFR_LOAD_MODE = os.getenv("IFR_LOAD_MODE", "full")
+# Metrics Variables
+# Se advierte si el tiempo total de un archivo supera este factor sobre la mediana de los archivos recientes (0 = desactivado)
+METRICS_REGRESSION_FACTOR = float(os.getenv("METRICS_REGRESSION_FACTOR", "2.0"))
+# Profiling Variables
+# Perfilado opcional de tareas y flujos: "cprofile", "tracemalloc", "both" o vacío (desactivado); etl_flow acepta también el parámetro `profile`
+PROFILE_MODE = os.getenv("PROFILE_MODE", "")
+# Nombres de las funciones de tareas/flujos a perfilar, separados por coma ("*" = todas)
+PROFILE_TARGETS = os.getenv("PROFILE_TARGETS", "*")
+# Destino de los perfiles: directorio local o "minio://<bucket>/<prefijo>" (usar un bucket distinto al del ETL)
+PROFILE_OUTPUT = os.getenv("PROFILE_OUTPUT", "profiles")
+# Cantidad de funciones y sitios de asignación incluidos en el reporte
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", "25"))
+# Frames guardados por asignación en tracemalloc
+PROFILE_TRACEMALLOC_FRAMES = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", "1"))
+# IFR Variables
+# Filas iniciales de la hoja IFR que se escanean para detectar el header de períodos y las columnas de etiquetas/MOS
+IFR_LAYOUT_SCAN_ROWS = int(os.getenv("IFR_LAYOUT_SCAN_ROWS", "50"))
+# Textos de la columna de etiquetas de IFR cuyas filas se descartan, separados por ";"
+IFR_SKIPPED_ROWS = [row.strip() for row in os.getenv("IFR_SKIPPED_ROWS", "3.4.1 Shanghai (MIC9000.00/CL-500)").split(";") if row.strip()]
+# Storage Events Variables
+# Origen de las notificaciones para event_watcher: "minio" (notificaciones del bucket) o "file" (eventos JSON en STORAGE_EVENTS_FILE)
+STORAGE_EVENTS_SOURCE = os.getenv("STORAGE_EVENTS_SOURCE", "minio")
+STORAGE_EVENTS_FILE = os.getenv("STORAGE_EVENTS_FILE", "storage_events.jsonl")
+# Espera (segundos) antes de reconectar cuando se corta la escucha de eventos
+STORAGE_EVENTS_RECONNECT_DELAY = float(os.getenv("STORAGE_EVENTS_RECONNECT_DELAY", "5"))
+# Master Data Cache Variables
+MASTER_DATA_CACHE_TTL = float(os.getenv("MASTER_DATA_CACHE_TTL", "300"))
 
 COLUMNS_SUMMARIE = ["mt", "bags", "kg"]
@@ -0,0 +1,179 @@
+import io
+import csv
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+from psycopg import sql
+from config import settings
+
+# Filas por bloque al generar las filas del COPY binario (acota la memoria usada en la conversión)
+BINARY_CHUNK_ROWS = 50_000
+
+# Categoría de conversión según el tipo de la columna destino (typname de pg_type)
+PG_TYPE_KINDS = {
+    "int2": "int", "int4": "int", "int8": "int",
+    "float4": "float", "float8": "float",
+    "numeric": "numeric",
+    "bool": "bool",
+    "text": "text", "varchar": "text", "bpchar": "text",
+    "timestamp": "timestamp", "timestamptz": "timestamp",
+    "date": "date",
+}
+
+
+def get_table_column_types(cur, table_name: str, columns: list[str]) -> list[tuple[int, str]]:
+    """
+    Retorna (oid, typname) de las columnas indicadas de la tabla destino, en el mismo orden.
+    """
+    cur.execute(
+        """
+        SELECT a.attname, t.oid, t.typname
+        FROM pg_attribute a
+        JOIN pg_type t ON t.oid = a.atttypid
+        WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped
+        """,
+        (table_name,)
+    )
+    types = {name: (oid, typname) for name, oid, typname in cur.fetchall()}
+    missing = [c for c in columns if c not in types]
+    if missing:
+        raise ValueError(f"Columns {missing} do not exist in table {table_name!r}")
+    return [types[c] for c in columns]
+
+
+def _to_int(value):
+    # Igual que el COPY en texto: un float con decimales no es un entero válido
+    as_int = int(value)
+    if as_int != value:
+        raise ValueError(f"Invalid integer value: {value!r}")
+    return as_int
+
+
+def _to_timestamp(value):
+    return pd.Timestamp(value).to_pydatetime()
+
+
+def _to_date(value):
+    return pd.Timestamp(value).date()
+
+
+CONVERTERS = {
+    "int": _to_int,
+    "float": float,
+    "numeric": lambda v: Decimal(str(v)),
+    "bool": bool,
+    "text": str,
+    "timestamp": _to_timestamp,
+    "date": _to_date,
+}
+
+
+def _column_values(series: pd.Series, kind: str) -> list:
+    """
+    Convierte una columna a una lista de valores Python aptos para el tipo destino (None para nulos).
+    Las columnas que ya tienen un dtype compatible (numéricas, fechas, texto) se convierten sin recorrerlas en Python.
+    """
+    mask = series.isna().to_numpy()
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype(series.cat.categories.dtype)
+    if kind == "float" and pd.api.types.is_float_dtype(series.dtype):
+        return np.where(mask, None, series.to_numpy(dtype=float, na_value=np.nan)).tolist()
+    if kind == "int" and pd.api.types.is_integer_dtype(series.dtype):
+        values = series.to_numpy(dtype=object, na_value=None) if mask.any() else series.to_numpy()
+        return values.tolist()
+    if kind == "timestamp" and pd.api.types.is_datetime64_dtype(series.dtype):
+        return np.where(mask, None, np.asarray(series.dt.to_pydatetime(), dtype=object)).tolist()
+    if kind == "text" and isinstance(series.dtype, pd.StringDtype):
+        return series.to_numpy(dtype=object, na_value=None).tolist()
+
+    convert = CONVERTERS[kind]
+    values = series.to_numpy(dtype=object)
+    return [None if is_null else convert(v) for v, is_null in zip(values, mask)]
+
+
+def supports_binary_copy(column_types: list[tuple[int, str]]) -> bool:
+    """
+    Indica si todas las columnas destino tienen un tipo soportado por el COPY binario.
+    """
+    return all(typname in PG_TYPE_KINDS for _, typname in column_types)
+
+
+def copy_dataframe_binary(cur, df: pd.DataFrame, table_name: str, column_types: list[tuple[int, str]] | None = None):
+    """
+    Inserta un DataFrame con COPY en formato binario.
+    Los tipos se toman de la tabla destino y las filas se generan por bloques,
+    sin CSV intermedio ni copias completas del DataFrame.
+    """
+    columns = [str(c) for c in df.columns]
+    if column_types is None:
+        column_types = get_table_column_types(cur, table_name, columns)
+    if not supports_binary_copy(column_types):
+        raise TypeError(f"Binary COPY does not support column types {[t for _, t in column_types]}")
+    kinds = [PG_TYPE_KINDS[typname] for _, typname in column_types]
+
+    copy_sql = sql.SQL("""
+        COPY {} ({})
+        FROM STDIN
+        WITH (FORMAT BINARY)
+    """).format(
+        sql.Identifier(table_name),
+        sql.SQL(", ").join(sql.Identifier(c) for c in columns)
+    )
+
+    with cur.copy(copy_sql) as copy:
+        copy.set_types([oid for oid, _ in column_types])
+        for start in range(0, len(df), BINARY_CHUNK_ROWS):
+            chunk = df.iloc[start:start + BINARY_CHUNK_ROWS]
+            values = [_column_values(chunk.iloc[:, i], kind) for i, kind in enumerate(kinds)]
+            for row in zip(*values):
+                copy.write_row(row)
+
+
+def copy_dataframe_csv(cur, df: pd.DataFrame, table_name: str):
+    """
+    Inserta un DataFrame con COPY en formato CSV a través de un buffer en memoria.
+    """
+    df = df.copy()
+    df = df.where(pd.notnull(df), None)  # reemplaza NaN por NULL
+
+    # Convierte el DataFrame a un CSV temporal en memoria
+    buffer = io.StringIO()
+    df.to_csv(
+        buffer,
+        index=False,
+        header=False,
+        lineterminator="\n",
+        quoting=csv.QUOTE_MINIMAL,
+        escapechar="\\",
+    )
+    buffer.seek(0)
+
+    copy_sql = sql.SQL("""
+        COPY {} ({})
+        FROM STDIN
+        WITH (FORMAT CSV)
+    """).format(
+        sql.Identifier(table_name),
+        sql.SQL(", ").join(sql.Identifier(c) for c in df.columns)
+    )
+
+    # Escribe los datos por chunks para optimizar memoria
+    with cur.copy(copy_sql) as copy:
+        while True:
+            chunk = buffer.read(1024 * 1024)
+            if not chunk:
+                break
+            copy.write(chunk)
+
+
+def copy_dataframe(cur, df: pd.DataFrame, table_name: str):
+    """
+    Inserta un DataFrame con COPY usando el formato configurado en COPY_FORMAT ('binary' o 'csv').
+    Si la tabla tiene tipos no soportados por el camino binario, usa CSV.
+    """
+    if settings.COPY_FORMAT == "binary":
+        column_types = get_table_column_types(cur, table_name, [str(c) for c in df.columns])
+        if supports_binary_copy(column_types):
+            copy_dataframe_binary(cur, df, table_name, column_types)
+            return
+    copy_dataframe_csv(cur, df, table_name)
@@ -1,6 +1,6 @@
-import psycopg
 from psycopg.rows import dict_row
 from config import settings
+from database.db_pool import get_connection
 from psycopg import sql
 import pandas as pd
 
@@ -11,8 +11,8 @@ def get_all_destinations_and_country():
     """
     Retorna una lista de diccionarios con todos los destinations y countries.
     """
-    with psycopg.connect(settings.DATABASE_CONN_STR, row_factory=dict_row) as conn:
-        with conn.cursor() as cur:
+    with get_connection() as conn:
+        with conn.cursor(row_factory=dict_row) as cur:
             cur.execute(
                 sql.SQL("""
                     SELECT id_destination, destination_name, country
@@ -0,0 +1,44 @@
+from config import settings
+from database.db_ifr import merge_staged_ifr
+from database.db_partition import discard_staged_version, drop_expired_versions, publish_version
+from database.db_pool import get_connection
+from database.db_state import mark_file_ready
+
+
+def publish_file_load(file_path: str, staged: list[dict], etag: str | None, lease_owner: str | None = None,
+                      **digests: str) -> list[dict]:
+    """
+    Publica en una sola transacción las versiones preparadas de un archivo (Program e IFR)
+    y lo marca 'ready' con sus digests: o quedan visibles todas sus cargas y el estado, o ninguna.
+    Si el archivo ya no tiene el `etag` procesado o `lease_owner` perdió su lease, mark_file_ready
+    lanza StaleFileStateError y no se publica nada (sin versiones, solo marca el archivo 'ready').
+    Las versiones completas se adjuntan como particiones (publish_version) y las incrementales
+    se aplican con MERGE sobre la versión previa (merge_staged_ifr).
+    Si la transacción falla, se descartan los staging y un reintento no duplica datos.
+    Retorna el resultado de los MERGE aplicados.
+    """
+    merges = []
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                for version in staged:
+                    if version.get("merge_into"):
+                        merges.append(merge_staged_ifr(cur, version))
+                    else:
+                        publish_version(cur, version)
+                mark_file_ready(cur, file_path, etag, lease_owner, **digests)
+            conn.commit()
+    except Exception:
+        discard_staged_versions(staged)
+        raise
+
+    for table_name in {version["table_name"] for version in staged if not version.get("merge_into")}:
+        drop_expired_versions(table_name, file_path, settings.PARTITION_RETENTION_VERSIONS)
+    return merges
+
+
+def discard_staged_versions(staged: list[dict | None]):
+    """Elimina las tablas de staging de versiones que no se van a publicar (ignora los None)."""
+    for version in staged:
+        if version:
+            discard_staged_version(version)
@@ -1,50 +1,145 @@
-import io
-import csv
-import psycopg
-from psycopg.rows import dict_row
 from config import settings
+from database.db_partition import (
+    ensure_partitioned_table, get_cached_table_schema, get_latest_version, invalidate_table_schema,
+    load_version, stage_version, touch_version
+)
+from database.db_pool import get_connection
+from database.db_program import map_dtype_to_postgres
 from psycopg import sql
 import pandas as pd
 
 TABLE_NAME = "ifr"
 SCHEMA_NAME = settings.DATABASE_SCHEMA
+# Clave de negocio de una fila IFR (una combinación filial/producto/envase por período)
+KEY_COLUMNS = ["filial", "producto", "envase", "periodo"]
+# Tipos de las columnas de métricas: la transformación las entrega como object (MOS es texto)
+METRIC_COLUMN_TYPES = {
+    "arrivals_sailed": "DOUBLE PRECISION",
+    "planned_wbooking": "DOUBLE PRECISION",
+    "to_be_booked": "DOUBLE PRECISION",
+    "sales": "DOUBLE PRECISION",
+    "adjustments": "DOUBLE PRECISION",
+    "final_inv": "DOUBLE PRECISION",
+    "mos": "VARCHAR",
+}
 
-def copy_dataframe_to_table_ifr(df: pd.DataFrame):
+
+def init_ifr_table(df: pd.DataFrame) -> list[str]:
+    """
+    Crea la tabla ifr (particionada por id_version) a partir de la estructura del DataFrame;
+    las métricas usan los tipos de METRIC_COLUMN_TYPES y el resto, el de su dtype.
+    Si la tabla ya existe, no la recrea; agrega las columnas nuevas y las retorna (ver ensure_partitioned_table).
+    Una tabla creada con las métricas como TEXT se convierte a esos tipos una sola vez.
+    """
+    columns = {
+        col: METRIC_COLUMN_TYPES.get(col) or map_dtype_to_postgres(dtype)
+        for col, dtype in zip(df.columns, df.dtypes)
+    }
+    added = ensure_partitioned_table(TABLE_NAME, columns)
+    fix_metric_column_types()
+    return added
+
+
+def fix_metric_column_types():
+    """
+    Convierte a METRIC_COLUMN_TYPES las métricas que la tabla ifr tenga como TEXT
+    (tablas creadas a partir de los dtypes). Reescribe todas las particiones, por eso
+    solo se ejecuta cuando el esquema guardado tiene columnas TEXT.
+    """
+    schema = get_cached_table_schema(TABLE_NAME)
+    text_columns = [col for col in METRIC_COLUMN_TYPES if schema.get(col) == "text"]
+    if not text_columns:
+        return
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("ALTER TABLE {} {}").format(
+                sql.Identifier(SCHEMA_NAME, TABLE_NAME),
+                sql.SQL(", ").join(
+                    sql.SQL("ALTER COLUMN {col} TYPE {type} USING {col}::{type}").format(
+                        col=sql.Identifier(col), type=sql.SQL(METRIC_COLUMN_TYPES[col])
+                    )
+                    for col in text_columns
+                )
+            ))
+        conn.commit()
+    invalidate_table_schema(TABLE_NAME)
+
+
+def copy_dataframe_to_table_ifr(df: pd.DataFrame, file_name: str | None = None) -> int:
     """
     Inserta los datos de un DataFrame en una tabla PostgreSQL
     usando la instrucción COPY (método eficiente para cargas masivas).
+    Los datos se cargan como una nueva versión (partición) y se retorna su id_version.
+    """
+    return load_version(df, TABLE_NAME, file_name)
+
+
+def stage_ifr_version(df: pd.DataFrame, file_name: str, lease_owner: str | None = None) -> dict:
+    """
+    Copia el DataFrame a una tabla de staging UNLOGGED (ver stage_version) y retorna la versión preparada.
+    Con IFR_LOAD_MODE=incremental, si el archivo tiene una versión previa y la clave es única en el
+    DataFrame, la versión queda marcada (`merge_into`) para aplicarse como diferencias sobre esa
+    partición al publicarse (merge_staged_ifr); si no, se publica como una versión completa.
+    """
+    staged = stage_version(df, TABLE_NAME, file_name, lease_owner)
+    if settings.IFR_LOAD_MODE == "incremental" and not df.duplicated(KEY_COLUMNS).any():
+        staged["merge_into"] = get_latest_version(TABLE_NAME, file_name)
+    staged["columns"] = list(df.columns)
+    return staged
+
+
+def merge_staged_ifr(cur, staged: dict) -> dict:
+    """
+    Carga incremental: compara la tabla de staging con la versión previa del archivo (`merge_into`)
+    y escribe solo las diferencias en esa partición (inserta, actualiza y elimina por KEY_COLUMNS)
+    con MERGE. Se ejecuta con el cursor de la transacción que publica la carga y elimina el staging.
+    Retorna id_version, filas insertadas/actualizadas y eliminadas.
     """
-    df = df.copy()
-    df = df.where(pd.notnull(df), None)  # reemplaza NaN por NULL
-
-    # Convierte el DataFrame a un CSV temporal en memoria
-    buffer = io.StringIO()
-    df.to_csv(
-        buffer,
-        index=False,
-        header=False,
-        lineterminator="\n",
-        quoting=csv.QUOTE_MINIMAL,
-        escapechar="\\",
+    previous = staged["merge_into"]
+    id_version = previous["id_version"]
+    partition = sql.Identifier(SCHEMA_NAME, previous["partition_name"])
+    staging = sql.Identifier(SCHEMA_NAME, staged["partition_name"])
+    columns = staged["columns"]
+    value_columns = [c for c in columns if c not in KEY_COLUMNS]
+    key_match = sql.SQL(" AND ").join(
+        sql.SQL("t.{0} = s.{0}").format(sql.Identifier(c)) for c in KEY_COLUMNS
     )
-    buffer.seek(0)
 
-    with psycopg.connect(settings.DATABASE_CONN_STR) as conn:
-        with conn.cursor() as cur:
-            copy_sql = sql.SQL("""
-                COPY {} ({})
-                FROM STDIN
-                WITH (FORMAT CSV)
-            """).format(
-                sql.Identifier(TABLE_NAME),
-                sql.SQL(", ").join(sql.Identifier(c) for c in df.columns)
-            )
-
-            # Escribe los datos por chunks para optimizar memoria
-            with cur.copy(copy_sql) as copy:
-                while True:
-                    chunk = buffer.read(1024 * 1024)
-                    if not chunk:
-                        break
-                    copy.write(chunk)
-        conn.commit()
+    def column_list(prefix: str, columns: list[str]) -> sql.Composable:
+        return sql.SQL(", ").join(sql.SQL(prefix + "{}").format(sql.Identifier(c)) for c in columns)
+
+    cur.execute(sql.SQL("ANALYZE {}").format(staging))
+
+    # Inserta claves nuevas y actualiza solo las filas cuyos valores cambiaron
+    cur.execute(sql.SQL("""
+        MERGE INTO {partition} AS t
+        USING {staging} AS s
+        ON {key_match}
+        WHEN MATCHED AND ({t_values}) IS DISTINCT FROM ({s_values}) THEN
+            UPDATE SET ({values}) = ({s_values}), load_timestamp = CURRENT_TIMESTAMP
+        WHEN NOT MATCHED THEN
+            INSERT ({columns}, id_version) VALUES ({s_columns}, {id_version})
+    """).format(
+        partition=partition,
+        staging=staging,
+        key_match=key_match,
+        t_values=column_list("t.", value_columns),
+        s_values=column_list("s.", value_columns),
+        values=column_list("", value_columns),
+        columns=column_list("", columns),
+        s_columns=column_list("s.", columns),
+        id_version=sql.Literal(id_version),
+    ))
+    merged = cur.rowcount
+
+    # Elimina las claves que ya no vienen en el archivo
+    cur.execute(sql.SQL("""
+        DELETE FROM {partition} AS t
+        WHERE NOT EXISTS (SELECT 1 FROM {staging} AS s WHERE {key_match})
+    """).format(partition=partition, staging=staging, key_match=key_match))
+    deleted = cur.rowcount
+
+    touch_version(cur, TABLE_NAME, id_version, staged["row_count"])
+    cur.execute(sql.SQL("DROP TABLE {}").format(staging))
+    return {"id_version": id_version, "merged": merged, "deleted": deleted}
@@ -0,0 +1,86 @@
+import threading
+import time
+from psycopg import sql
+from config import settings
+from database.db_pool import get_connection
+from database.db_destinations import get_all_destinations_and_country, TABLE_NAME as DESTINATIONS_TABLE
+from database.db_packaging import get_all_packaging, TABLE_NAME as PACKAGING_TABLE
+from database.db_product import get_all_products, TABLE_NAME as PRODUCTS_TABLE
+
+SCHEMA_NAME = settings.DATABASE_SCHEMA
+
+# Caché de proceso: mapas ya normalizados, versión de las tablas y momento de la última validación
+_cache = {"maps": None, "version": None, "checked_at": 0.0}
+_cache_lock = threading.Lock()
+
+
+def get_master_data_version() -> tuple:
+    """
+    Sonda barata de cambios sobre las tablas maestras (products, packaging, destinations).
+    Retorna, en un solo round trip, el número de filas y un checksum del contenido de cada tabla.
+    """
+    probe = "SELECT count(*)::text || ':' || coalesce(sum(hashtext(t::text)), 0)::text FROM {}.{} t"
+    query = sql.SQL("SELECT ({}), ({}), ({})").format(*[
+        sql.SQL(probe).format(sql.Identifier(SCHEMA_NAME), sql.Identifier(table_name))
+        for table_name in (PRODUCTS_TABLE, PACKAGING_TABLE, DESTINATIONS_TABLE)
+    ])
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query)
+            return cur.fetchone()
+
+
+def build_master_data_maps() -> dict:
+    """
+    Lee las tablas maestras y construye los diccionarios de búsqueda normalizados (minúsculas).
+    """
+    products_list = get_all_products()
+    packaging_list = get_all_packaging()
+    destinations_list = get_all_destinations_and_country()
+
+    return {
+        # Mapa: 'cry9000.00' -> id_product
+        "products": {
+            p['product_name'].strip().lower(): p['id_product']
+            for p in products_list if p['product_name']
+        },
+        # Mapa: 'cl-50l' -> id_packaging
+        "packaging": {
+            p['packaging_code'].strip().lower(): p['id_packaging']
+            for p in packaging_list if p['packaging_code']
+        },
+        # Mapa: 'wilmington' -> {'id': id_destination, 'country': 'USA'}
+        "destinations": {
+            d['destination_name'].strip().lower(): {'id': d['id_destination'], 'country': d['country']}
+            for d in destinations_list if d['destination_name']
+        },
+    }
+
+
+def get_master_data() -> dict:
+    """
+    Retorna los mapas de búsqueda de productos, envases y destinos compartidos por el proceso.
+    Dentro del TTL no consulta la base de datos; al vencer, ejecuta la sonda de versión
+    y solo recarga las tablas si su contenido cambió.
+    """
+    with _cache_lock:
+        now = time.monotonic()
+        if _cache["maps"] is not None and now - _cache["checked_at"] < settings.MASTER_DATA_CACHE_TTL:
+            return _cache["maps"]
+
+        version = get_master_data_version()
+        if _cache["maps"] is None or version != _cache["version"]:
+            _cache["maps"] = build_master_data_maps()
+            _cache["version"] = version
+        _cache["checked_at"] = now
+        return _cache["maps"]
+
+
+def invalidate_master_data() -> None:
+    """
+    Descarta la caché para forzar la recarga de los maestros en la próxima consulta.
+    """
+    with _cache_lock:
+        _cache["maps"] = None
+        _cache["version"] = None
+        _cache["checked_at"] = 0.0
@@ -1,7 +1,7 @@
 
-import psycopg
 from psycopg.rows import dict_row
 from config import settings
+from database.db_pool import get_connection
 from psycopg import sql
 import pandas as pd
 
@@ -12,8 +12,8 @@ def get_all_packaging():
     """
     Retorna el último id_version y load_timestamp desde la tabla de productos.
     """
-    with psycopg.connect(settings.DATABASE_CONN_STR, row_factory=dict_row) as conn:
-        with conn.cursor() as cur:
+    with get_connection() as conn:
+        with conn.cursor(row_factory=dict_row) as cur:
             cur.execute(
                 sql.SQL("""
                     SELECT id_packaging, packaging_code
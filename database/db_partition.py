@@ -0,0 +1,392 @@
+import json
+import threading
+import time
+import pandas as pd
+from psycopg import sql
+from psycopg.rows import dict_row
+from config import settings
+from database.db_copy import copy_dataframe
+from database.db_pool import get_connection
+from database.db_state import get_active_leases
+
+SCHEMA_NAME = settings.DATABASE_SCHEMA
+# Catálogo de versiones cargadas por tabla particionada
+VERSIONS_TABLE = "table_versions"
+VERSIONS_SEQUENCE = "table_versions_id_seq"
+# Comentario de las tablas de staging sin publicar, seguido de su fecha de creación (epoch) y, en las
+# del ETL, del archivo y el lease_owner que las crearon (JSON)
+STAGING_COMMENT_PREFIX = "etl staging since "
+# Columnas (nombre -> tipo) de las tablas particionadas ya verificadas en este proceso
+_schema_cache: dict[str, dict[str, str]] = {}
+_schema_lock = threading.Lock()
+
+
+def init_versions_table():
+    """
+    Crea el catálogo de versiones y la secuencia que asigna los id_version.
+    La clave primaria (table_name, id_version) permite obtener la última versión
+    con un solo acceso al índice, sin recorrer los datos cargados.
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("CREATE SEQUENCE IF NOT EXISTS {}.{}").format(
+                sql.Identifier(SCHEMA_NAME), sql.Identifier(VERSIONS_SEQUENCE)
+            ))
+            cur.execute(sql.SQL("""
+                CREATE TABLE IF NOT EXISTS {}.{} (
+                    table_name TEXT NOT NULL,
+                    id_version BIGINT NOT NULL,
+                    partition_name TEXT NOT NULL,
+                    file_path TEXT,
+                    row_count BIGINT NOT NULL,
+                    load_timestamp TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (table_name, id_version)
+                );
+            """).format(sql.Identifier(SCHEMA_NAME), sql.Identifier(VERSIONS_TABLE)))
+            # Última versión y retención por archivo (get_latest_version, drop_expired_versions)
+            cur.execute(sql.SQL("""
+                CREATE INDEX IF NOT EXISTS {} ON {}.{} (table_name, file_path, id_version DESC)
+            """).format(
+                sql.Identifier(f"{VERSIONS_TABLE}_file_idx"), sql.Identifier(SCHEMA_NAME), sql.Identifier(VERSIONS_TABLE)
+            ))
+        conn.commit()
+
+
+def init_partitioned_table(table_name: str, column_defs: list[sql.Composable]):
+    """
+    Crea la tabla padre particionada por LIST (id_version) si no existe.
+    Si existe una tabla plana con el mismo nombre (esquema anterior), se renombra
+    a <tabla>_legacy para conservar su historial.
+    """
+    init_versions_table()
+
+    column_defs = column_defs + [
+        sql.SQL("id_version BIGINT NOT NULL"),
+        sql.SQL("load_timestamp TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP"),
+    ]
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT c.relkind
+                FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = %s AND c.relname = %s
+                """,
+                (SCHEMA_NAME, table_name)
+            )
+            row = cur.fetchone()
+            if row and row[0] == "r":
+                cur.execute(sql.SQL("ALTER TABLE {}.{} RENAME TO {}").format(
+                    sql.Identifier(SCHEMA_NAME), sql.Identifier(table_name), sql.Identifier(f"{table_name}_legacy")
+                ))
+
+            cur.execute(sql.SQL("""
+                CREATE TABLE IF NOT EXISTS {}.{} (
+                    {}
+                ) PARTITION BY LIST (id_version);
+            """).format(
+                sql.Identifier(SCHEMA_NAME),
+                sql.Identifier(table_name),
+                sql.SQL(", ").join(column_defs)
+            ))
+        conn.commit()
+
+
+
+def get_table_schema(cur, table_name: str) -> dict[str, str]:
+    """Retorna las columnas (nombre -> tipo PostgreSQL) de la tabla del esquema, vacío si no existe."""
+    cur.execute(
+        """
+        SELECT a.attname, format_type(a.atttypid, a.atttypmod)
+        FROM pg_attribute a
+        JOIN pg_class c ON c.oid = a.attrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relname = %s AND a.attnum > 0 AND NOT a.attisdropped
+        ORDER BY a.attnum
+        """,
+        (SCHEMA_NAME, table_name)
+    )
+    return dict(cur.fetchall())
+
+
+def ensure_partitioned_table(table_name: str, columns: dict[str, str]) -> list[str]:
+    """
+    Garantiza que la tabla particionada exista con las columnas indicadas (nombre -> tipo PostgreSQL)
+    y retorna las columnas agregadas.
+    El esquema de la tabla se guarda por proceso: si todas las columnas ya están, no se envía DDL
+    ni se consulta la base. Una columna nueva se agrega con ALTER TABLE ADD COLUMN (sin default,
+    solo cambia el catálogo): las versiones anteriores la ven como NULL.
+    """
+    with _schema_lock:
+        schema = _schema_cache.get(table_name)
+        if schema is not None and columns.keys() <= schema.keys():
+            return []
+
+        if schema is None:
+            init_partitioned_table(table_name, [
+                sql.SQL("{} {}").format(sql.Identifier(column), sql.SQL(pg_type))
+                for column, pg_type in columns.items()
+            ])
+
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                schema = get_table_schema(cur, table_name)
+                added = [column for column in columns if column not in schema]
+                if added:
+                    cur.execute(sql.SQL("ALTER TABLE {} {}").format(
+                        sql.Identifier(SCHEMA_NAME, table_name),
+                        sql.SQL(", ").join(
+                            sql.SQL("ADD COLUMN IF NOT EXISTS {} {}").format(sql.Identifier(column), sql.SQL(columns[column]))
+                            for column in added
+                        )
+                    ))
+                    schema = get_table_schema(cur, table_name)
+            conn.commit()
+
+        _schema_cache[table_name] = schema
+        return added
+
+
+def get_cached_table_schema(table_name: str) -> dict[str, str]:
+    """Retorna el esquema guardado de la tabla (nombre -> tipo, como format_type), vacío si no se ha leído."""
+    with _schema_lock:
+        return dict(_schema_cache.get(table_name, {}))
+
+
+def invalidate_table_schema(table_name: str):
+    """Descarta el esquema guardado de la tabla; la próxima carga lo vuelve a leer de la base."""
+    with _schema_lock:
+        _schema_cache.pop(table_name, None)
+
+def stage_version(df: pd.DataFrame, table_name: str, file_path: str | None = None,
+                  lease_owner: str | None = None) -> dict:
+    """
+    Copia el DataFrame a una tabla de staging UNLOGGED (<tabla>_v<id_version>) fuera de la jerarquía
+    de la tabla padre, invisible para las consultas, con un CHECK sobre id_version para que el ATTACH
+    no tenga que validar las filas. El COPY no escribe WAL y un fallo posterior solo descarta el staging.
+    Retorna la versión preparada (table_name, id_version, partition_name, file_path, row_count)
+    para publicarla con publish_version. `lease_owner` (el worker que tiene el lease del archivo)
+    queda en la marca de staging: mientras conserve el lease, drop_stale_staging_tables no la toca.
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("SELECT nextval({})").format(
+                sql.Literal(f"{SCHEMA_NAME}.{VERSIONS_SEQUENCE}")
+            ))
+            id_version = cur.fetchone()[0]
+        conn.commit()
+
+    staged = {
+        "table_name": table_name,
+        "id_version": id_version,
+        "partition_name": f"{table_name}_v{id_version}",
+        "file_path": file_path,
+        "row_count": len(df),
+    }
+    partition = sql.Identifier(SCHEMA_NAME, staged["partition_name"])
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql.SQL("""
+                    CREATE UNLOGGED TABLE {} (
+                        LIKE {} INCLUDING DEFAULTS,
+                        CONSTRAINT {} CHECK (id_version = {})
+                    )
+                """).format(
+                    partition, sql.Identifier(SCHEMA_NAME, table_name),
+                    sql.Identifier(f"{staged['partition_name']}_version_check"), sql.Literal(id_version)
+                ))
+                cur.execute(sql.SQL("ALTER TABLE {} ALTER COLUMN id_version SET DEFAULT {}").format(
+                    partition, sql.Literal(id_version)
+                ))
+                # Marca de staging con la fecha de creación y el dueño (ver drop_stale_staging_tables)
+                marker = f"{STAGING_COMMENT_PREFIX}{time.time():.0f}"
+                if lease_owner is not None:
+                    marker += " " + json.dumps({"file_path": file_path, "lease_owner": lease_owner})
+                cur.execute(sql.SQL("COMMENT ON TABLE {} IS {}").format(partition, sql.Literal(marker)))
+                copy_dataframe(cur, df, staged["partition_name"])
+            conn.commit()
+    except Exception:
+        discard_staged_version(staged)
+        raise
+    return staged
+
+
+def publish_version(cur, staged: dict):
+    """
+    Publica una versión preparada por stage_version: la tabla pasa a LOGGED, se adjunta como
+    partición y se registra en el catálogo. Se ejecuta con el cursor de la transacción que
+    publica la carga: los lectores ven la versión completa o no la ven.
+    """
+    partition = sql.Identifier(SCHEMA_NAME, staged["partition_name"])
+    # Columnas que otra carga agregó a la tabla padre después de crear el staging
+    schema = get_table_schema(cur, staged["partition_name"])
+    added = {
+        column: pg_type for column, pg_type in get_table_schema(cur, staged["table_name"]).items()
+        if column not in schema
+    }
+    if added:
+        cur.execute(sql.SQL("ALTER TABLE {} {}").format(partition, sql.SQL(", ").join(
+            sql.SQL("ADD COLUMN {} {}").format(sql.Identifier(column), sql.SQL(pg_type))
+            for column, pg_type in added.items()
+        )))
+    cur.execute(sql.SQL("ALTER TABLE {} SET LOGGED").format(partition))
+    cur.execute(sql.SQL("COMMENT ON TABLE {} IS NULL").format(partition))
+    cur.execute(sql.SQL("ALTER TABLE {} ATTACH PARTITION {} FOR VALUES IN ({})").format(
+        sql.Identifier(SCHEMA_NAME, staged["table_name"]), partition, sql.Literal(staged["id_version"])
+    ))
+    cur.execute(
+        sql.SQL("""
+            INSERT INTO {}.{} (table_name, id_version, partition_name, file_path, row_count)
+            VALUES (%s, %s, %s, %s, %s)
+        """).format(sql.Identifier(SCHEMA_NAME), sql.Identifier(VERSIONS_TABLE)),
+        (staged["table_name"], staged["id_version"], staged["partition_name"], staged["file_path"], staged["row_count"])
+    )
+
+
+def discard_staged_version(staged: dict):
+    """
+    Elimina la tabla de staging de una versión que no llegó a publicarse.
+    También descarta el esquema guardado de la tabla, por si el fallo vino de un cambio externo.
+    """
+    invalidate_table_schema(staged["table_name"])
+    with get_connection() as conn:
+        conn.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(SCHEMA_NAME, staged["partition_name"])))
+        conn.commit()
+
+
+def drop_stale_staging_tables(max_age_seconds: float) -> list[str]:
+    """
+    Elimina las tablas de staging sin publicar que ya no tienen dueño y retorna sus nombres.
+    Una tabla del ETL se elimina cuando su lease_owner ya no tiene un lease vigente sobre su archivo
+    (worker caído o archivo reclamado por otro): un archivo lento que sigue renovando su lease
+    conserva su staging aunque sea antiguo. Las tablas sin dueño en la marca (load_version, que
+    publica en la misma llamada) se eliminan si se crearon hace más de `max_age_seconds`.
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT c.relname, obj_description(c.oid, 'pg_class')
+                FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = %s AND c.relkind = 'r' AND c.relpersistence = 'u'
+                  AND NOT c.relispartition
+                  AND obj_description(c.oid, 'pg_class') LIKE %s
+                """,
+                (SCHEMA_NAME, f"{STAGING_COMMENT_PREFIX}%")
+            )
+            markers = {}
+            for name, comment in cur.fetchall():
+                created, _, owner = comment[len(STAGING_COMMENT_PREFIX):].partition(" ")
+                markers[name] = (float(created), json.loads(owner) if owner else None)
+
+            leases = get_active_leases({owner["file_path"] for _, owner in markers.values() if owner})
+            oldest_allowed = time.time() - max_age_seconds
+            stale = [
+                name for name, (created, owner) in markers.items()
+                if (leases.get(owner["file_path"]) != owner["lease_owner"] if owner else created < oldest_allowed)
+            ]
+            for name in stale:
+                cur.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(SCHEMA_NAME, name)))
+        conn.commit()
+    return stale
+
+
+def load_version(df: pd.DataFrame, table_name: str, file_path: str | None = None) -> int:
+    """
+    Carga el DataFrame como una nueva versión de la tabla y retorna su id_version:
+    staging (stage_version), publicación en su propia transacción (publish_version) y
+    eliminación de las versiones del mismo archivo que exceden PARTITION_RETENTION_VERSIONS.
+    El ETL publica las versiones de un archivo junto con su estado (ver db_file_load).
+    """
+    staged = stage_version(df, table_name, file_path)
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                publish_version(cur, staged)
+            conn.commit()
+    except Exception:
+        discard_staged_version(staged)
+        raise
+
+    drop_expired_versions(table_name, file_path, settings.PARTITION_RETENTION_VERSIONS)
+    return staged["id_version"]
+
+
+def drop_expired_versions(table_name: str, file_path: str | None, keep: int) -> list[int]:
+    """
+    Elimina las particiones más antiguas de un archivo dejando solo sus últimas `keep` versiones.
+    La retención es por archivo: las cargas de un archivo nunca eliminan versiones de otro
+    (las versiones sin file_path forman su propio grupo).
+    Con keep <= 0 no se elimina nada. Retorna los id_version eliminados.
+    """
+    if keep <= 0:
+        return []
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                sql.SQL("""
+                    SELECT id_version, partition_name
+                    FROM {}.{}
+                    WHERE table_name = %s AND file_path IS NOT DISTINCT FROM %s
+                    ORDER BY id_version DESC
+                    OFFSET %s
+                """).format(sql.Identifier(SCHEMA_NAME), sql.Identifier(VERSIONS_TABLE)),
+                (table_name, file_path, keep)
+            )
+            expired = cur.fetchall()
+            for id_version, partition_name in expired:
+                cur.execute(sql.SQL("DROP TABLE IF EXISTS {}.{}").format(
+                    sql.Identifier(SCHEMA_NAME), sql.Identifier(partition_name)
+                ))
+                cur.execute(
+                    sql.SQL("DELETE FROM {}.{} WHERE table_name = %s AND id_version = %s").format(
+                        sql.Identifier(SCHEMA_NAME), sql.Identifier(VERSIONS_TABLE)
+                    ),
+                    (table_name, id_version)
+                )
+        conn.commit()
+    return [id_version for id_version, _ in expired]
+
+
+def get_latest_version(table_name: str, file_path: str | None = None) -> dict | None:
+    """
+    Retorna id_version, partition_name, load_timestamp, file_path y row_count de la última versión
+    de la tabla: la de mayor id_version, es decir, la última publicada de cualquier archivo.
+    Con file_path, la última publicada desde ese archivo.
+    Se resuelve con el índice del catálogo, sin importar cuánto historial exista.
+    """
+    file_filter = sql.SQL("AND file_path = %s") if file_path is not None else sql.SQL("")
+    params = (table_name, file_path) if file_path is not None else (table_name,)
+    with get_connection() as conn:
+        with conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(
+                sql.SQL("""
+                    SELECT id_version, partition_name, load_timestamp, file_path, row_count
+                    FROM {}.{}
+                    WHERE table_name = %s {}
+                    ORDER BY id_version DESC
+                    LIMIT 1
+                """).format(sql.Identifier(SCHEMA_NAME), sql.Identifier(VERSIONS_TABLE), file_filter),
+                params
+            )
+            return cur.fetchone()
+
+
+def touch_version(cur, table_name: str, id_version: int, row_count: int):
+    """
+    Actualiza row_count y load_timestamp de una versión modificada en sitio (carga incremental).
+    Se ejecuta con el cursor de la transacción que modificó la partición.
+    """
+    cur.execute(
+        sql.SQL("""
+            UPDATE {}.{}
+            SET row_count = %s, load_timestamp = CURRENT_TIMESTAMP
+            WHERE table_name = %s AND id_version = %s
+        """).format(sql.Identifier(SCHEMA_NAME), sql.Identifier(VERSIONS_TABLE)),
+        (row_count, table_name, id_version)
+    )
@@ -0,0 +1,63 @@
+import atexit
+import threading
+from contextlib import contextmanager
+from psycopg_pool import ConnectionPool
+from config import settings
+
+_pool: ConnectionPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Retorna el pool de conexiones compartido por todo el proceso.
+    Se crea en el primer uso con la configuración definida en settings.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    settings.DATABASE_CONN_STR,
+                    min_size=settings.DATABASE_POOL_MIN_SIZE,
+                    max_size=settings.DATABASE_POOL_MAX_SIZE,
+                    timeout=settings.DATABASE_POOL_TIMEOUT,
+                    max_idle=settings.DATABASE_POOL_MAX_IDLE,
+                    max_lifetime=settings.DATABASE_POOL_MAX_LIFETIME,
+                    # Verifica que la conexión siga viva antes de entregarla
+                    check=ConnectionPool.check_connection,
+                    name="etl_pool",
+                    open=True,
+                )
+                atexit.register(close_pool)
+    return _pool
+
+
+@contextmanager
+def get_connection():
+    """
+    Entrega una conexión del pool y la devuelve al terminar el bloque.
+    Si el bloque falla, la transacción abierta se revierte.
+    """
+    with get_pool().connection() as conn:
+        yield conn
+
+
+def get_pool_stats() -> dict:
+    """
+    Retorna las estadísticas del pool (tamaño, conexiones libres, esperas, errores, etc.).
+    """
+    if _pool is None:
+        return {}
+    return _pool.get_stats()
+
+
+def close_pool() -> None:
+    """
+    Cierra el pool y todas sus conexiones.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
@@ -1,6 +1,6 @@
-import psycopg
 from psycopg.rows import dict_row
 from config import settings
+from database.db_pool import get_connection
 from psycopg import sql
 import pandas as pd
 
@@ -9,13 +9,13 @@ SCHEMA_NAME = settings.DATABASE_SCHEMA
 
 def get_all_products():
     """
-    Retorna una lista de diccionarios con todos los destinations y countries.
+    Retorna una lista de diccionarios con el id y el nombre de todos los productos.
     """
-    with psycopg.connect(settings.DATABASE_CONN_STR, row_factory=dict_row) as conn:
-        with conn.cursor() as cur:
+    with get_connection() as conn:
+        with conn.cursor(row_factory=dict_row) as cur:
             cur.execute(
                 sql.SQL("""
-                    SELECT *
+                    SELECT id_product, product_name
                     FROM {}.{}
                 """).format(
                     sql.Identifier(SCHEMA_NAME),
@@ -1,9 +1,9 @@
 import csv
 import io
-import psycopg
 from psycopg import sql
 from psycopg.rows import dict_row
 from config import settings
+from database.db_pool import get_connection
 import pandas as pd
 from database.db_program import get_latest_version_info
 
@@ -26,7 +26,7 @@ def init_summary_table():
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     );
     """
-    with psycopg.connect(settings.DATABASE_CONN_STR) as conn:
+    with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
                 sql.SQL("CREATE SCHEMA IF NOT EXISTS {};").format(sql.Identifier(SCHEMA_NAME))
@@ -80,7 +80,7 @@ def insert_summaries_bulk(df: pd.DataFrame, columnas: list[str], table_name: str
         buffer.seek(0)
         print("BUFFER:", buffer)
         # Ejecutar COPY
-        with psycopg.connect(settings.DATABASE_CONN_STR) as conn:
+        with get_connection() as conn:
             with conn.cursor() as cur:
                 copy_sql = sql.SQL("""
                     COPY {}.{} (id_version, field, total, product, load_timestamp)
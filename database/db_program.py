@@ -1,8 +1,6 @@
-import io
-import csv
-import psycopg
-from psycopg.rows import dict_row
 from config import settings
+from database.db_partition import ensure_partitioned_table, get_latest_version, load_version, stage_version
+from database.db_pool import get_connection
 from psycopg import sql
 import pandas as pd
 
@@ -13,8 +11,15 @@ SCHEMA_NAME = settings.DATABASE_SCHEMA
 def map_dtype_to_postgres(dtype) -> str:
     """
     Mapea un tipo de dato de pandas a su tipo equivalente en PostgreSQL.
+    Los enteros usan el tamaño del dtype (Int16 -> SMALLINT) y una categoría, el de sus valores.
     """
+    if isinstance(dtype, pd.CategoricalDtype):
+        return map_dtype_to_postgres(dtype.categories.dtype)
     if pd.api.types.is_integer_dtype(dtype):
+        if dtype.itemsize <= 2:
+            return "SMALLINT"
+        if dtype.itemsize == 4:
+            return "INTEGER"
         return "BIGINT"
     elif pd.api.types.is_float_dtype(dtype):
         return "DOUBLE PRECISION"
@@ -25,85 +30,41 @@ def map_dtype_to_postgres(dtype) -> str:
     else:
         return "TEXT"
 
-def init_products_table(df: pd.DataFrame, table_name: str):
+def init_products_table(df: pd.DataFrame, table_name: str) -> list[str]:
     """
     Crea una tabla en PostgreSQL basada en la estructura del DataFrame.
-    Si la tabla ya existe, no la recrea.
-    Agrega columnas extras para versionado con valores DEFAULT automáticos.
+    Si la tabla ya existe, no la recrea: las columnas nuevas de la hoja se agregan con
+    ALTER TABLE ADD COLUMN y se retornan. El esquema se guarda por proceso, así una carga
+    sin columnas nuevas no envía DDL (ver ensure_partitioned_table).
+    La tabla se particiona por id_version: cada carga es una partición (ver db_partition).
     """
     df = rename_duplicate_columns(df)
-    column_defs = []
+    columns = {col: map_dtype_to_postgres(dtype) for col, dtype in zip(df.columns, df.dtypes)}
+    return ensure_partitioned_table(TABLE_NAME, columns)
 
-    for col, dtype in zip(df.columns, df.dtypes):
-        pg_type = map_dtype_to_postgres(dtype)
-        column_defs.append(
-            sql.SQL("{} {}").format(sql.Identifier(col), sql.SQL(pg_type))
-        )
-
-    # Agregar columnas extras con DEFAULT para generación automática
-    column_defs.append(sql.SQL("id_version BIGINT NOT NULL DEFAULT (to_char(CURRENT_DATE, 'YYYYMMDD')::bigint)"))
-    column_defs.append(sql.SQL("load_timestamp TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP"))
-
-    ddl = sql.SQL("""
-        CREATE TABLE IF NOT EXISTS {} (
-            {}
-        );
-    """).format(
-        sql.Identifier(TABLE_NAME),
-        sql.SQL(", ").join(column_defs)
-    )
-
-    with psycopg.connect(settings.DATABASE_CONN_STR) as conn:
-        with conn.cursor() as cur:
-            cur.execute(ddl)
-        conn.commit()
-
-def copy_dataframe_to_table(df: pd.DataFrame, table_name: str):
+def copy_dataframe_to_table(df: pd.DataFrame, table_name: str, file_name: str | None = None) -> int:
     """
     Inserta los datos de un DataFrame en una tabla PostgreSQL
     usando la instrucción COPY (método eficiente para cargas masivas).
+    Los datos se cargan como una nueva versión (partición) y se retorna su id_version.
     """
-    df = df.copy()
-    df = df.where(pd.notnull(df), None)  # reemplaza NaN por NULL
+    return load_version(df, TABLE_NAME, file_name)
 
-    # Convierte el DataFrame a un CSV temporal en memoria
-    buffer = io.StringIO()
-    df.to_csv(
-        buffer,
-        index=False,
-        header=False,
-        lineterminator="\n",
-        quoting=csv.QUOTE_MINIMAL,
-        escapechar="\\",
-    )
-    buffer.seek(0)
 
-    with psycopg.connect(settings.DATABASE_CONN_STR) as conn:
-        with conn.cursor() as cur:
-            copy_sql = sql.SQL("""
-                COPY {} ({})
-                FROM STDIN
-                WITH (FORMAT CSV)
-            """).format(
-                sql.Identifier(TABLE_NAME),
-                sql.SQL(", ").join(sql.Identifier(c) for c in df.columns)
-            )
-
-            # Escribe los datos por chunks para optimizar memoria
-            with cur.copy(copy_sql) as copy:
-                while True:
-                    chunk = buffer.read(1024 * 1024)
-                    if not chunk:
-                        break
-                    copy.write(chunk)
-        conn.commit()
 
+def stage_dataframe_to_table(df: pd.DataFrame, table_name: str, file_name: str | None = None,
+                             lease_owner: str | None = None) -> dict:
+    """
+    Copia los datos del DataFrame con COPY a una tabla de staging UNLOGGED y retorna la versión
+    preparada; se publica junto con el estado del archivo (ver db_file_load).
+    """
+    return stage_version(df, TABLE_NAME, file_name, lease_owner)
 
 def count_rows(table_name: str) -> int:
     """
     Retorna el número total de filas existentes en una tabla PostgreSQL.
     """
-    with psycopg.connect(settings.DATABASE_CONN_STR) as conn:
+    with get_connection() as conn:
         with conn.cursor() as cur:
             count_sql = sql.SQL("SELECT COUNT(*) FROM {}").format(sql.Identifier(TABLE_NAME))
             cur.execute(count_sql)
@@ -126,22 +87,10 @@ def rename_duplicate_columns(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def get_latest_version_info(table_name: str) -> dict | None:
+def get_latest_version_info(table_name: str, file_path: str | None = None) -> dict | None:
     """
-    Retorna el último id_version y load_timestamp desde la tabla de productos.
+    Retorna el último id_version y load_timestamp desde el catálogo de versiones.
+    Sin file_path es la última versión publicada de cualquier archivo; con file_path,
+    la última cargada desde ese archivo (ver get_latest_version).
     """
-    with psycopg.connect(settings.DATABASE_CONN_STR, row_factory=dict_row) as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                sql.SQL("""
-                    SELECT id_version, load_timestamp
-                    FROM {}.{}
-                    ORDER BY load_timestamp DESC
-                    LIMIT 1
-                """).format(
-                    sql.Identifier(SCHEMA_NAME),
-                    sql.Identifier(TABLE_NAME)
-                )
-            )
-            return cur.fetchone()
-
+    return get_latest_version(TABLE_NAME, file_path)
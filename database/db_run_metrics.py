@@ -0,0 +1,95 @@
+from psycopg import sql
+from config import settings
+from database.db_pool import get_connection
+
+TABLE_NAME = "run_metrics"
+SCHEMA_NAME = settings.DATABASE_SCHEMA
+
+
+def init_run_metrics_table():
+    """
+    Crea la tabla 'run_metrics' si no existe.
+    Guarda una fila por ejecución, archivo y etapa (más una fila 'total' por archivo).
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("""
+                CREATE TABLE IF NOT EXISTS {}.{} (
+                    id BIGSERIAL PRIMARY KEY,
+                    flow_run_id TEXT,
+                    file_path TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    started_at TIMESTAMP WITH TIME ZONE NOT NULL,
+                    wall_time DOUBLE PRECISION NOT NULL,
+                    cpu_time DOUBLE PRECISION NOT NULL,
+                    rows BIGINT,
+                    bytes BIGINT,
+                    peak_rss BIGINT,
+                    rss_delta BIGINT,
+                    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+                );
+            """).format(sql.Identifier(SCHEMA_NAME), sql.Identifier(TABLE_NAME)))
+            # Tablas creadas antes de registrar el cambio de RSS por etapa
+            cur.execute(sql.SQL("ALTER TABLE {}.{} ADD COLUMN IF NOT EXISTS rss_delta BIGINT").format(
+                sql.Identifier(SCHEMA_NAME), sql.Identifier(TABLE_NAME)
+            ))
+            cur.execute(sql.SQL("""
+                CREATE INDEX IF NOT EXISTS {} ON {}.{} (stage, started_at DESC);
+            """).format(
+                sql.Identifier(f"{TABLE_NAME}_stage_started_at_idx"),
+                sql.Identifier(SCHEMA_NAME),
+                sql.Identifier(TABLE_NAME)
+            ))
+        conn.commit()
+
+
+def insert_run_metrics(flow_run_id: str | None, records: list[dict]) -> None:
+    """
+    Inserta las métricas de etapas recibidas en una sola sentencia.
+    """
+    if not records:
+        return
+
+    columns = ["file_path", "stage", "started_at", "wall_time", "cpu_time", "rows", "bytes", "peak_rss", "rss_delta"]
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                sql.SQL("""
+                    INSERT INTO {}.{} (flow_run_id, {})
+                    SELECT %s, *
+                    FROM unnest(
+                        %s::text[], %s::text[], %s::timestamptz[], %s::float8[],
+                        %s::float8[], %s::bigint[], %s::bigint[], %s::bigint[], %s::bigint[]
+                    )
+                """).format(
+                    sql.Identifier(SCHEMA_NAME),
+                    sql.Identifier(TABLE_NAME),
+                    sql.SQL(", ").join(sql.Identifier(c) for c in columns)
+                ),
+                (flow_run_id, *[[r[c] for r in records] for c in columns])
+            )
+        conn.commit()
+
+
+def get_stage_baseline(stage: str, limit: int = 50, min_samples: int = 5) -> float | None:
+    """
+    Retorna la mediana de wall_time de las últimas `limit` ejecuciones de la etapa
+    (None si hay menos de `min_samples`, para no comparar contra un historial insuficiente).
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                sql.SQL("""
+                    SELECT CASE WHEN count(*) >= %s
+                        THEN percentile_cont(0.5) WITHIN GROUP (ORDER BY wall_time) END
+                    FROM (
+                        SELECT wall_time
+                        FROM {}.{}
+                        WHERE stage = %s
+                        ORDER BY started_at DESC
+                        LIMIT %s
+                    ) recent
+                """).format(sql.Identifier(SCHEMA_NAME), sql.Identifier(TABLE_NAME)),
+                (min_samples, stage, limit)
+            )
+            return cur.fetchone()[0]
@@ -1,11 +1,19 @@
-import psycopg
 from psycopg import sql
 from psycopg.rows import dict_row
 from datetime import datetime
 from config import settings
+from database.db_pool import get_connection
 
 TABLE_NAME = "state"
 SCHEMA_NAME = settings.DATABASE_SCHEMA  # Esquema definido en la configuración
+# Digests de la última carga exitosa: archivo completo y cada hoja procesada
+DIGEST_COLUMNS = ("content_digest", "program_digest", "ifr_digest")
+# Columnas agregadas después de la versión inicial de la tabla (nombre -> tipo)
+ADDED_COLUMNS = {
+    **{column: "TEXT" for column in DIGEST_COLUMNS},
+    "lease_owner": "TEXT",
+    "lease_expires_at": "TIMESTAMP WITH TIME ZONE",
+}
 
 
 def init_state_table():
@@ -21,11 +29,23 @@ def init_state_table():
         status TEXT NOT NULL DEFAULT 'pending',
         retries INTEGER NOT NULL DEFAULT 0,
         last_checked TIMESTAMP NOT NULL,
+        content_digest TEXT,
+        program_digest TEXT,
+        ifr_digest TEXT,
+        lease_owner TEXT,
+        lease_expires_at TIMESTAMP WITH TIME ZONE,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     );
     """
-    with psycopg.connect(settings.DATABASE_CONN_STR) as conn:
+    # Tablas creadas con una versión anterior: agrega las columnas nuevas
+    migrations = [
+        sql.SQL("ALTER TABLE {}.{} ADD COLUMN IF NOT EXISTS {} {}").format(
+            sql.Identifier(SCHEMA_NAME), sql.Identifier(TABLE_NAME), sql.Identifier(column), sql.SQL(pg_type)
+        )
+        for column, pg_type in ADDED_COLUMNS.items()
+    ]
+    with get_connection() as conn:
         with conn.cursor() as cur:
             # Crea el esquema si no existe
             cur.execute(
@@ -33,6 +53,8 @@ def init_state_table():
             )
             # Crea la tabla
             cur.execute(ddl)
+            for migration in migrations:
+                cur.execute(migration)
         conn.commit()
 
 
@@ -41,8 +63,8 @@ def get_state_record(file_path: str) -> dict | None:
     Obtiene un registro de estado por su file_path.
     Retorna un diccionario o None si no existe.
     """
-    with psycopg.connect(settings.DATABASE_CONN_STR, row_factory=dict_row) as conn:
-        with conn.cursor() as cur:
+    with get_connection() as conn:
+        with conn.cursor(row_factory=dict_row) as cur:
             cur.execute(
                 sql.SQL("SELECT * FROM {}.{} WHERE file_path = %s").format(
                     sql.Identifier(SCHEMA_NAME),
@@ -53,11 +75,79 @@ def get_state_record(file_path: str) -> dict | None:
             return cur.fetchone()
 
 
+def get_all_state_etags() -> dict[str, str]:
+    """
+    Retorna un diccionario file_path -> etag con todos los registros de la tabla 'state'
+    usando una sola consulta.
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                sql.SQL("SELECT file_path, etag FROM {}.{}").format(
+                    sql.Identifier(SCHEMA_NAME),
+                    sql.Identifier(TABLE_NAME)
+                )
+            )
+            return dict(cur.fetchall())
+
+
+def get_state_digests(file_path: str) -> dict:
+    """
+    Retorna los digests de la última carga exitosa del archivo (content, program, ifr).
+    Las claves sin carga previa tienen valor None.
+    """
+    with get_connection() as conn:
+        with conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(
+                sql.SQL("SELECT {} FROM {}.{} WHERE file_path = %s").format(
+                    sql.SQL(", ").join(sql.Identifier(c) for c in DIGEST_COLUMNS),
+                    sql.Identifier(SCHEMA_NAME),
+                    sql.Identifier(TABLE_NAME)
+                ),
+                (file_path,)
+            )
+            return cur.fetchone() or dict.fromkeys(DIGEST_COLUMNS)
+
+
+class StaleFileStateError(RuntimeError):
+    """El archivo cambió (nuevo etag) o perdió su lease mientras se procesaba: la carga no se publica."""
+
+
+def mark_file_ready(cur, file_path: str, etag: str | None, lease_owner: str | None = None, **digests: str) -> None:
+    """
+    Marca el archivo como 'ready' y registra los digests indicados.
+    Se ejecuta con el cursor de la transacción que publica la carga del archivo.
+    Solo se actualiza si el archivo sigue con el `etag` procesado (y, con `lease_owner`, con su lease):
+    si llegó una versión nueva o otro worker lo reclamó, lanza StaleFileStateError y la transacción
+    se revierte, así la versión nueva queda pendiente.
+    """
+    unknown = set(digests) - set(DIGEST_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown digest columns: {sorted(unknown)}")
+    assignments = [sql.SQL("{} = %s").format(sql.Identifier(c)) for c in digests]
+    owner_filter = sql.SQL("AND lease_owner = %s") if lease_owner is not None else sql.SQL("")
+    cur.execute(
+        sql.SQL("""
+            UPDATE {}.{}
+            SET {}
+            WHERE file_path = %s AND etag = %s {}
+        """).format(
+            sql.Identifier(SCHEMA_NAME),
+            sql.Identifier(TABLE_NAME),
+            sql.SQL(", ").join([*assignments, sql.SQL("status = 'ready'"), sql.SQL("updated_at = CURRENT_TIMESTAMP")]),
+            owner_filter
+        ),
+        (*digests.values(), file_path, etag, *([lease_owner] if lease_owner is not None else []))
+    )
+    if cur.rowcount == 0:
+        raise StaleFileStateError(f"{file_path} changed or lost its lease while processing (etag {etag})")
+
+
 def create_state_record(record: dict):
     """
     Inserta un nuevo registro en la tabla 'state' con la información del archivo.
     """
-    with psycopg.connect(settings.DATABASE_CONN_STR) as conn:
+    with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
                 sql.SQL("""
@@ -83,7 +173,7 @@ def update_state_record(record: dict):
     """
     Actualiza los campos principales de un registro existente según su file_path.
     """
-    with psycopg.connect(settings.DATABASE_CONN_STR) as conn:
+    with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
                 sql.SQL("""
@@ -111,16 +201,59 @@ def update_state_record(record: dict):
         conn.commit()
 
 
+def upsert_state_records(records: list[dict]) -> None:
+    """
+    Inserta o actualiza (según file_path) todos los registros recibidos en una sola
+    sentencia INSERT ... ON CONFLICT y una sola transacción.
+    """
+    if not records:
+        return
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                sql.SQL("""
+                    INSERT INTO {}.{} (file_path, etag, last_modified, status, retries, last_checked)
+                    SELECT *
+                    FROM unnest(
+                        %s::text[], %s::text[], %s::timestamptz[], %s::text[], %s::int[], %s::timestamptz[]
+                    )
+                    ON CONFLICT (file_path) DO UPDATE
+                    SET etag = EXCLUDED.etag,
+                        last_modified = EXCLUDED.last_modified,
+                        status = EXCLUDED.status,
+                        retries = EXCLUDED.retries,
+                        last_checked = EXCLUDED.last_checked,
+                        updated_at = CURRENT_TIMESTAMP
+                """).format(
+                    sql.Identifier(SCHEMA_NAME),
+                    sql.Identifier(TABLE_NAME)
+                ),
+                (
+                    [r["file_path"] for r in records],
+                    [r["etag"] for r in records],
+                    [r["last_modified"] for r in records],
+                    [r["status"] for r in records],
+                    [r["retries"] for r in records],
+                    [r["last_checked"] for r in records]
+                )
+            )
+        conn.commit()
+
+
 def has_pending_state() -> bool:
     """
-    Retorna True si existe al menos un registro pendiente (status='pending' y retries<3).
+    Retorna True si existe al menos un registro pendiente (status != 'ready' y retries<3)
+    que ningún worker tenga reclamado con un lease vigente.
     """
-    with psycopg.connect(settings.DATABASE_CONN_STR) as conn:
+    with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
                 sql.SQL("""
                     SELECT EXISTS (
-                        SELECT 1 FROM {}.{} WHERE status != 'ready' AND retries < 3
+                        SELECT 1 FROM {}.{}
+                        WHERE status != 'ready' AND retries < 3
+                          AND (lease_expires_at IS NULL OR lease_expires_at < CURRENT_TIMESTAMP)
                     );
                 """).format(
                     sql.Identifier(SCHEMA_NAME),
@@ -135,7 +268,7 @@ def get_pending_files() -> list[str]:
     """
     Retorna una lista con los file_path de registros pendientes (status != 'pending' y retries < 3).
     """
-    with psycopg.connect(settings.DATABASE_CONN_STR) as conn:
+    with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
                 sql.SQL("""
@@ -150,11 +283,131 @@ def get_pending_files() -> list[str]:
             return [row[0] for row in cur.fetchall()]
 
 
+def claim_pending_files(owner: str, limit: int | None = None, files: list[str] | None = None,
+                        exclude: list[str] | None = None, lease_seconds: float | None = None) -> list[str]:
+    """
+    Reclama de forma atómica hasta `limit` archivos pendientes (status != 'ready' y retries < 3)
+    para `owner` y retorna sus file_path.
+    Solo se toman archivos sin lease o con el lease vencido (worker caído), y FOR UPDATE SKIP LOCKED
+    evita que dos workers que reclaman al mismo tiempo se bloqueen o tomen el mismo archivo.
+    `files` restringe el reclamo a esos archivos y `exclude` omite los ya intentados por el llamador.
+    """
+    lease_seconds = settings.STATE_LEASE_SECONDS if lease_seconds is None else lease_seconds
+    filters = []
+    params = []
+    if files is not None:
+        filters.append(sql.SQL("AND file_path = ANY(%s)"))
+        params.append(list(files))
+    if exclude:
+        filters.append(sql.SQL("AND NOT (file_path = ANY(%s))"))
+        params.append(list(exclude))
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                sql.SQL("""
+                    UPDATE {schema}.{table} AS s
+                    SET lease_owner = %s,
+                        lease_expires_at = CURRENT_TIMESTAMP + make_interval(secs => %s),
+                        updated_at = CURRENT_TIMESTAMP
+                    FROM (
+                        SELECT file_path
+                        FROM {schema}.{table}
+                        WHERE status != 'ready' AND retries < 3
+                          AND (lease_expires_at IS NULL OR lease_expires_at < CURRENT_TIMESTAMP)
+                          {filters}
+                        ORDER BY updated_at
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    ) AS claimed
+                    WHERE s.file_path = claimed.file_path
+                    RETURNING s.file_path;
+                """).format(
+                    schema=sql.Identifier(SCHEMA_NAME),
+                    table=sql.Identifier(TABLE_NAME),
+                    filters=sql.SQL(" ").join(filters)
+                ),
+                (owner, lease_seconds, *params, limit)
+            )
+            claimed = [row[0] for row in cur.fetchall()]
+        conn.commit()
+    return claimed
+
+
+def renew_lease(file_path: str, owner: str, lease_seconds: float | None = None) -> bool:
+    """
+    Extiende el lease del archivo si todavía pertenece a `owner` y retorna si lo conserva.
+    Se ejecuta periódicamente mientras el archivo se procesa (ver keep_lease).
+    """
+    lease_seconds = settings.STATE_LEASE_SECONDS if lease_seconds is None else lease_seconds
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                sql.SQL("""
+                    UPDATE {}.{}
+                    SET lease_expires_at = CURRENT_TIMESTAMP + make_interval(secs => %s)
+                    WHERE file_path = %s AND lease_owner = %s;
+                """).format(
+                    sql.Identifier(SCHEMA_NAME),
+                    sql.Identifier(TABLE_NAME)
+                ),
+                (lease_seconds, file_path, owner)
+            )
+            renewed = cur.rowcount > 0
+        conn.commit()
+    return renewed
+
+
+def get_active_leases(file_paths: set[str] | list[str]) -> dict[str, str]:
+    """
+    Retorna file_path -> lease_owner de los archivos indicados que tienen un lease vigente.
+    """
+    if not file_paths:
+        return {}
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                sql.SQL("""
+                    SELECT file_path, lease_owner
+                    FROM {}.{}
+                    WHERE file_path = ANY(%s) AND lease_owner IS NOT NULL
+                      AND lease_expires_at > CURRENT_TIMESTAMP;
+                """).format(
+                    sql.Identifier(SCHEMA_NAME),
+                    sql.Identifier(TABLE_NAME)
+                ),
+                (list(file_paths),)
+            )
+            return dict(cur.fetchall())
+
+
+def release_lease(file_path: str, owner: str) -> None:
+    """
+    Libera el lease del archivo si todavía pertenece a `owner`
+    (si venció y otro worker lo reclamó, no se toca).
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                sql.SQL("""
+                    UPDATE {}.{}
+                    SET lease_owner = NULL,
+                        lease_expires_at = NULL
+                    WHERE file_path = %s AND lease_owner = %s;
+                """).format(
+                    sql.Identifier(SCHEMA_NAME),
+                    sql.Identifier(TABLE_NAME)
+                ),
+                (file_path, owner)
+            )
+        conn.commit()
+
+
 def update_status(file_path: str, new_status: str) -> None:
     """
     Actualiza el estado (status) de un registro específico por su file_path.
     """
-    with psycopg.connect(settings.DATABASE_CONN_STR) as conn:
+    with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
                 sql.SQL("""
@@ -175,7 +428,7 @@ def increment_retries(file_path: str) -> None:
     """
     Incrementa el número de reintentos (retries) para un archivo determinado.
     """
-    with psycopg.connect(settings.DATABASE_CONN_STR) as conn:
+    with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
                 sql.SQL("""
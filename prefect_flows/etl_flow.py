@@ -1,52 +1,335 @@
-from prefect import flow, get_run_logger
+import socket
+import time
+import uuid
+from contextlib import ExitStack, nullcontext
+from prefect import flow, task, get_run_logger
+from prefect.artifacts import create_table_artifact
+from prefect.cache_policies import NO_CACHE
+from prefect.futures import as_completed, wait
+from prefect.runtime import flow_run
+from prefect.task_runners import ProcessPoolTaskRunner, ThreadPoolTaskRunner
 from config import settings
-from database.db_state import get_pending_files, increment_retries, update_status
-from prefect_flows.tasks.extract import extract_data
+from database.db_file_load import discard_staged_versions, publish_file_load
+from database.db_pool import get_pool_stats
+from database.db_partition import drop_stale_staging_tables
+from database.db_run_metrics import get_stage_baseline, init_run_metrics_table, insert_run_metrics
+from database.db_state import (
+    StaleFileStateError, claim_pending_files, get_state_digests, get_state_record, increment_retries, release_lease
+)
+from prefect_flows.tasks.extract import extract_data_spooled
 # Importamos las nuevas tareas separadas
 from prefect_flows.tasks.transform import parse_excel_sheet, clean_dataframe, transform_ifr_excel
 from prefect_flows.tasks.load import load_data_program, load_data_ifr
+from prefect_flows.tasks.staging import stage_dataframe
+from prefect_flows.utils.lease import keep_lease
+from prefect_flows.utils.metrics import collect_metrics, measure_stage
+from prefect_flows.utils.profiling import profiled
+from prefect_flows.utils.staging_cache import discard_entry, evict_staging_cache, load_frame, load_manifest, save_manifest
+from prefect_flows.utils.workbook import WorkbookHandle, sheet_digests
 
-@flow
-def etl_flow(bucket: str = settings.BUCKET_NAME):
-    """Flujo ETL principal: Procesa Program e IFR desde el mismo archivo."""
+# Columna de 'state' donde se guarda el digest de cada hoja procesada
+SHEET_DIGEST_COLUMNS = {"Program": "program_digest", "IFR": "ifr_digest"}
+
+def load_staged(file: str, etag: str | None, previous: dict) -> tuple[dict, dict] | None:
+    """
+    Retorna (manifiesto, DataFrames por hoja) si la caché de staging tiene todo lo que el archivo
+    necesita para este etag: los digests y el DataFrame de cada hoja que cambió. Si falta algo, None.
+    Un error de la caché se registra y se trata como ausencia (el archivo se procesa completo).
+    """
+    if etag is None:
+        return None
+    try:
+        manifest = load_manifest(file, etag)
+        if manifest is None:
+            return None
+        frames = {}
+        if manifest["content_digest"] != previous["content_digest"]:
+            for sheet, column in SHEET_DIGEST_COLUMNS.items():
+                digest = manifest["sheet_digests"].get(sheet)
+                if digest is None or digest != previous[column]:
+                    frames[sheet] = load_frame(file, etag, sheet)
+                    if frames[sheet] is None:
+                        return None
+        return manifest, frames
+    except Exception as e:
+        get_run_logger().warning(f"Staging cache unavailable for {file}: {e}")
+        return None
+
+
+def run_file_pipeline(bucket: str, file: str, lease_owner: str | None = None) -> dict:
+    """
+    Ejecuta la cadena completa (extract → parse → transform → load) de un archivo.
+    Si el contenido coincide con la última carga exitosa se marca 'ready' sin procesarlo;
+    si solo una hoja cambió, se ejecuta únicamente su rama.
+    Los DataFrames preparados se guardan en la caché de staging por (archivo, etag, versión):
+    un reintento, o otro worker, retoma desde ahí y omite la descarga y el parseo.
+    Las ramas copian a tablas de staging y una sola transacción publica ambas cargas y el estado
+    'ready': si una rama falla no queda nada a medias y el reintento no duplica datos.
+    La publicación exige que el archivo conserve el etag leído al inicio y el lease de `lease_owner`:
+    una subida nueva durante el proceso no queda marcada 'ready' con los datos de la anterior.
+    Un error solo afecta a este archivo: se incrementan sus reintentos y se reporta como fallido.
+    """
     logger = get_run_logger()
-    logger.info("ETL Initialization")
+    logger.info(f"Start processing for file {file}")
+    start = time.perf_counter()
+    success = False
+    try:
+        record = get_state_record(file)
+        etag = record["etag"] if record else None
+        previous = get_state_digests(file)
+        staged = load_staged(file, etag, previous)
+
+        with ExitStack() as resources:
+            if staged is not None:
+                # Reintento: digests y DataFrames desde la caché, sin descargar el libro
+                manifest, frames = staged
+                content_digest, digests = manifest["content_digest"], manifest["sheet_digests"]
+                logger.info(f"Resuming {file} from staging cache ({', '.join(frames) or 'no sheet changes'})")
+            else:
+                # 1. Extraer los datos desde MinIO
+                # Esto devuelve un archivo temporal (memoria o disco) con el excel completo y su digest
+                source, content_digest = extract_data_spooled(bucket, file)
+                resources.enter_context(source)
+                frames = {}
+
+            if content_digest == previous["content_digest"]:
+                # Mismo contenido que la última carga exitosa (re-subida o copia idéntica): solo se marca 'ready'
+                publish_file_load(file, [], etag, lease_owner)
+                logger.info(f"File {file} unchanged since last successful load, skipping")
+                return {"file": file, "success": True, "elapsed": time.perf_counter() - start}
+
+            if staged is None:
+                digests = sheet_digests(source)
+                if etag is not None:
+                    try:
+                        save_manifest(file, etag, {"content_digest": content_digest, "sheet_digests": digests})
+                    except Exception as e:
+                        logger.warning(f"Could not stage manifest for {file}: {e}")
+
+            # Una rama se ejecuta si su hoja cambió (o no se pudo calcular su digest)
+            run_program = digests.get("Program") is None or digests["Program"] != previous[SHEET_DIGEST_COLUMNS["Program"]]
+            run_ifr = digests.get("IFR") is None or digests["IFR"] != previous[SHEET_DIGEST_COLUMNS["IFR"]]
+
+            # El libro se abre una sola vez (si hay que parsear) y ambas ramas leen su hoja del mismo manejador.
+            # Las ramas son independientes: se envían como tareas concurrentes a un runner de hilos
+            # propio del archivo (el libro en memoria no puede viajar a otro proceso). Los parseos no se
+            # solapan (retienen el GIL); solo la carga de una rama se solapa con el parseo de la otra.
+            workbook = resources.enter_context(WorkbookHandle(source)) if staged is None else None
+            with ThreadPoolTaskRunner(max_workers=2) as branch_runner:
+                branches = {}
+                if run_program:
+                    # --- RAMA 1: PROGRAM ---
+                    logger.info("--- Processing Branch: Program ---")
+                    if "Program" in frames:
+                        df_program_clean = frames["Program"]
+                    else:
+                        # a) Parsear hoja Program
+                        df_program_raw = branch_runner.submit(parse_excel_sheet, {"data": workbook, "sheet_name": "Program"})
+                        # b) Limpiar (reutilizando lógica) y guardar en la caché de staging
+                        df_program_clean = branch_runner.submit(clean_dataframe, {"df": df_program_raw, "context_name": "Program"})
+                        df_program_clean = branch_runner.submit(stage_dataframe, {"df": df_program_clean, "file_name": file, "etag": etag, "sheet": "Program"})
+                    # c) Cargar a tabla 'program' (o nombre derivado del archivo)
+                    branches["Program"] = branch_runner.submit(load_data_program, {"df": df_program_clean, "table_name": "program", "file_name": file, "lease_owner": lease_owner})
+                else:
+                    logger.info("--- Skipping Branch: Program (sheet unchanged) ---")
+
+                if run_ifr:
+                    # --- RAMA 2: IFR ---
+                    logger.info("--- Processing Branch: IFR ---")
+                    if "IFR" in frames:
+                        df_ifr_transfrom = frames["IFR"]
+                    else:
+                        # a) transforma la data de la hora ifr y la guarda en la caché de staging
+                        df_ifr_transfrom = branch_runner.submit(transform_ifr_excel, {"file_content": workbook})
+                        df_ifr_transfrom = branch_runner.submit(stage_dataframe, {"df": df_ifr_transfrom, "file_name": file, "etag": etag, "sheet": "IFR"})
+                    # b) Cargar a tabla 'ifr'
+                    branches["IFR"] = branch_runner.submit(load_data_ifr, {"df": df_ifr_transfrom, "file_name": file, "lease_owner": lease_owner})
+                else:
+                    logger.info("--- Skipping Branch: IFR (sheet unchanged) ---")
+
+                # Se esperan ambas ramas antes de cerrar el libro
+                wait(list(branches.values()))
+
+            # Si cualquiera falla, falla el archivo y se descarta el staging de la otra rama
+            try:
+                staged = [future.result() for future in branches.values()]
+            except Exception:
+                discard_staged_versions([future.result() for future in branches.values() if future.state.is_completed()])
+                raise
+
+        # Si ambas ramas tuvieron éxito, sus cargas, los digests y el estado 'ready' se publican en una sola transacción
+        with measure_stage("publish"):
+            merges = publish_file_load(file, [version for version in staged if version], etag, lease_owner, content_digest=content_digest, **{
+                SHEET_DIGEST_COLUMNS[sheet]: digests[sheet] for sheet in branches if digests.get(sheet)
+            })
+        for merge in merges:
+            logger.info(f"IFR merged into version {merge['id_version']}: {merge['merged']} rows inserted/updated, {merge['deleted']} deleted")
+        success = True
+        logger.info(f"File {file} processed successfully ({' + '.join(branches) or 'no sheet changes'})")
+
+        # La entrada de staging ya no se necesita
+        if etag is not None:
+            try:
+                discard_entry(file, etag)
+            except Exception as e:
+                logger.warning(f"Could not discard staging cache entry of {file}: {e}")
+
+    except StaleFileStateError as e:
+        # Llegó una versión nueva del archivo (o se perdió el lease): no es un fallo de esta versión,
+        # la nueva queda pendiente sin reintentos consumidos
+        logger.warning(f"Load of {file} not published: {e}")
+
+    except Exception as e:
+        # Si falla CUALQUIERA de las dos ramas, marcamos error en el archivo
+        increment_retries(file)
+        logger.error(f"Failed processing file {file}: {e}")
 
-    files = get_pending_files()
+    return {"file": file, "success": success, "elapsed": time.perf_counter() - start}
 
-    for file in files:
-        logger.info(f"Start processing for file {file}")
+
+@task(name="Process File", cache_policy=NO_CACHE)
+@profiled(mode_arg="profile")
+def process_file(bucket: str, file: str, lease_owner: str | None = None, profile: str | None = None) -> dict:
+    """
+    Procesa un archivo midiendo cada etapa (bytes, filas, tiempo real, CPU y pico de RSS).
+    Las métricas se guardan en 'run_metrics' y se retornan junto al resultado para el artefacto del flujo.
+    Al terminar (con éxito o no) libera el lease que `lease_owner` tiene sobre el archivo.
+    `profile` fija el modo de perfilado del archivo (se pasa explícito porque el runner de procesos no comparte contexto).
+    """
+    logger = get_run_logger()
+    with collect_metrics(file) as metrics:
         try:
-            # 1. Extraer los datos desde MinIO 
-            # Esto devuelve los bytes del archivo excel completo
-            raw_bytes = extract_data(bucket, file)
+            # El lease se renueva mientras dura el archivo, aunque tarde más que STATE_LEASE_SECONDS
+            with keep_lease(file, lease_owner) if lease_owner else nullcontext():
+                result = run_file_pipeline(bucket, file, lease_owner)
+        finally:
+            if lease_owner:
+                release_lease(file, lease_owner)
+
+    records = metrics.records + [metrics.total(result["elapsed"])]
+    try:
+        check_latency_regression(records[-1])
+        insert_run_metrics(flow_run.id, records)
+    except Exception as e:
+        # Las métricas no deben hacer fallar el archivo
+        logger.warning(f"Could not store metrics for {file}: {e}")
+
+    return {**result, "metrics": records}
+
+
+def check_latency_regression(total: dict):
+    """
+    Advierte si el tiempo total del archivo supera METRICS_REGRESSION_FACTOR veces
+    la mediana de los archivos recientes (0 desactiva la verificación).
+    """
+    if settings.METRICS_REGRESSION_FACTOR <= 0:
+        return
+    baseline = get_stage_baseline("total")
+    if baseline and total["wall_time"] > baseline * settings.METRICS_REGRESSION_FACTOR:
+        get_run_logger().warning(
+            f"Latency regression for {total['file_path']}: {total['wall_time']:.2f}s "
+            f"vs median {baseline:.2f}s of recent files"
+        )
+
+
+def publish_metrics_artifact(results: list[dict]):
+    """
+    Publica las métricas por archivo y etapa de la ejecución como un artefacto de tabla de Prefect.
+    """
+    rows = [
+        {
+            "file": record["file_path"],
+            "stage": record["stage"],
+            "wall_s": round(record["wall_time"], 3),
+            "cpu_s": round(record["cpu_time"], 3),
+            "rows": record["rows"],
+            "bytes": record["bytes"],
+            "peak_rss_mb": round(record["peak_rss"] / 1024 / 1024, 1),
+            "rss_delta_mb": round(record["rss_delta"] / 1024 / 1024, 1) if record["rss_delta"] is not None else None,
+        }
+        for result in results
+        for record in result.get("metrics", [])
+    ]
+    if rows:
+        create_table_artifact(key="etl-stage-metrics", table=rows, description="Métricas por archivo y etapa del ETL")
+
+
+def build_task_runner():
+    """
+    Retorna el task runner configurado en ETL_TASK_RUNNER.
+    'process' evita el GIL durante el parseo del Excel; 'thread' comparte caché y pool de conexiones.
+    """
+    if settings.ETL_TASK_RUNNER == "process":
+        return ProcessPoolTaskRunner(max_workers=settings.ETL_MAX_CONCURRENCY)
+    return ThreadPoolTaskRunner(max_workers=settings.ETL_MAX_CONCURRENCY)
+
+
+@flow(task_runner=build_task_runner())
+@profiled(mode_arg="profile")
+def etl_flow(bucket: str = settings.BUCKET_NAME, files: list[str] | None = None, profile: str | None = None):
+    """
+    Flujo ETL principal: Procesa Program e IFR desde el mismo archivo.
+    Con `files` solo se procesan esos archivos (si están pendientes), por ejemplo
+    el objeto notificado por event_watcher; sin él, todos los pendientes.
+    Cada archivo se reclama con un lease en 'state', por lo que varias ejecuciones (o workers)
+    simultáneas no procesan el mismo archivo. Con ETL_MAX_CONCURRENCY > 1 hay hasta ese número de
+    archivos en proceso y, apenas termina uno, se reclama el siguiente; con 1 uno tras otro.
+    `profile` ("cprofile", "tracemalloc" o "both") perfila esta ejecución sin cambiar PROFILE_MODE.
+    """
+    logger = get_run_logger()
+    logger.info("ETL Initialization")
+    init_run_metrics_table()
+    # Tablas de staging cuyo worker ya no tiene el lease de su archivo (ejecución caída o archivo reclamado por otro)
+    dropped = drop_stale_staging_tables(settings.STATE_LEASE_SECONDS)
+    if dropped:
+        logger.info(f"Dropped {len(dropped)} stale staging tables")
+
+    lease_owner = f"{socket.gethostname()}:{flow_run.id or uuid.uuid4()}"
+    max_concurrency = max(settings.ETL_MAX_CONCURRENCY, 1)
+    attempted = []
+    results = []
+    in_flight = []
+    start = time.perf_counter()
 
-            # --- RAMA 1: PROGRAM ---
-            logger.info("--- Processing Branch: Program ---")
-            # a) Parsear hoja Program
-            df_program_raw = parse_excel_sheet(raw_bytes, sheet_name="Program")
-            # b) Limpiar (reutilizando lógica)
-            df_program_clean = clean_dataframe(df_program_raw, context_name="Program")
-            # c) Cargar a tabla 'program' (o nombre derivado del archivo)
-            load_data_program(df_program_clean, "program", file)
+    while True:
+        # Se reclaman solo los archivos que caben en los slots libres: cada lease corresponde a un archivo en proceso.
+        # Los ya intentados en esta ejecución no se vuelven a reclamar (un fallo se reintenta en la siguiente)
+        claimed = claim_pending_files(lease_owner, limit=max_concurrency - len(in_flight), files=files, exclude=attempted)
+        attempted.extend(claimed)
 
+        if max_concurrency == 1:
+            if not claimed:
+                break
+            results.append(process_file(bucket, claimed[0], lease_owner, profile))
+            continue
 
-            # --- RAMA 2: IFR ---
-            logger.info("--- Processing Branch: IFR ---")
-            # a) transforma la data de la hora ifr
-            df_ifr_transfrom = transform_ifr_excel(raw_bytes)
-            # b) Cargar a tabla 'ifr'
-            load_data_ifr(df_ifr_transfrom, file)
+        in_flight.extend(process_file.submit(bucket, file, lease_owner, profile) for file in claimed)
+        if not in_flight:
+            break
+        # Apenas termina un archivo se reclama el siguiente, sin esperar al resto de los que están en proceso
+        done = next(as_completed(in_flight))
+        in_flight.remove(done)
+        results.append(done.result())
 
+    if results:
+        # Speedup estimado = suma de los tiempos por archivo (≈ camino serial) / tiempo real del flujo
+        wall_time = time.perf_counter() - start
+        serial_time = sum(r["elapsed"] for r in results)
+        failed = sum(not r["success"] for r in results)
+        logger.info(
+            f"Processed {len(results)} files ({failed} failed) in {wall_time:.2f}s "
+            f"with {settings.ETL_TASK_RUNNER} concurrency {settings.ETL_MAX_CONCURRENCY}; serial time {serial_time:.2f}s, "
+            f"estimated speedup x{serial_time / wall_time:.2f}"
+        )
+        publish_metrics_artifact(results)
 
-            # Si ambas ramas tuvieron éxito, actualizamos estado
-            update_status(file, 'ready')
-            logger.info(f"File {file} processed successfully (Program + IFR)")
+    # Limpieza de la caché de staging por antigüedad y tamaño
+    try:
+        evict_staging_cache()
+    except Exception as e:
+        logger.warning(f"Could not evict staging cache: {e}")
 
-        except Exception as e:
-            # Si falla CUALQUIERA de las dos ramas, marcamos error en el archivo
-            increment_retries(file)
-            logger.error(f"Failed processing file {file}: {e}")
+    logger.info(f"Database pool stats: {get_pool_stats()}")
 
 if __name__ == "__main__":
-    etl_flow()
\ No newline at end of file
+    etl_flow()
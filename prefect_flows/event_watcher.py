@@ -0,0 +1,100 @@
+import time
+from datetime import datetime, timezone
+from prefect import flow, get_run_logger
+from prefect.deployments import run_deployment
+from prefect.logging import get_logger
+from config import settings
+from database.db_state import get_state_record, has_pending_state, init_state_table, upsert_state_records
+from prefect_flows.monitor_storage import monitor_storage
+from prefect_flows.utils.profiling import profiled
+from prefect_flows.utils.sotrage_observer import EventStorageObserver
+
+logger = get_logger("prefect_flows.event_watcher")
+
+# Deployment del ETL que se dispara por cada archivo notificado (ver etl_deployment.py)
+ETL_DEPLOYMENT_NAME = "etl-flow/etl_api_trigger"
+
+
+def trigger_etl(files: list[str] | None, inline: bool = False):
+    """
+    Dispara el ETL para los archivos indicados (None = todos los pendientes).
+    Por defecto crea una ejecución del deployment sin esperarla; con inline ejecuta el flujo en este proceso.
+    """
+    if inline:
+        from prefect_flows.etl_flow import etl_flow
+        etl_flow(files=files)
+    else:
+        run_deployment(name=ETL_DEPLOYMENT_NAME, parameters={"files": files}, timeout=0)
+
+
+# Registra el archivo notificado como pendiente y dispara el ETL solo para ese objeto.
+# Si el etag ya está registrado (evento duplicado o ya detectado por la reconciliación) no hace nada.
+@flow(name="storage-event")
+@profiled
+def handle_storage_event(metadata: dict, inline: bool = False):
+    logger = get_run_logger()
+    file_path = metadata["file_path"]
+
+    record = get_state_record(file_path)
+    if record and record["etag"] == metadata["etag"]:
+        logger.info(f"Event for {file_path!r} already registered (etag {metadata['etag']})")
+        return
+
+    upsert_state_records([{
+        "file_path": file_path,
+        "etag": metadata["etag"],
+        "last_modified": metadata["last_modified"],
+        "status": "pending",
+        "retries": 0,
+        "last_checked": datetime.now(timezone.utc)
+    }])
+    logger.info(f"File {file_path!r} registered from storage event, triggering ETL")
+    trigger_etl([file_path], inline)
+
+
+def reconcile(inline: bool = False):
+    """
+    Registra los cambios ocurridos mientras no se escuchaban eventos (listado completo del bucket)
+    y dispara el ETL si quedaron archivos pendientes.
+    """
+    monitor_storage()
+    if has_pending_state():
+        trigger_etl(None, inline)
+
+
+def build_event_observer() -> EventStorageObserver:
+    """
+    Retorna el observador de eventos configurado en STORAGE_EVENTS_SOURCE.
+    """
+    if settings.STORAGE_EVENTS_SOURCE == "file":
+        from prefect_flows.utils.file_event_observer import FileEventObserver
+        return FileEventObserver()
+    from prefect_flows.utils.minio_client import MinioNotificationObserver
+    return MinioNotificationObserver()
+
+
+def run_event_watcher(observer: EventStorageObserver, inline: bool = False):
+    """
+    Escucha las notificaciones del almacenamiento de forma indefinida.
+    Al iniciar y después de cada reconexión reconcilia con el listado completo;
+    monitor_storage y watcher_flow siguen desplegados como respaldo periódico.
+    """
+    init_state_table()
+    while True:
+        try:
+            reconcile(inline)
+            for metadata in observer.watch_changes():
+                handle_storage_event(metadata, inline)
+        except Exception as e:
+            logger.warning(f"Storage event listener interrupted: {e}. Reconnecting in {settings.STORAGE_EVENTS_RECONNECT_DELAY}s")
+            time.sleep(settings.STORAGE_EVENTS_RECONNECT_DELAY)
+
+
+# Proceso de larga duración: python prefect_flows/event_watcher.py [--inline]
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Dispara etl_flow a partir de las notificaciones del bucket")
+    parser.add_argument("--inline", action="store_true", help="ejecuta etl_flow en este proceso en lugar del deployment")
+    args = parser.parse_args()
+    run_event_watcher(build_event_observer(), args.inline)
@@ -3,28 +3,28 @@ from datetime import datetime, timezone
 from prefect.cache_policies import NO_CACHE
 from database.db_state import (
     init_state_table,
-    create_state_record,
-    get_state_record,
-    update_state_record
+    get_all_state_etags,
+    upsert_state_records
 )
 from prefect_flows.utils.minio_client import MinioStorageObserver
+from prefect_flows.utils.profiling import profiled
 
 # Inicializa la tabla de estado si aún no existe
 @task
 def initialize_state_table():
     init_state_table()
 
-# Detecta archivos nuevos o modificados en MinIO comparando el etag con el registro en base de datos
+# Detecta archivos nuevos o modificados en MinIO comparando el etag con el registro en base de datos.
+# El listado ya trae los metadatos y los etags conocidos se cargan en una sola consulta: la comparación es en memoria.
 @task(cache_policy=NO_CACHE)
 def detect_changes(observer: MinioStorageObserver):
+    known_etags = get_all_state_etags()
     changed_files = []
-    for file in observer.list_files():
-        metadata = observer.get_file_metadata(file)
-        state = get_state_record(file)
+    for metadata in observer.iter_files_metadata():
         # Si no existe registro o el etag ha cambiado, se marca como modificado
-        if not state or state["etag"] != metadata["etag"]:
+        if known_etags.get(metadata["file_path"]) != metadata["etag"]:
             changed_files.append({
-                "file_path": file,
+                "file_path": metadata["file_path"],
                 "etag": metadata["etag"],
                 "last_modified": metadata["last_modified"],
                 "status": "pending",
@@ -33,17 +33,14 @@ def detect_changes(observer: MinioStorageObserver):
             })
     return changed_files
 
-# Crea o actualiza los registros en la tabla de estado según los cambios detectados
+# Crea o actualiza los registros en la tabla de estado según los cambios detectados (un solo upsert masivo)
 @task
 def update_state(changed_files: list[dict]):
-    for record in changed_files:
-        if get_state_record(record["file_path"]):
-            update_state_record(record)
-        else:
-            create_state_record(record)
+    upsert_state_records(changed_files)
 
 # Flujo principal: observa el almacenamiento, detecta cambios y actualiza el estado de los archivos
 @flow
+@profiled
 def monitor_storage():
     initialize_state_table()
     observer = MinioStorageObserver()
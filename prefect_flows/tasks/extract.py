@@ -1,8 +1,18 @@
+import hashlib
+import re
+from tempfile import SpooledTemporaryFile
 from prefect import get_run_logger, task
+from config import settings
 from database.db_state import increment_retries, update_status
+from prefect_flows.utils.metrics import measure_stage
 from prefect_flows.utils.minio_client import get_minio_client
+from prefect_flows.utils.profiling import profiled
+
+# Un etag de objeto subido en una sola parte es el MD5 del contenido (los multipart terminan en "-N")
+MD5_ETAG = re.compile(r"^[0-9a-f]{32}$")
 
 @task
+@profiled
 def extract_data(bucket_name: str, file_name: str) -> bytes:
     """
     Descarga un archivo desde MinIO y actualiza su estado en la base de datos.
@@ -33,6 +43,7 @@ def extract_data(bucket_name: str, file_name: str) -> bytes:
     return data
 
 @task
+@profiled
 def extract_data_ifr(bucket_name: str, file_name: str) -> bytes:
     """
     Descarga un archivo desde MinIO y actualiza su estado en la base de datos.
@@ -60,4 +71,56 @@ def extract_data_ifr(bucket_name: str, file_name: str) -> bytes:
         increment_retries(file_name)
         logger.error(f"Error extracting {file_name!r}: {e}")
 
-    return data
\ No newline at end of file
+    return data
+
+
+@task
+@profiled
+def extract_data_spooled(bucket_name: str, file_name: str) -> tuple[SpooledTemporaryFile, str]:
+    """
+    Descarga un archivo desde MinIO por chunks hacia un archivo temporal en memoria
+    que pasa a disco al superar EXTRACT_SPOOL_MAX_SIZE, y lo retorna posicionado al inicio
+    junto con el digest SHA-256 del contenido (independiente del etag y del tipo de subida).
+    Mientras descarga calcula el MD5 y lo compara con el etag cuando el objeto no es multipart.
+    Si ocurre un error, incrementa el contador de reintentos y propaga la excepción.
+    """
+    logger = get_run_logger()
+    logger.info(f"Extracting data from {file_name!r}")
+
+    spool = SpooledTemporaryFile(max_size=settings.EXTRACT_SPOOL_MAX_SIZE)
+    try:
+        # Conexión al cliente MinIO y lectura del archivo remoto en streaming
+        client = get_minio_client()
+        with measure_stage("extract") as stage:
+            response = client.get_object(bucket_name, file_name)
+            md5 = hashlib.md5()
+            sha256 = hashlib.sha256()
+            size = 0
+            try:
+                for chunk in response.stream(settings.EXTRACT_CHUNK_SIZE):
+                    md5.update(chunk)
+                    sha256.update(chunk)
+                    spool.write(chunk)
+                    size += len(chunk)
+                etag = (response.headers.get("ETag") or "").strip('"')
+            finally:
+                # Liberar los recursos del stream de respuesta
+                response.close()
+                response.release_conn()
+            stage["bytes"] = size
+
+        if settings.EXTRACT_VERIFY_CHECKSUM and MD5_ETAG.match(etag) and md5.hexdigest() != etag:
+            raise ValueError(f"Checksum mismatch for {file_name!r}: md5 {md5.hexdigest()} != etag {etag}")
+        spool.seek(0)
+
+        # Actualizar estado del archivo en la base de datos
+        update_status(file_name, "extracting")
+        logger.info(f"Data extracted successfully ({size} bytes, spooled to {'disk' if size > settings.EXTRACT_SPOOL_MAX_SIZE else 'memory'})")
+        return spool, sha256.hexdigest()
+
+    except Exception as e:
+        # Si ocurre un error, cerrar el temporal y aumentar los reintentos
+        spool.close()
+        increment_retries(file_name)
+        logger.error(f"Error extracting {file_name!r}: {e}")
+        raise
@@ -1,16 +1,22 @@
 from config.settings import COLUMNS_SUMMARIE
-from database.db_ifr import copy_dataframe_to_table_ifr
+from database.db_ifr import init_ifr_table, stage_ifr_version
 from database.db_product_summarie import init_summary_table, insert_summaries_bulk
 from prefect import task, get_run_logger
 import pandas as pd
 
-from database.db_program import copy_dataframe_to_table, count_rows, init_products_table
+from database.db_program import count_rows, init_products_table, stage_dataframe_to_table
 from database.db_state import increment_retries, update_status
+from prefect_flows.utils.metrics import measured
+from prefect_flows.utils.profiling import profiled
 
 @task
-def load_data_program(df: pd.DataFrame, table_name: str, file_name: str):
+@profiled
+@measured("load_program", input_arg="df")
+def load_data_program(df: pd.DataFrame, table_name: str, file_name: str, lease_owner: str | None = None) -> dict | None:
     """
-    Carga los datos de un DataFrame en una tabla de la base de datos.
+    Copia los datos de un DataFrame a una tabla de staging de la tabla program y retorna
+    la versión preparada, que el flujo publica junto con el estado del archivo (publish_file_load).
+    `lease_owner` queda en la marca del staging (ver drop_stale_staging_tables).
     Si el proceso falla o el DataFrame está vacío, incrementa los reintentos
     asociados al archivo.
     """
@@ -21,21 +27,22 @@ def load_data_program(df: pd.DataFrame, table_name: str, file_name: str):
     if df.empty:
         logger.warning("Empty DataFrame")
         increment_retries(file_name)
-        return
+        return None
 
     try:
-        # Asegurar que la tabla de destino exista con la estructura adecuada
-        init_products_table(df, table_name)
+        # Asegurar que la tabla de destino exista con la estructura adecuada (agrega columnas nuevas de la hoja)
+        added = init_products_table(df, table_name)
+        if added:
+            logger.info(f"Added columns {added} to table {table_name!r}")
 
-        # Insertar los datos en la tabla program
-        copy_dataframe_to_table(df, table_name)
+        # Copiar los datos a la tabla de staging de la nueva versión
+        staged = stage_dataframe_to_table(df, table_name, file_name, lease_owner)
 
         # Actualizar el estado del archivo a "loading" en la base de datos
         update_status(file_name, 'loading')
 
-
-        
-        logger.info(f"Loading program Success")
+        logger.info(f"Staging program Success (version {staged['id_version']})")
+        return staged
 
     except Exception as e:
         # En caso de error, registrar y marcar el intento fallido
@@ -45,9 +52,13 @@ def load_data_program(df: pd.DataFrame, table_name: str, file_name: str):
 
 
 @task
-def load_data_ifr(df: pd.DataFrame, file_name: str):
+@profiled
+@measured("load_ifr", input_arg="df")
+def load_data_ifr(df: pd.DataFrame, file_name: str, lease_owner: str | None = None) -> dict | None:
     """
-    Carga los datos de un DataFrame en una tabla de la base de datos.
+    Copia los datos de un DataFrame a una tabla de staging de la tabla ifr y retorna
+    la versión preparada, que el flujo publica junto con el estado del archivo (publish_file_load).
+    `lease_owner` queda en la marca del staging (ver drop_stale_staging_tables).
     Si el proceso falla o el DataFrame está vacío, incrementa los reintentos
     asociados al archivo.
     """
@@ -58,17 +69,25 @@ def load_data_ifr(df: pd.DataFrame, file_name: str):
     if df.empty:
         logger.warning("Empty DataFrame")
         increment_retries(file_name)
-        return
+        return None
 
     try:
+        # Asegurar que la tabla ifr exista
+        added = init_ifr_table(df)
+        if added:
+            logger.info(f"Added columns {added} to table 'ifr'")
+
+        # Copiar los datos a la tabla de staging; en modo incremental se marcan para MERGE contra la versión previa
+        staged = stage_ifr_version(df, file_name, lease_owner)
 
-        #Inserta los datos en la tabla ifr
-        copy_dataframe_to_table_ifr(df)
-   
         # Actualizar el estado del archivo a "loading" en la base de datos
         update_status(file_name, 'loading')
 
-        logger.info(f"Loading IFR Success")
+        if staged.get("merge_into"):
+            logger.info(f"Staging IFR Success (merge into version {staged['merge_into']['id_version']})")
+        else:
+            logger.info(f"Staging IFR Success (version {staged['id_version']})")
+        return staged
 
     except Exception as e:
         # En caso de error, registrar y marcar el intento fallido
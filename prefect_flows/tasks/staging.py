@@ -0,0 +1,27 @@
+import pandas as pd
+from prefect import get_run_logger, task
+from prefect.cache_policies import NO_CACHE
+
+from prefect_flows.utils.metrics import measured
+from prefect_flows.utils.profiling import profiled
+from prefect_flows.utils.staging_cache import save_frame
+
+@task(name="Stage DataFrame", cache_policy=NO_CACHE)
+@profiled
+@measured("stage", input_arg="df")
+def stage_dataframe(df: pd.DataFrame, file_name: str, etag: str | None, sheet: str) -> pd.DataFrame:
+    """
+    Guarda el DataFrame ya preparado de una hoja en la caché de staging (Parquet) y lo retorna,
+    para que un reintento del archivo cargue desde ahí sin volver a descargar ni parsear el libro.
+    Un error al guardar solo se registra: la carga continúa con el DataFrame en memoria.
+    """
+    logger = get_run_logger()
+    if etag is None:
+        return df
+    try:
+        size = save_frame(file_name, etag, sheet, df)
+        if size:
+            logger.info(f"Staged {sheet} ({len(df)} rows, {size} bytes)")
+    except Exception as e:
+        logger.warning(f"Could not stage {sheet} for {file_name!r}: {e}")
+    return df
@@ -1,34 +1,109 @@
+import functools
+import numpy as np
 import pandas as pd
 from prefect import get_run_logger, task
-from io import BytesIO
+from prefect.cache_policies import NO_CACHE
 import unicodedata
 import re
 
-from database.db_destinations import get_all_destinations_and_country
-from database.db_packaging import get_all_packaging
-from database.db_product import get_all_products
+from database.db_master_data import get_master_data
+from config import settings
+from prefect_flows.utils.ifr_layout import detect_ifr_layout
+from prefect_flows.utils.metrics import measured
+from prefect_flows.utils.profiling import profiled
+from prefect_flows.utils.workbook import WorkbookHandle, as_workbook
+
+# Esquema de columnas de la hoja Program (nombre normalizado -> dtype), aplicado al leer la hoja.
+# Solo incluye las columnas que el ETL usa: "Año" (ver normalize_column_name), product (clave de
+# product_summaries) y los montos de COLUMNS_SUMMARIE, que se mantienen numéricos porque se suman.
+# El resto de la hoja queda con el tipo inferido por pandas.
+PROGRAM_SCHEMA = {
+    "anio": "Int16",
+    "product": "category",
+    "mt": "float64",
+    "bags": "Int32",
+    "kg": "float64",
+}
+SHEET_SCHEMAS = {"Program": PROGRAM_SCHEMA}
+
+
+def normalize_column_name(col) -> str:
+    """
+    Normaliza un nombre de columna del Excel: minúsculas, "año" -> "anio", sin acentos
+    y solo [a-z0-9_] (ej: "País Destino" -> "pais_destino").
+    """
+    # 1. Convertir a minúsculas y reemplazar espacios
+    col = str(col).lower().replace(' ', '_')
+    # 2. Reemplazo ESPECÍFICO para "año" -> "anio"
+    col = col.replace('año', 'anio')
+    # 3. Eliminar acentos y tildes
+    col = unicodedata.normalize('NFD', col).encode('ascii', 'ignore').decode("utf-8")
+    # 4. Reemplazar caracteres no alfanuméricos
+    col = re.sub(r'[^a-z0-9_]', '_', col)
+    # 5. Limpiar guiones bajos extra
+    return re.sub(r'__+', '_', col).strip('_')
+
+
+def apply_column_schema(df: pd.DataFrame, schema: dict[str, str]) -> tuple[pd.DataFrame, dict[str, str]]:
+    """
+    Convierte las columnas del DataFrame presentes en `schema` (por nombre normalizado) a su dtype.
+    Las conversiones son estrictas: una columna con valores que no calzan (decimales en un entero,
+    números en una fecha, etc.) se deja con el tipo inferido por pandas.
+    Retorna el DataFrame y las columnas que no se pudieron convertir (nombre -> error).
+    """
+    failed = {}
+    for col in df.columns:
+        dtype = schema.get(normalize_column_name(col))
+        if dtype is None or str(df[col].dtype) == dtype:
+            continue
+        try:
+            if dtype.startswith("datetime64"):
+                if pd.api.types.is_numeric_dtype(df[col]) and df[col].notna().any():
+                    raise TypeError("numeric values are not dates")
+                df[col] = pd.to_datetime(df[col]).astype(dtype)
+            else:
+                df[col] = df[col].astype(dtype)
+        except (TypeError, ValueError, OverflowError) as e:
+            failed[col] = str(e)
+    return df, failed
 
-@task(name="Parse Excel Sheet")
-def parse_excel_sheet(data: bytes, sheet_name: str, header_row: int = 0) -> pd.DataFrame:
+
+@task(name="Parse Excel Sheet", cache_policy=NO_CACHE)
+@profiled
+@measured("parse")
+def parse_excel_sheet(data: bytes | WorkbookHandle, sheet_name: str, header_row: int = 0) -> pd.DataFrame:
     """
-    Convierte los bytes del archivo en un DataFrame seleccionando una hoja específica.
+    Convierte el libro (bytes o WorkbookHandle ya abierto) en un DataFrame seleccionando una hoja específica.
+    Si la hoja tiene un esquema en SHEET_SCHEMAS, sus columnas se convierten a esos dtypes
+    y se registra la memoria del DataFrame antes y después.
     """
     logger = get_run_logger()
     logger.info(f"Parsing sheet '{sheet_name}'...")
     
     try:
-        df = pd.read_excel(
-            BytesIO(data), 
-            sheet_name=sheet_name, 
-            header=header_row, 
-            engine="openpyxl"
-        )
+        df = as_workbook(data).read_sheet(sheet_name, header=header_row)
+        schema = SHEET_SCHEMAS.get(sheet_name)
+        if schema:
+            missing = schema.keys() - {normalize_column_name(col) for col in df.columns}
+            if missing:
+                logger.warning(f"Sheet {sheet_name!r} has no columns {sorted(missing)} of its schema")
+            inferred_bytes = df.memory_usage(deep=True).sum()
+            df, failed = apply_column_schema(df, schema)
+            for col, error in failed.items():
+                logger.warning(f"Column {col!r} of sheet {sheet_name!r} kept as {df[col].dtype}: {error}")
+            typed_bytes = df.memory_usage(deep=True).sum()
+            logger.info(
+                f"Sheet {sheet_name!r} memory: {inferred_bytes / 1024 / 1024:.1f} MB inferred, "
+                f"{typed_bytes / 1024 / 1024:.1f} MB with schema ({inferred_bytes / max(typed_bytes, 1):.1f}x smaller)"
+            )
         return df
     except Exception as e:
         logger.error(f"Error parsing sheet {sheet_name}: {e}")
         raise e
 
 @task(name="Clean DataFrame")
+@profiled
+@measured("clean")
 def clean_dataframe(df: pd.DataFrame, context_name: str) -> pd.DataFrame:
     """
     Aplica la limpieza estándar (ñ, acentos, normalización) a un DataFrame ya cargado.
@@ -43,24 +118,7 @@ def clean_dataframe(df: pd.DataFrame, context_name: str) -> pd.DataFrame:
         df = df.dropna(thresh=max_nans)
         
         # --- Normalización de nombres de columnas ---
-        cols = df.columns.to_list()
-
-        # 1. Convertir a minúsculas y reemplazar espacios
-        cols = [str(col).lower().replace(' ', '_') for col in cols]
-
-        # 2. Reemplazo ESPECÍFICO para "año" -> "anio"
-        cols = [col.replace('año', 'anio') for col in cols]
-        
-        # 3. Eliminar acentos y tildes
-        cols = [unicodedata.normalize('NFD', col).encode('ascii', 'ignore').decode("utf-8") for col in cols]
-        
-        # 4. Reemplazar caracteres no alfanuméricos
-        cols = [re.sub(r'[^a-z0-9_]', '_', col) for col in cols]
-
-        # 5. Limpiar guiones bajos extra
-        cols = [re.sub(r'__+', '_', col).strip('_') for col in cols]
-        
-        df.columns = cols
+        df.columns = [normalize_column_name(col) for col in df.columns]
         
         logger.info(f"Data cleaned successfully for {context_name}")
         return df
@@ -69,285 +127,229 @@ def clean_dataframe(df: pd.DataFrame, context_name: str) -> pd.DataFrame:
         logger.error(f"Error cleaning dataframe for {context_name}: {e}")
         raise e
 
-def classify_row(val_a, val_f):
-    """
-    Aplica TU lógica de validación
-    """
-    # Limpieza segura de inputs (evita errores con NaN)
-    is_a_nan = pd.isna(val_a)
-    texto = str(val_a).strip() if not is_a_nan else ""
-    
-    is_f_nan = pd.isna(val_f)
-    texto_col_f = str(val_f).strip().lower() if not is_f_nan else ""
-
-    # --- 1. VALIDACIÓN DE MÉTRICAS (Literales Exactos) ---
-    # Mapeamos el texto del Excel al nombre de columna en la BD
-    metrics_map = {
-        'Arrivals + Sailed': 'arrivals_sailed',
-        'Planned (w/booking)': 'planned_wbooking',
-        'To be booked': 'to_be_booked',
-        'Sales': 'sales',
-        'Adjustments': 'adjustments',
-        'Final Inv.': 'final_inv'
-    }
-    
-    if texto in metrics_map:
-        return 'metric', metrics_map[texto]
+# Versión de la salida de clean_dataframe/transform_ifr_excel: incrementarla al cambiar los
+# DataFrames que producen, para que la caché de staging no reutilice resultados anteriores
+TRANSFORM_VERSION = 3
 
-    # --- 2. VALIDACIÓN MOS (Tu lógica ajustada) ---
-    # Si texto (Col C) es NaN y Col F es 'mos'
-    if is_a_nan: 
-        if texto_col_f == 'mos':
-            return 'metric', 'mos'
-        return None, None # Es NaN pero no es MOS
+# Mapeamos el texto del Excel (Col C) al nombre de columna en la BD
+METRICS_MAP = {
+    'Arrivals + Sailed': 'arrivals_sailed',
+    'Planned (w/booking)': 'planned_wbooking',
+    'To be booked': 'to_be_booked',
+    'Sales': 'sales',
+    'Adjustments': 'adjustments',
+    'Final Inv.': 'final_inv'
+}
 
-    # --- 3. VALIDACIÓN DE HEADER (Tus 3 Reglas de Split) ---
-    
-    # REGLA 1: Separar por "-" debe dar longitud 1 o 2
-    partes_guion = texto.split(' - ')
-    if len(partes_guion) not in [1, 2]:
-        return None, None
-    
-    # REGLA 2: Primer elemento split por espacios -> longitud 3
-    # Ejemplo: "1.1.1.1 Wil (CRY/CL"
-    primer_elemento = partes_guion[0].strip()
-    partes_espacio = primer_elemento.split()
-    
-    if len(partes_espacio) != 3:
-        return None, None
 
-    # REGLA 3: Tercer elemento split por "/" -> longitud 2
-    # Ejemplo: "(CRY/CL"
-    tercer_elemento = partes_espacio[2]
-    partes_slash = tercer_elemento.split('/')
-    
-    if len(partes_slash) != 2:
-        return None, None
+# Header ya separado por el primer " - ": "1.1.1.1 Wil (CRY/CL" -> código, filial, producto, inicio del envase
+HEADER_PATTERN = r'^(?P<codigo>\S+)\s+(?P<filial>\S+)\s+(?P<producto>[^\s/]*)/(?P<envase>[^\s/]*)$'
+HEADER_RE = re.compile(HEADER_PATTERN)
+HEADER_SEPARATOR = " - "
 
-    # --- SI PASA LAS REGLAS, EXTRAEMOS LA DATA ---
-    try:
-        # Usamos las mismas partes que ya validamos
-        # partes_espacio = ['1.1.1.1', 'Wil', '(CRY/CL']
-        codigo = partes_espacio[0]
-        filial = partes_espacio[1]
-        
-        # partes_slash = ['(CRY', 'CL']
-        producto = partes_slash[0].replace('(', '')
-        
-        # Reconstrucción del envase
-        envase_inicio = partes_slash[1] # "CL"
-        envase_fin = partes_guion[1] if len(partes_guion) == 2 else "" # "50L)"
-        
-        raw_envase = f"{envase_inicio} {envase_fin}" if envase_fin else envase_inicio
-        envase = raw_envase.replace(')', '').strip('-')
-
-        return 'header', {
-            "filial": filial,
-            "producto": producto,
-            "envase": envase
-        }
-    except Exception:
+# Tipos de fila de IFR; las filas que no son header ni métrica quedan como NA
+ROW_TYPES = pd.CategoricalDtype(["header", "metric"])
+# Clasificación de una etiqueta: (tipo, métrica, filial, producto, envase)
+UNCLASSIFIED = (None, None, None, None, None)
+# Etiquetas distintas recordadas entre archivos (los headers se repiten en cada libro)
+LABEL_CACHE_SIZE = 65536
+
+
+@functools.lru_cache(maxsize=LABEL_CACHE_SIZE)
+def classify_label(texto: str) -> tuple:
+    """
+    Clasifica una etiqueta no vacía de la columna C (ya sin espacios en los extremos):
+    métrica por literal exacto de METRICS_MAP o header "código filial (producto/envase[ - fin])".
+    Retorna (tipo, métrica, filial, producto, envase); UNCLASSIFIED si no es ninguna.
+    """
+    metric = METRICS_MAP.get(texto)
+    if metric is not None:
+        return "metric", metric, None, None, None
+
+    # Un header tiene a lo más un " - ": la primera parte trae código, filial y producto/envase
+    head, _, envase_fin = texto.partition(HEADER_SEPARATOR)
+    if HEADER_SEPARATOR in envase_fin:
+        return UNCLASSIFIED
+    match = HEADER_RE.match(head.strip())
+    if match is None:
+        return UNCLASSIFIED
+
+    # Reconstrucción del envase: "CL" + "50L)" -> "CL 50L"
+    raw_envase = f"{match['envase']} {envase_fin}" if envase_fin else match["envase"]
+    return (
+        "header",
+        None,
+        match["filial"],
+        match["producto"].replace("(", ""),
+        raw_envase.replace(")", "").strip("-"),
+    )
+
+
+def classify_row(val_a, val_f):
+    """
+    Clasifica una fila de IFR a partir de la columna C (val_a) y la columna F (val_f).
+    Retorna ('metric', nombre), ('header', {filial, producto, envase}) o (None, None).
+    """
+    if pd.isna(val_a):
+        # Col C vacía: solo es métrica si Col F dice MOS
+        if not pd.isna(val_f) and str(val_f).strip().lower() == "mos":
+            return "metric", "mos"
         return None, None
 
+    row_type, metric, filial, producto, envase = classify_label(str(val_a).strip())
+    if row_type == "metric":
+        return row_type, metric
+    if row_type == "header":
+        return row_type, {"filial": filial, "producto": producto, "envase": envase}
+    return None, None
 
 
-@task(name="Transform IFR Excel")
-def transform_ifr_excel(file_content: bytes) -> pd.DataFrame:
+def classify_ifr_column(col_c: pd.Series, col_f: pd.Series) -> pd.DataFrame:
+    """
+    Versión columnar de classify_row: clasifica todas las filas de la hoja de una vez.
+    Cada etiqueta distinta se clasifica una sola vez (y queda memorizada entre archivos);
+    el resultado se expande a las filas por sus códigos de factorización.
+    Retorna un DataFrame con el mismo índice y las columnas 'row_type' (categórica: 'header',
+    'metric' o NA) y 'metric', 'filial', 'producto', 'envase' (texto, NA si no aplica).
+    """
+    codes, labels = pd.factorize(col_c.to_numpy(dtype=object), use_na_sentinel=True)
+    table = [classify_label(str(label).strip()) for label in labels]
+    # Fila extra para el código -1 (Col C vacía), que resuelve la regla MOS
+    table.append(UNCLASSIFIED)
+    fields = list(zip(*table))
+
+    flag_codes, flags = pd.factorize(col_f.to_numpy(dtype=object), use_na_sentinel=True)
+    mos_flags = np.array([str(flag).strip().lower() == "mos" for flag in flags] + [False])
+    is_mos = (codes == -1) & mos_flags[flag_codes]
+
+    def expand(values, mos_value=None):
+        column = np.asarray(values, dtype=object)[codes]
+        if mos_value is not None:
+            column[is_mos] = mos_value
+        return column
+
+    return pd.DataFrame(
+        {
+            "row_type": pd.Categorical(expand(fields[0], "metric"), dtype=ROW_TYPES),
+            "metric": pd.array(expand(fields[1], "mos"), dtype="string"),
+            "filial": pd.array(expand(fields[2]), dtype="string"),
+            "producto": pd.array(expand(fields[3]), dtype="string"),
+            "envase": pd.array(expand(fields[4]), dtype="string"),
+        },
+        index=col_c.index,
+    )
+
+
+@task(name="Transform IFR Excel", cache_policy=NO_CACHE)
+@profiled
+@measured("transform")
+def transform_ifr_excel(file_content: bytes | WorkbookHandle) -> pd.DataFrame:
     logger = get_run_logger()
 
-    # --- 1. OBTENCIÓN DE DATOS PARAMÉTRICOS (DESDE BD) ---
+    # --- 1. OBTENCIÓN DE DATOS PARAMÉTRICOS (CACHÉ DE MAESTROS) ---
+    # Diccionarios de búsqueda ya normalizados (minúsculas), compartidos entre archivos
     logger.info("Obteniendo maestros de base de datos...")
-    packaging_list = get_all_packaging()
-    destinations_list = get_all_destinations_and_country()
-    products_list = get_all_products()
-    
-    # --- 2. CREACIÓN DE DICCIONARIOS DE BÚSQUEDA (HASH MAPS) ---
-    # Convertimos las listas en diccionarios para búsqueda rápida y normalizada (minusculas)
-    
-    # Mapa: 'cry9000.00' -> id_product
-    map_products = {
-        p['product_name'].strip().lower(): p['id_product'] 
-        for p in products_list if p['product_name']
-    }
-    
-    # Mapa: 'cl-50l' -> id_packaging
-    map_packaging = {
-        p['packaging_code'].strip().lower(): p['id_packaging'] 
-        for p in packaging_list if p['packaging_code']
-    }
-    
-    # Mapa: 'wilmington' -> {'id': id_destination, 'country': 'USA'}
-    map_destinations = {
-        d['destination_name'].strip().lower(): {'id': d['id_destination'], 'country': d['country']} 
-        for d in destinations_list if d['destination_name']
-    }
+    master_data = get_master_data()
+    map_products = master_data["products"]
+    map_packaging = master_data["packaging"]
+    map_destinations = master_data["destinations"]
 
     # --- 3. LECTURA DEL EXCEL ---
-    # C=0, D=1, E=2, F=3, G=4 ...
-    df = pd.read_excel(BytesIO(file_content), sheet_name="IFR", header=None, engine="openpyxl", usecols="C:AE")
-
-    # Eliminar filas completamente vacías
-    df = df.dropna(how='all').reset_index(drop=True)
-
-    # --- 4. MAPA DE COLUMNAS (Fechas) ---
-    COLUMN_MAP = {
-        5: "01-2025",  
-        6: "02-2025",  
-        7: "03-2025",  
-        8: "04-2025",  
-        9: "05-2025",
-        10: "06-2025",
-        11: "07-2025",
-        12: "08-2025",
-        13: "09-2025",
-        14: "10-2025",
-        15: "11-2025",
-        16: "12-2025",
-        17: "01-2026",
-        18: "02-2026",
-        19: "03-2026",
-        20: "04-2026",
-        21: "05-2026",
-        22: "06-2026",
-        23: "07-2026",
-        24: "08-2026",
-        25: "09-2026",
-        26: "10-2026",
-        27: "11-2026",
-        28: "12-2026",
-    }
-
-    processed_rows = []
-    current_ids = None # Aquí guardaremos los IDs en lugar del texto
-
-    # --- 5. ITERACIÓN ---
-    # row[0]=Index, row[1]=Col C, ... row[4]=Col F ...
-    for row in df.itertuples(index=True):
-        
-        val_c = row[1] # Valor Columna C
-        
-        # Obtenemos valor de Col F (Index 4 si C es 0, D=1, E=2, F=3... espera)
-        # Nota: itertuples incluye el índice en posición 0.
-        # row[1] es la primera columna de datos (Col C).
-        # row[4] sería la cuarta columna de datos (Col F).
-        try:
-            val_f = row[4] 
-        except IndexError:
-            val_f = None
-
-        # --- CLASIFICACIÓN (Usa tu función existente classify_row) ---
-        if val_c == '3.4.1 Shanghai (MIC9000.00/CL-500)':
-            logger.warning(f"IFR 3.4.1 Shanghai (MIC9000.00/CL-500) Saltado")
-            continue
-        row_type, data = classify_row(val_c, val_f)
-
-        if row_type == 'header':
-            # Data trae: {'filial': 'Wilmington', 'producto': 'CRY...', 'envase': 'CL...', 'pais': '...'}
-            
-            # 1. Normalizar textos del Excel
-            txt_dest = str(data['filial']).strip().lower()
-            txt_prod = str(data['producto']).strip().lower()
-            txt_pack = str(data['envase']).strip().lower()
-
-            # 1.1 En caso de que el producto no contenga .00 al final, se le agrega
-            if not txt_prod.endswith('.00'):
-                if len(txt_prod.split()) == 1:
-                    txt_prod = txt_prod+'.00'
-            
-            # 2. Buscar IDs en los mapas
-            dest_info = map_destinations.get(txt_dest)
-            id_prod = map_products.get(txt_prod)
-            id_pack = map_packaging.get(txt_pack)
-
-            # 3. Lógica de Destino/País
-            if dest_info:
-                id_dest = dest_info['id']
-                country_real = dest_info['country']
-            else:
-                id_dest = None
-                # Si no cruza, usamos el país que derivamos del código en classify_row
-                country_real = data['pais'] 
-                logger.warning(f"Destino no encontrado en BD: '{txt_dest}'")
-
-            if not id_prod:
-                logger.warning(f"Producto no encontrado en BD: '{txt_prod}', Filial: {txt_dest}")
-            if not id_pack:
-                logger.warning(f"Envase no encontrado en BD: '{txt_pack}', Filial: {txt_dest}")
-
-            # 4. Actualizar metadatos actuales con IDs
-            current_ids = {
-                "id_destination": id_dest,
-                "country": country_real,
-                "id_product": id_prod,
-                "id_packaging": id_pack
-            }
-            continue 
-
-        elif row_type == 'metric':
-            if current_ids is None:
-                continue
-            
-            metric_key = data
-            is_mos = (metric_key == 'mos')
-
-            # --- EXTRACCIÓN HORIZONTAL ---
-            for col_idx, periodo in COLUMN_MAP.items():
-                try:
-                    # +1 para compensar el Index de la tupla
-                    raw_val = row[col_idx + 1]
-                except IndexError:
-                    raw_val = 0
-
-                # Limpieza de valores
-                val = None
-                if is_mos:
-                    if pd.notnull(raw_val):
-                        try:
-                            # Intentamos convertir a float y redondear a 2 decimales
-                            float_val = float(raw_val)
-                            val = str(round(float_val, 2))
-                        except:
-                            # Si falla (es texto), cortamos a 16 chars por seguridad
-                            val = str(raw_val)[:16]
-                    else:
-                        val = None
-                else:
-                    try:
-                        val = float(raw_val) if pd.notnull(raw_val) else 0.0
-                    except:
-                        val = 0.0
-
-                # Periodo Equivalente
-                try:
-                    mes, anio = periodo.split('-')
-                    per_eq = int(f"{anio}{mes}")
-                except:
-                    per_eq = 0
-
-                processed_rows.append({
-                    "id_destination": current_ids["id_destination"], # ID
-                    "country": current_ids["country"],
-                    "id_product": current_ids["id_product"],         # ID
-                    "id_packaging": current_ids["id_packaging"],     # ID
-                    "periodo": periodo,
-                    "periodoequivalente": col_idx - 4, #se resta 4 para que coincida con la numeracion de meses del 1 al 24 (dos años)
-                    "metric_type": metric_key,
-                    "value": val
-                })
-
-    # --- 6. PIVOT FINAL ---
-    if not processed_rows:
+    # La hoja se lee una sola vez: calamine parsea la hoja completa aunque se pidan pocas filas
+    # o columnas, así que el escaneo del layout y los datos salen de la misma lectura
+    sheet = as_workbook(file_content).read_sheet("IFR", header=None)
+    sheet.columns = range(sheet.shape[1])
+
+    # --- 4. LAYOUT DE LA HOJA ---
+    # Fila de períodos y columnas de etiquetas/MOS detectadas una vez por plantilla
+    layout, is_new = detect_ifr_layout(sheet, METRICS_MAP)
+    if is_new:
+        logger.info(f"New IFR template detected: {layout}")
+
+    # --- 5. CLASIFICACIÓN COLUMNAR ---
+    # Filas bajo el header de períodos con las columnas del layout, que conservan su posición en la hoja (A = 0)
+    df = layout.data_rows(sheet)
+    del sheet
+    label = df[layout.label_column]
+    skipped = label.isin(settings.IFR_SKIPPED_ROWS)
+    for val_c in label[skipped]:
+        logger.warning(f"IFR {val_c} Saltado")
+    df = df[~skipped]
+
+    mos_flag = df[layout.mos_column] if layout.mos_column is not None else pd.Series(None, index=df.index, dtype=object)
+    rows = classify_ifr_column(df[layout.label_column], mos_flag)
+    headers = rows[rows["row_type"] == "header"]
+    metrics = rows[rows["row_type"] == "metric"]
+
+    # --- 6. IDS DE CADA HEADER ---
+    # Normalizar textos del Excel
+    txt_dest = headers["filial"].str.strip().str.lower()
+    txt_prod = headers["producto"].str.strip().str.lower()
+    txt_pack = headers["envase"].str.strip().str.lower()
+
+    # En caso de que el producto no contenga .00 al final, se le agrega
+    needs_suffix = ~txt_prod.str.endswith(".00") & (txt_prod.str.split().str.len() == 1)
+    txt_prod = txt_prod.where(~needs_suffix, txt_prod + ".00")
+
+    dest_info = txt_dest.map(map_destinations)
+    header_ids = pd.DataFrame({
+        "id_destination": dest_info.map(lambda d: d["id"], na_action="ignore"),
+        "country": dest_info.map(lambda d: d["country"], na_action="ignore"),
+        "id_product": txt_prod.map(map_products),
+        "id_packaging": txt_pack.map(map_packaging),
+    }, index=headers.index)
+
+    # Avisos una sola vez por valor no encontrado
+    texts = pd.DataFrame({"dest": txt_dest, "prod": txt_prod, "pack": txt_pack})
+    for dest in texts.loc[dest_info.isna(), "dest"].unique():
+        logger.warning(f"Destino no encontrado en BD: '{dest}'")
+    for prod, dest in texts.loc[header_ids["id_product"].isna(), ["prod", "dest"]].drop_duplicates().itertuples(index=False):
+        logger.warning(f"Producto no encontrado en BD: '{prod}', Filial: {dest}")
+    for pack, dest in texts.loc[header_ids["id_packaging"].isna(), ["pack", "dest"]].drop_duplicates().itertuples(index=False):
+        logger.warning(f"Envase no encontrado en BD: '{pack}', Filial: {dest}")
+
+    # Cada métrica hereda los IDs del último header anterior (forward-fill de la posición del header)
+    header_pos = pd.Series(rows.index.where(rows["row_type"] == "header"), index=rows.index).ffill()
+    metrics = metrics[header_pos[metrics.index].notna()]
+    if metrics.empty:
         return pd.DataFrame()
-
-    df_flat = pd.DataFrame(processed_rows)
-    
-    # Pivotamos usando los nuevos campos de ID
-    df_pivoted = df_flat.pivot_table(
-        index=["id_destination", "country", "id_product", "id_packaging", "periodo", "periodoequivalente"], 
-        columns="metric_type", 
-        values="value",
-        aggfunc='first'
-    ).reset_index()
+    metric_ids = header_ids.loc[header_pos[metrics.index].astype(int)].reset_index(drop=True)
+
+    # --- 7. EXTRACCIÓN HORIZONTAL (todas las métricas x todos los períodos de una vez) ---
+    period_cols = layout.period_columns
+    raw = df.loc[metrics.index, period_cols]
+    numeric = raw.apply(pd.to_numeric, errors="coerce")
+
+    values = numeric.fillna(0.0).astype(object)
+    is_mos = (metrics["metric"] == "mos").to_numpy()
+    if is_mos.any():
+        # MOS: número redondeado a 2 decimales como texto, texto cortado a 16 chars, vacío como NULL
+        mos_raw = raw[is_mos]
+        mos_num = numeric[is_mos]
+        mos_values = mos_num.map(lambda v: str(round(v, 2)), na_action="ignore").astype(object)
+        mos_values = mos_values.where(mos_num.notna(), mos_raw.map(lambda v: str(v)[:16], na_action="ignore"))
+        values.loc[is_mos] = mos_values
+    values = values.to_numpy()
+
+    n_metrics, n_periods = values.shape
+    df_flat = metric_ids.loc[metric_ids.index.repeat(n_periods)].reset_index(drop=True)
+    df_flat["periodo"] = list(layout.periods.values()) * n_metrics
+    # Número del mes dentro del horizonte de la hoja (1 = primer período del header)
+    df_flat["periodoequivalente"] = list(range(1, n_periods + 1)) * n_metrics
+    df_flat["metric_type"] = metrics["metric"].to_numpy().repeat(n_periods)
+    df_flat["value"] = pd.Series(values.ravel(), dtype=object)
+
+    # --- 8. PIVOT FINAL ---
+    index_cols = ["id_destination", "country", "id_product", "id_packaging", "periodo", "periodoequivalente"]
+    # Igual que pivot_table(aggfunc='first'): se descartan claves y valores nulos
+    df_flat = df_flat.dropna(subset=index_cols + ["value"])
+    df_pivoted = (
+        df_flat.groupby(index_cols + ["metric_type"])["value"]
+        .first()
+        .unstack("metric_type")
+        .sort_index(axis=1)
+        .reset_index()
+    )
 
     df_pivoted.columns.name = None
     
@@ -369,4 +371,4 @@ def transform_ifr_excel(file_content: bytes) -> pd.DataFrame:
         "country": "pais"
     })
 
-    return df_pivoted
\ No newline at end of file
+    return df_pivoted
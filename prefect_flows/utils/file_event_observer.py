@@ -0,0 +1,49 @@
+import json
+import time
+from typing import Iterator
+from config import settings
+from prefect_flows.utils.minio_client import MinioStorageObserver, parse_bucket_event
+from prefect_flows.utils.sotrage_observer import EventStorageObserver, StorageObserver
+
+
+# Sustituto local de las notificaciones de MinIO: lee eventos (una notificación JSON por línea,
+# mismo formato que entrega MinIO) desde un archivo que se va agregando, como `tail -f`.
+# El listado para la reconciliación se delega en otro observador (por defecto MinIO).
+class FileEventObserver(EventStorageObserver):
+    def __init__(self, events_path: str = settings.STORAGE_EVENTS_FILE, storage: StorageObserver | None = None,
+                 poll_interval: float = 0.5):
+        self.events_path = events_path
+        self.storage = storage or MinioStorageObserver()
+        self.poll_interval = poll_interval
+
+    def list_files(self, prefix: str = "") -> list[str]:
+        """Retorna la lista de archivos del almacenamiento subyacente."""
+        return self.storage.list_files(prefix)
+
+    def get_file_metadata(self, file_path: str) -> dict:
+        """Retorna los metadatos del archivo desde el almacenamiento subyacente."""
+        return self.storage.get_file_metadata(file_path)
+
+    def iter_files_metadata(self, prefix: str = "") -> Iterator[dict]:
+        """Recorre los archivos del almacenamiento subyacente."""
+        return self.storage.iter_files_metadata(prefix)
+
+    def watch_changes(self, prefix: str = "") -> Iterator[dict]:
+        """Entrega los objetos creados de cada evento nuevo agregado al archivo (los existentes al abrirlo se ignoran)."""
+        # El archivo se crea si no existe para poder seguirlo desde el inicio
+        open(self.events_path, "a").close()
+        with open(self.events_path, "r", encoding="utf-8") as events:
+            events.seek(0, 2)
+            while True:
+                position = events.tell()
+                line = events.readline()
+                if not line.endswith("\n"):
+                    # Sin eventos nuevos o línea a medio escribir: se vuelve a leer más tarde
+                    events.seek(position)
+                    time.sleep(self.poll_interval)
+                    continue
+                if not line.strip():
+                    continue
+                for metadata in parse_bucket_event(json.loads(line)):
+                    if metadata["file_path"].startswith(prefix):
+                        yield metadata
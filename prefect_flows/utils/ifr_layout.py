@@ -0,0 +1,146 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from datetime import date
+import pandas as pd
+from config import settings
+
+# Períodos escritos como texto: "01-2025", "1/2025" o "2025-01"
+MONTH_YEAR_PATTERN = re.compile(r"^(?P<month>\d{1,2})[-/](?P<year>\d{4})$")
+YEAR_MONTH_PATTERN = re.compile(r"^(?P<year>\d{4})[-/](?P<month>\d{1,2})$")
+
+# Layouts ya detectados por huella de plantilla (los más recientes al final)
+_layout_cache: "OrderedDict[str, IfrLayout]" = OrderedDict()
+_cache_lock = threading.Lock()
+LAYOUT_CACHE_SIZE = 32
+
+
+def parse_period(value) -> str | None:
+    """Retorna el período "MM-YYYY" de una celda del header (fecha o texto) o None si no es un período."""
+    if isinstance(value, (pd.Timestamp, date)):
+        return f"{value.month:02d}-{value.year}"
+    if not isinstance(value, str):
+        return None
+    text = value.strip()
+    match = MONTH_YEAR_PATTERN.match(text) or YEAR_MONTH_PATTERN.match(text)
+    if not match or not 1 <= int(match["month"]) <= 12:
+        return None
+    return f"{int(match['month']):02d}-{match['year']}"
+
+
+# Posiciones de la hoja IFR que usa la transformación, detectadas a partir de la plantilla
+class IfrLayout:
+    def __init__(self, fingerprint: str, header_row: int, label_column: int, mos_column: int | None, periods: dict[int, str]):
+        """
+        fingerprint: huella de la plantilla (ver layout_fingerprint).
+        header_row: fila (desde 0) con los períodos; los datos empiezan en la siguiente.
+        label_column: columna (desde 0) con los headers filial/producto/envase y los nombres de métricas.
+        mos_column: columna que marca la fila MOS (None si la plantilla no tiene MOS).
+        periods: columna -> período "MM-YYYY", en el orden del horizonte de planificación.
+        """
+        self.fingerprint = fingerprint
+        self.header_row = header_row
+        self.label_column = label_column
+        self.mos_column = mos_column
+        self.periods = periods
+
+    @property
+    def period_columns(self) -> list[int]:
+        return list(self.periods)
+
+    @property
+    def usecols(self) -> list[int]:
+        """Columnas que usa la transformación: etiqueta, MOS y períodos."""
+        columns = {self.label_column, *self.periods}
+        if self.mos_column is not None:
+            columns.add(self.mos_column)
+        return sorted(columns)
+
+    def data_rows(self, sheet: pd.DataFrame) -> pd.DataFrame:
+        """
+        Retorna las filas bajo el header de períodos con solo las columnas del layout (sin filas vacías).
+        `sheet` es la hoja completa leída con header=None y columnas numeradas desde 0; las columnas
+        del layout que la hoja no alcanza a tener se completan con 0.
+        """
+        columns = [column for column in self.usecols if column < sheet.shape[1]]
+        df = sheet.iloc[self.header_row + 1:][columns].dropna(how="all").reset_index(drop=True)
+        return df.reindex(columns=self.usecols, fill_value=0)
+
+    def __repr__(self):
+        periods = list(self.periods.values())
+        return (
+            f"IfrLayout({self.fingerprint}, header_row={self.header_row}, label_column={self.label_column}, "
+            f"mos_column={self.mos_column}, periods={periods[0]}..{periods[-1]} ({len(periods)}))"
+        )
+
+
+def layout_fingerprint(header_row: int, header_values: pd.Series) -> str:
+    """Huella de una plantilla: posición y contenido (celdas no vacías) de la fila de períodos."""
+    digest = hashlib.sha256(str(header_row).encode())
+    for column, value in header_values.dropna().items():
+        digest.update(f"|{column}:{value}".encode())
+    return digest.hexdigest()[:16]
+
+
+def find_period_row(scan: pd.DataFrame) -> tuple[int, dict[int, str]]:
+    """
+    Retorna la fila con más celdas de período dentro de las filas escaneadas y sus períodos por columna.
+    """
+    best_row, best_periods = None, {}
+    for row, values in scan.iterrows():
+        periods = {column: period for column, value in values.items() if (period := parse_period(value))}
+        if len(periods) > len(best_periods):
+            best_row, best_periods = row, periods
+    if best_row is None or len(best_periods) < 2:
+        raise ValueError(f"IFR layout not detected: no period header row in the first {len(scan)} rows")
+    if len(set(best_periods.values())) != len(best_periods):
+        raise ValueError(f"IFR layout not detected: repeated periods in header row {best_row}")
+    return best_row, best_periods
+
+
+def find_label_columns(scan: pd.DataFrame, metric_labels, first_period_column: int) -> tuple[int, int | None]:
+    """
+    Retorna la columna con más nombres de métricas (literales de METRICS_MAP) y la columna
+    donde aparece "MOS", ambas antes de la primera columna de períodos.
+    """
+    labels = scan.loc[:, scan.columns < first_period_column]
+    texts = labels.map(lambda v: v.strip() if isinstance(v, str) else None)
+
+    metric_hits = texts.isin(set(metric_labels)).sum()
+    if metric_hits.empty or metric_hits.max() == 0:
+        raise ValueError(f"IFR layout not detected: no metric labels in the first {len(scan)} rows")
+    label_column = int(metric_hits.idxmax())
+
+    mos_hits = (texts.map(lambda v: v.lower() if isinstance(v, str) else None) == "mos").sum().drop(label_column)
+    mos_column = int(mos_hits.idxmax()) if not mos_hits.empty and mos_hits.max() > 0 else None
+    return label_column, mos_column
+
+
+def detect_ifr_layout(sheet: pd.DataFrame, metric_labels) -> tuple[IfrLayout, bool]:
+    """
+    Detecta el layout de la hoja a partir de sus primeras IFR_LAYOUT_SCAN_ROWS filas: la fila de
+    períodos, la columna de etiquetas y la de MOS. `sheet` es la hoja ya leída con header=None
+    (la transformación la lee una sola vez y toma las columnas del layout con data_rows).
+    El layout se guarda por huella de plantilla (fila y contenido del header de períodos): un libro
+    de la misma plantilla solo repite el escaneo del header y reutiliza las columnas ya detectadas.
+    Retorna el layout y si la plantilla es nueva para este proceso.
+    """
+    scan = sheet.head(settings.IFR_LAYOUT_SCAN_ROWS).copy()
+    scan.columns = range(scan.shape[1])
+    header_row, periods = find_period_row(scan)
+    fingerprint = layout_fingerprint(header_row, scan.loc[header_row])
+
+    with _cache_lock:
+        layout = _layout_cache.get(fingerprint)
+        if layout is not None:
+            _layout_cache.move_to_end(fingerprint)
+            return layout, False
+
+    label_column, mos_column = find_label_columns(scan, metric_labels, min(periods))
+    layout = IfrLayout(fingerprint, header_row, label_column, mos_column, periods)
+    with _cache_lock:
+        _layout_cache[fingerprint] = layout
+        while len(_layout_cache) > LAYOUT_CACHE_SIZE:
+            _layout_cache.popitem(last=False)
+    return layout, True
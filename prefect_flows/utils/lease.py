@@ -0,0 +1,37 @@
+import threading
+from contextlib import contextmanager
+from prefect.logging import get_logger
+from config import settings
+from database.db_state import renew_lease
+
+logger = get_logger("prefect_flows.lease")
+
+
+@contextmanager
+def keep_lease(file_path: str, owner: str, interval: float | None = None):
+    """
+    Renueva el lease de `owner` sobre el archivo cada `interval` segundos (STATE_LEASE_RENEW_SECONDS)
+    en un hilo de fondo mientras dura el bloque, así un archivo más lento que STATE_LEASE_SECONDS
+    no puede ser reclamado por otro worker. Si el lease se pierde deja de renovarlo: la publicación
+    del archivo lo detecta (mark_file_ready) y no se aplica.
+    """
+    interval = settings.STATE_LEASE_RENEW_SECONDS if interval is None else interval
+    stop = threading.Event()
+
+    def renew():
+        while not stop.wait(interval):
+            try:
+                if not renew_lease(file_path, owner):
+                    logger.warning(f"Lease of {file_path} lost by {owner}, its load will not be published")
+                    return
+            except Exception as e:
+                # Un fallo transitorio de la base no detiene la renovación; el lease sigue vigente hasta vencer
+                logger.warning(f"Could not renew lease of {file_path}: {e}")
+
+    thread = threading.Thread(target=renew, name=f"lease-{file_path}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
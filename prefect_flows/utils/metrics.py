@@ -0,0 +1,176 @@
+import functools
+import inspect
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+import pandas as pd
+
+# Colector del archivo en proceso. Los task runners de Prefect copian el contexto al enviar
+# cada tarea, por lo que las ramas que corren en otros hilos registran en el mismo colector.
+_current_metrics: ContextVar["StageMetrics | None"] = ContextVar("stage_metrics", default=None)
+
+
+# Etapas en curso en el proceso: el pico de RSS del proceso (VmHWM) solo se reinicia cuando empieza
+# una etapa sin otras en curso, para no borrar el pico de una etapa concurrente
+_stage_lock = threading.Lock()
+_active_stages = 0
+_hwm_resettable = sys.platform.startswith("linux")
+
+
+def peak_rss_bytes() -> int:
+    """Retorna el pico de memoria residente del proceso (ru_maxrss está en KB en Linux y en bytes en macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _proc_status_bytes(field: str) -> int | None:
+    """Retorna un campo en kB de /proc/self/status (VmRSS, VmHWM) en bytes, o None fuera de Linux."""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def current_rss_bytes() -> int:
+    """Retorna la memoria residente actual del proceso (en otros sistemas, el pico de vida del proceso)."""
+    rss = _proc_status_bytes("VmRSS")
+    return rss if rss is not None else peak_rss_bytes()
+
+
+def _begin_stage_peak() -> None:
+    """Reinicia VmHWM (escribiendo 5 en /proc/self/clear_refs) si no hay otras etapas en curso."""
+    global _active_stages, _hwm_resettable
+    with _stage_lock:
+        if _active_stages == 0 and _hwm_resettable:
+            try:
+                with open("/proc/self/clear_refs", "w") as clear_refs:
+                    clear_refs.write("5")
+            except OSError:
+                _hwm_resettable = False
+        _active_stages += 1
+
+
+def _end_stage_peak(rss_start: int, rss_end: int) -> int:
+    """
+    Retorna el pico de RSS de la etapa: VmHWM desde el último reinicio (que incluye la memoria de las
+    etapas concurrentes) o, si no se puede reiniciar, el mayor entre el RSS al inicio y al final.
+    """
+    global _active_stages
+    peak = _proc_status_bytes("VmHWM") if _hwm_resettable else None
+    with _stage_lock:
+        _active_stages -= 1
+    return max(peak or 0, rss_start, rss_end)
+
+
+def dataframe_bytes(df: pd.DataFrame) -> int:
+    """Retorna el tamaño en memoria de un DataFrame (incluye el contenido de las columnas de texto)."""
+    return int(df.memory_usage(deep=True).sum())
+
+
+# Métricas por etapa (bytes, filas, tiempo real, tiempo de CPU y pico de RSS) de un archivo
+class StageMetrics:
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.records: list[dict] = []
+        self._lock = threading.Lock()
+
+    def add(self, record: dict) -> None:
+        with self._lock:
+            self.records.append({"file_path": self.file_path, **record})
+
+    def total(self, wall_time: float | None = None) -> dict:
+        """
+        Registro resumen del archivo: suma de tiempos de CPU, bytes y filas de las etapas y el pico de RSS.
+        `wall_time` es el tiempo real del archivo (las ramas corren en paralelo); por defecto, la suma de las etapas.
+        """
+        return {
+            "file_path": self.file_path,
+            "stage": "total",
+            "started_at": min((r["started_at"] for r in self.records), default=datetime.now(timezone.utc)),
+            "wall_time": wall_time if wall_time is not None else sum(r["wall_time"] for r in self.records),
+            "cpu_time": sum(r["cpu_time"] for r in self.records),
+            "rows": sum(r["rows"] or 0 for r in self.records),
+            "bytes": sum(r["bytes"] or 0 for r in self.records),
+            "peak_rss": max((r["peak_rss"] for r in self.records), default=current_rss_bytes()),
+            # Las etapas pueden solaparse: la suma de sus deltas no es el crecimiento del archivo
+            "rss_delta": None,
+        }
+
+
+@contextmanager
+def collect_metrics(file_path: str):
+    """
+    Activa un colector para las etapas ejecutadas dentro del bloque (y en las tareas enviadas desde él).
+    """
+    metrics = StageMetrics(file_path)
+    token = _current_metrics.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current_metrics.reset(token)
+
+
+@contextmanager
+def measure_stage(stage: str):
+    """
+    Mide una etapa y la registra en el colector activo (si no hay, no registra nada).
+    Entrega un diccionario donde la etapa puede informar "rows" y "bytes".
+    El tiempo de CPU es el del hilo que ejecuta la etapa. El pico de RSS es el del proceso durante la
+    etapa (en Linux se reinicia VmHWM al empezar, así un worker reutilizado no arrastra el pico de
+    archivos anteriores) y `rss_delta` es el cambio de RSS entre el inicio y el final de la etapa.
+    """
+    values = {"rows": None, "bytes": None}
+    started_at = datetime.now(timezone.utc)
+    _begin_stage_peak()
+    rss_start = current_rss_bytes()
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        yield values
+    finally:
+        wall_time = time.perf_counter() - wall_start
+        cpu_time = time.thread_time() - cpu_start
+        rss_end = current_rss_bytes()
+        peak_rss = _end_stage_peak(rss_start, rss_end)
+        metrics = _current_metrics.get()
+        if metrics is not None:
+            metrics.add({
+                "stage": stage,
+                "started_at": started_at,
+                "wall_time": wall_time,
+                "cpu_time": cpu_time,
+                "rows": values["rows"],
+                "bytes": values["bytes"],
+                "peak_rss": peak_rss,
+                "rss_delta": rss_end - rss_start,
+            })
+
+
+def measured(stage: str, input_arg: str | None = None):
+    """
+    Decorador que mide la función como la etapa `stage` y registra filas y tamaño en memoria
+    del DataFrame que retorna o, con `input_arg`, del DataFrame recibido en ese parámetro
+    (para las cargas, que no retornan datos).
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with measure_stage(stage) as measured_stage:
+                result = fn(*args, **kwargs)
+                df = signature.bind(*args, **kwargs).arguments.get(input_arg) if input_arg else result
+                if isinstance(df, pd.DataFrame):
+                    measured_stage["rows"] = len(df)
+                    measured_stage["bytes"] = dataframe_bytes(df)
+            return result
+        return wrapper
+    return decorator
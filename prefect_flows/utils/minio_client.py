@@ -1,6 +1,6 @@
 from minio import Minio
 from config import settings
-from prefect_flows.utils.sotrage_observer import StorageObserver
+from prefect_flows.utils.sotrage_observer import EventStorageObserver, StorageObserver
 
 # Crea y retorna una instancia del cliente MinIO configurado según las credenciales del sistema
 def get_minio_client():
@@ -10,12 +10,29 @@ def get_minio_client():
         secret_key=settings.MINIO_SECRET_KEY,
         secure=False
     )
+
+
+# Prefijo de las ubicaciones en MinIO usadas por la configuración ("minio://<bucket>/<prefijo>")
+MINIO_SCHEME = "minio://"
+
+
+def parse_minio_location(location: str) -> tuple[str, str] | None:
+    """Retorna (bucket, prefijo) de una ubicación "minio://<bucket>/<prefijo>", o None si es una ruta local."""
+    if not location.startswith(MINIO_SCHEME):
+        return None
+    bucket, _, prefix = location[len(MINIO_SCHEME):].partition("/")
+    return bucket, prefix.strip("/")
     
 
 from minio import Minio
 from minio.error import S3Error
 from config import settings
 from datetime import datetime
+from typing import Iterator
+from urllib.parse import unquote_plus
+
+# Eventos de MinIO que implican contenido nuevo (put, copy, multipart completado)
+CREATED_EVENTS = ("s3:ObjectCreated:*",)
 
 # Implementación de un observador de almacenamiento para MinIO
 class MinioStorageObserver(StorageObserver):
@@ -40,4 +57,45 @@ class MinioStorageObserver(StorageObserver):
             "last_modified": stat.last_modified,
             "size": stat.size,
             "etag": stat.etag
-        }
\ No newline at end of file
+        }
+
+    def iter_files_metadata(self, prefix: str = "") -> Iterator[dict]:
+        """Recorre el listado del bucket entregando los metadatos que ya trae cada objeto, sin stat_object por archivo."""
+        for obj in self.client.list_objects(self.bucket, prefix=prefix, recursive=True):
+            if obj.is_dir:
+                continue
+            yield {
+                "file_path": obj.object_name,
+                "last_modified": obj.last_modified,
+                "size": obj.size,
+                "etag": obj.etag
+            }
+
+
+def parse_bucket_event(event: dict) -> Iterator[dict]:
+    """
+    Convierte una notificación de bucket (formato S3: {"Records": [...]}) en los metadatos
+    de cada objeto creado, con las mismas claves que iter_files_metadata.
+    """
+    for record in event.get("Records") or []:
+        if not record.get("eventName", "").startswith("s3:ObjectCreated:"):
+            continue
+        obj = record["s3"]["object"]
+        yield {
+            # La clave llega codificada como URL
+            "file_path": unquote_plus(obj["key"]),
+            "last_modified": datetime.fromisoformat(record["eventTime"].replace("Z", "+00:00")),
+            "size": obj.get("size"),
+            "etag": obj.get("eTag")
+        }
+
+
+# Observador de MinIO dirigido por eventos: escucha las notificaciones del bucket
+# y mantiene el listado heredado para la reconciliación periódica.
+class MinioNotificationObserver(MinioStorageObserver, EventStorageObserver):
+
+    def watch_changes(self, prefix: str = "") -> Iterator[dict]:
+        """Entrega los metadatos de cada objeto creado en el bucket, a medida que MinIO lo notifica."""
+        with self.client.listen_bucket_notification(self.bucket, prefix=prefix, events=CREATED_EVENTS) as events:
+            for event in events:
+                yield from parse_bucket_event(event)
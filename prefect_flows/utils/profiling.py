@@ -0,0 +1,215 @@
+import cProfile
+import functools
+import inspect
+import io
+import os
+import pstats
+import re
+import tempfile
+import threading
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from prefect.artifacts import create_markdown_artifact
+from prefect.logging import get_logger
+from prefect.runtime import flow_run
+from config import settings
+from prefect_flows.utils.minio_client import MINIO_SCHEME, get_minio_client, parse_minio_location
+
+PROFILE_MODES = ("cprofile", "tracemalloc", "both")
+
+logger = get_logger("prefect_flows.profiling")
+
+# Modo fijado por un flujo (parámetro `profile`); sin él se usa PROFILE_MODE.
+# Los task runners de hilos copian el contexto, así que las tareas del flujo lo heredan.
+_profile_mode: ContextVar[str | None] = ContextVar("profile_mode", default=None)
+
+# cProfile (3.11) usa sys.setprofile por hilo: un segundo perfilador en el mismo hilo reemplazaría al primero
+_thread_state = threading.local()
+
+# Asignaciones del propio perfilado (snapshots, estadísticas) que se excluyen del reporte
+TRACEMALLOC_EXCLUDED = [
+    tracemalloc.Filter(False, module.__file__) for module in (tracemalloc, cProfile, pstats)
+]
+
+# tracemalloc es global al proceso: se inicia con la primera medición activa y se detiene con la última
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+
+
+@contextmanager
+def profile_mode(mode: str | None):
+    """
+    Fija el modo de perfilado para el bloque (y las tareas que se ejecuten dentro); con None no cambia nada.
+    El wrapper de profiled solo usa funciones del módulo: así se serializa para el runner de procesos
+    sin arrastrar el ContextVar, que no se puede serializar.
+    """
+    token = _profile_mode.set(mode) if mode else None
+    try:
+        yield
+    finally:
+        if token is not None:
+            _profile_mode.reset(token)
+
+
+def current_profile_mode() -> str | None:
+    """Retorna el modo de perfilado vigente ("cprofile", "tracemalloc", "both") o None si está desactivado."""
+    mode = (_profile_mode.get() or settings.PROFILE_MODE or "").lower()
+    if mode in ("", "off", "none"):
+        return None
+    if mode not in PROFILE_MODES:
+        # Un modo mal escrito no debe hacer fallar la ejecución
+        logger.warning(f"Unknown profile mode {mode!r}, expected one of {PROFILE_MODES}; profiling disabled")
+        return None
+    return mode
+
+
+def is_profile_target(name: str) -> bool:
+    """Indica si la tarea o flujo `name` está en PROFILE_TARGETS ("*" = todos)."""
+    targets = {t.strip() for t in settings.PROFILE_TARGETS.split(",") if t.strip()}
+    return "*" in targets or name in targets
+
+
+def _start_tracemalloc() -> None:
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(settings.PROFILE_TRACEMALLOC_FRAMES)
+        _tracemalloc_users += 1
+
+
+def _stop_tracemalloc() -> None:
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0:
+            tracemalloc.stop()
+
+
+def _format_report(name: str, mode: str, profiler: cProfile.Profile | None, allocations: list, peak: int | None) -> str:
+    lines = [f"# {name} (mode={mode}, flow_run={flow_run.id}, {datetime.now(timezone.utc).isoformat()})", ""]
+    if profiler is not None:
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(settings.PROFILE_TOP)
+        lines += ["## Top functions (cProfile, cumulative)", stream.getvalue().strip(), ""]
+    elif mode in ("cprofile", "both"):
+        lines += ["## Top functions", "cProfile skipped: another profiler is active in this thread", ""]
+    if peak is not None:
+        lines += [
+            "## Top allocation sites (tracemalloc, net growth)",
+            f"Peak traced memory: {peak / 1024 / 1024:.1f} MB",
+            *(str(stat) for stat in allocations[:settings.PROFILE_TOP]),
+            "",
+        ]
+    return "\n".join(lines)
+
+
+def _store_report(name: str, report: str, profiler: cProfile.Profile | None) -> tuple[str, str | None]:
+    """
+    Guarda el reporte (y el .prof de cProfile, legible con snakeviz o pstats) en PROFILE_OUTPUT:
+    un directorio local o "minio://<bucket>/<prefijo>". Retorna la ubicación del reporte y, en MinIO, una URL firmada.
+    """
+    run_dir = str(flow_run.id or "local")
+    base_name = f"{re.sub(r'[^A-Za-z0-9_.-]', '_', name)}-{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}"
+
+    minio_location = parse_minio_location(settings.PROFILE_OUTPUT)
+    if minio_location is None:
+        directory = os.path.join(settings.PROFILE_OUTPUT, run_dir)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{base_name}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(report)
+        if profiler is not None:
+            profiler.dump_stats(os.path.join(directory, f"{base_name}.prof"))
+        return os.path.abspath(path), None
+
+    bucket, prefix = minio_location
+    key = "/".join(part for part in (prefix, run_dir, base_name) if part)
+    client = get_minio_client()
+    data = report.encode("utf-8")
+    client.put_object(bucket, f"{key}.txt", io.BytesIO(data), len(data), content_type="text/plain")
+    if profiler is not None:
+        with tempfile.NamedTemporaryFile(suffix=".prof") as tmp:
+            profiler.dump_stats(tmp.name)
+            client.fput_object(bucket, f"{key}.prof", tmp.name)
+    url = client.presigned_get_object(bucket, f"{key}.txt", expires=timedelta(days=7))
+    return f"{MINIO_SCHEME}{bucket}/{key}.txt", url
+
+
+def _publish_report(name: str, mode: str, report: str, location: str, url: str | None) -> None:
+    """Enlaza el reporte desde la ejecución con un artefacto markdown (solo dentro de un flujo)."""
+    if flow_run.id is None:
+        return
+    link = f"[{location}]({url})" if url else f"`{location}`"
+    create_markdown_artifact(
+        key=f"profile-{re.sub(r'[^a-z0-9-]', '-', name.lower())}",
+        markdown=f"**Profile `{name}`** ({mode}): {link}\n\n```\n{report[:4000]}\n```",
+        description=f"Perfil {mode} de {name}",
+    )
+
+
+@contextmanager
+def profiling(name: str, mode: str | None = None):
+    """
+    Perfila el bloque con cProfile, tracemalloc o ambos según `mode` (por defecto el modo vigente)
+    si `name` está en PROFILE_TARGETS; si no, no hace nada. El reporte con las funciones y
+    sitios de asignación principales se guarda en PROFILE_OUTPUT y se enlaza desde la ejecución.
+    Un error al guardar el perfil se registra y no afecta al bloque perfilado.
+    """
+    mode = mode or current_profile_mode()
+    if mode is None or not is_profile_target(name):
+        yield
+        return
+
+    profiler = None
+    if mode in ("cprofile", "both") and not getattr(_thread_state, "active", False):
+        profiler = cProfile.Profile()
+    snapshot = None
+    if mode in ("tracemalloc", "both"):
+        _start_tracemalloc()
+        tracemalloc.reset_peak()
+        snapshot = tracemalloc.take_snapshot().filter_traces(TRACEMALLOC_EXCLUDED)
+
+    if profiler is not None:
+        _thread_state.active = True
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            _thread_state.active = False
+        allocations, peak = [], None
+        if snapshot is not None:
+            _, peak = tracemalloc.get_traced_memory()
+            allocations = tracemalloc.take_snapshot().filter_traces(TRACEMALLOC_EXCLUDED).compare_to(snapshot, "lineno")
+            _stop_tracemalloc()
+
+        try:
+            report = _format_report(name, mode, profiler, allocations, peak)
+            location, url = _store_report(name, report, profiler)
+            logger.info(f"Profile of {name} ({mode}) saved to {location}")
+            _publish_report(name, mode, report, location, url)
+        except Exception as e:
+            logger.warning(f"Could not store profile of {name}: {e}")
+
+
+def profiled(fn=None, *, mode_arg: str | None = None):
+    """
+    Decorador que perfila la función (tarea o flujo) con `profiling` bajo su nombre.
+    Con `mode_arg`, el parámetro de ese nombre (si no es None) fija el modo para la llamada
+    y para las tareas que se ejecuten dentro de ella (por ejemplo, el parámetro `profile` del despliegue).
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            mode = signature.bind(*args, **kwargs).arguments.get(mode_arg) if mode_arg else None
+            with profile_mode(mode), profiling(fn.__name__):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorator(fn) if fn is not None else decorator
@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from typing import Iterator
 
 # Clase base abstracta para definir una interfaz común de observadores de almacenamiento.
 class StorageObserver(ABC):
@@ -12,3 +13,17 @@ class StorageObserver(ABC):
     def get_file_metadata(self, file_path: str) -> dict:
         """Debe retornar los metadatos de un archivo específico (como tamaño, fecha, hash, etc.)."""
         pass
+
+    @abstractmethod
+    def iter_files_metadata(self, prefix: str = "") -> Iterator[dict]:
+        """Debe recorrer los archivos almacenados entregando su ruta y metadatos (file_path, etag, size, last_modified) en una sola pasada."""
+        pass
+
+
+# Observador que además entrega los cambios a medida que ocurren (notificaciones del almacenamiento).
+class EventStorageObserver(StorageObserver):
+
+    @abstractmethod
+    def watch_changes(self, prefix: str = "") -> Iterator[dict]:
+        """Debe bloquear esperando eventos y entregar los metadatos (file_path, etag, size, last_modified) de cada archivo creado o modificado."""
+        pass
@@ -0,0 +1,234 @@
+import hashlib
+import json
+import os
+import re
+import time
+from abc import ABC, abstractmethod
+from io import BytesIO
+from typing import Iterator
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from minio.error import S3Error
+from prefect.logging import get_logger
+from config import settings
+from prefect_flows.tasks.transform import TRANSFORM_VERSION
+from prefect_flows.utils.minio_client import get_minio_client, parse_minio_location
+
+# Clave de los metadatos de Parquet donde se guardan los dtypes de pandas del DataFrame
+DTYPES_METADATA_KEY = b"etl_dtypes"
+MANIFEST_NAME = "manifest.json"
+
+logger = get_logger("prefect_flows.staging_cache")
+
+
+# Almacén de objetos de la caché de staging (directorio local o prefijo de MinIO)
+class StagingStore(ABC):
+
+    @abstractmethod
+    def put(self, key: str, data: bytes) -> None:
+        """Debe guardar `data` bajo `key`, reemplazando lo que exista."""
+        pass
+
+    @abstractmethod
+    def get(self, key: str) -> bytes | None:
+        """Debe retornar el contenido de `key` o None si no existe."""
+        pass
+
+    @abstractmethod
+    def entries(self, prefix: str = "") -> Iterator[tuple[str, int, float]]:
+        """Debe recorrer los objetos bajo `prefix` entregando (key, tamaño en bytes, fecha de modificación epoch)."""
+        pass
+
+    @abstractmethod
+    def remove(self, key: str) -> None:
+        """Debe eliminar `key` si existe."""
+        pass
+
+
+class LocalStagingStore(StagingStore):
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def put(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Escritura atómica: un lector concurrente nunca ve un archivo a medias
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def get(self, key: str) -> bytes | None:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def entries(self, prefix: str = "") -> Iterator[tuple[str, int, float]]:
+        base = self._path(prefix) if prefix else self.root
+        for directory, _, files in os.walk(base):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield os.path.relpath(path, self.root).replace(os.sep, "/"), stat.st_size, stat.st_mtime
+
+    def remove(self, key: str) -> None:
+        path = self._path(key)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        # Se eliminan los directorios de la entrada que quedaron vacíos (sin tocar la raíz)
+        directory = os.path.dirname(path)
+        while os.path.abspath(directory) != os.path.abspath(self.root):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                break
+            directory = os.path.dirname(directory)
+
+
+class MinioStagingStore(StagingStore):
+    def __init__(self, bucket: str, prefix: str):
+        self.client = get_minio_client()
+        self.bucket = bucket
+        self.prefix = f"{prefix}/" if prefix else ""
+
+    def put(self, key: str, data: bytes) -> None:
+        self.client.put_object(self.bucket, self.prefix + key, BytesIO(data), len(data))
+
+    def get(self, key: str) -> bytes | None:
+        try:
+            response = self.client.get_object(self.bucket, self.prefix + key)
+        except S3Error as e:
+            if e.code == "NoSuchKey":
+                return None
+            raise
+        try:
+            return response.read()
+        finally:
+            response.close()
+            response.release_conn()
+
+    def entries(self, prefix: str = "") -> Iterator[tuple[str, int, float]]:
+        for obj in self.client.list_objects(self.bucket, prefix=self.prefix + prefix, recursive=True):
+            if not obj.is_dir:
+                yield obj.object_name[len(self.prefix):], obj.size, obj.last_modified.timestamp()
+
+    def remove(self, key: str) -> None:
+        self.client.remove_object(self.bucket, self.prefix + key)
+
+
+def get_staging_store() -> StagingStore | None:
+    """Retorna el almacén configurado en STAGING_CACHE_LOCATION, o None si la caché está desactivada."""
+    location = settings.STAGING_CACHE_LOCATION
+    if not location:
+        return None
+    minio_location = parse_minio_location(location)
+    if minio_location is not None:
+        return MinioStagingStore(*minio_location)
+    return LocalStagingStore(location)
+
+
+def entry_prefix(file_path: str, etag: str) -> str:
+    """
+    Prefijo de la entrada de un archivo: hash de la ruta / etag / versión de la transformación.
+    Un objeto nuevo (otro etag) o un cambio de TRANSFORM_VERSION nunca reutiliza DataFrames anteriores.
+    """
+    path_hash = hashlib.sha256(file_path.encode()).hexdigest()[:16]
+    return f"{path_hash}/{re.sub(r'[^A-Za-z0-9-]', '_', etag)}-v{TRANSFORM_VERSION}"
+
+
+def save_manifest(file_path: str, etag: str, manifest: dict) -> None:
+    """Guarda los digests del archivo (contenido y hojas) para decidir las ramas sin descargarlo."""
+    store = get_staging_store()
+    if store is None:
+        return
+    data = json.dumps({"file_path": file_path, "etag": etag, **manifest}).encode()
+    store.put(f"{entry_prefix(file_path, etag)}/{MANIFEST_NAME}", data)
+
+
+def load_manifest(file_path: str, etag: str) -> dict | None:
+    """Retorna el manifiesto guardado para (archivo, etag, versión) o None."""
+    store = get_staging_store()
+    if store is None:
+        return None
+    data = store.get(f"{entry_prefix(file_path, etag)}/{MANIFEST_NAME}")
+    return json.loads(data) if data is not None else None
+
+
+def save_frame(file_path: str, etag: str, sheet: str, df: pd.DataFrame) -> int:
+    """
+    Guarda el DataFrame preparado de una hoja como Parquet y retorna los bytes escritos.
+    Los dtypes de pandas se guardan en los metadatos para restaurarlos exactos (por ejemplo,
+    las columnas object de IFR), así la carga desde la caché es igual a la carga directa.
+    """
+    store = get_staging_store()
+    if store is None:
+        return 0
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    dtypes = json.dumps({column: str(dtype) for column, dtype in df.dtypes.items()}).encode()
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), DTYPES_METADATA_KEY: dtypes})
+    buffer = BytesIO()
+    pq.write_table(table, buffer)
+    store.put(f"{entry_prefix(file_path, etag)}/{sheet}.parquet", buffer.getvalue())
+    return buffer.tell()
+
+
+def load_frame(file_path: str, etag: str, sheet: str) -> pd.DataFrame | None:
+    """Retorna el DataFrame guardado de la hoja o None si no está en la caché."""
+    store = get_staging_store()
+    if store is None:
+        return None
+    data = store.get(f"{entry_prefix(file_path, etag)}/{sheet}.parquet")
+    if data is None:
+        return None
+    table = pq.read_table(BytesIO(data))
+    dtypes = json.loads(table.schema.metadata[DTYPES_METADATA_KEY])
+    return table.to_pandas().astype(dtypes)
+
+
+def discard_entry(file_path: str, etag: str) -> None:
+    """Elimina la entrada del archivo (se llama cuando su carga terminó con éxito)."""
+    store = get_staging_store()
+    if store is None:
+        return
+    for key, _, _ in list(store.entries(f"{entry_prefix(file_path, etag)}/")):
+        store.remove(key)
+
+
+def evict_staging_cache(max_bytes: int | None = None, max_age_hours: float | None = None) -> int:
+    """
+    Elimina los objetos de la caché más antiguos que `max_age_hours` (STAGING_CACHE_MAX_AGE_HOURS)
+    y luego, de más antiguo a más nuevo, hasta que el total quede bajo `max_bytes`
+    (STAGING_CACHE_MAX_BYTES). Retorna cuántos objetos se eliminaron.
+    """
+    store = get_staging_store()
+    if store is None:
+        return 0
+    max_bytes = settings.STAGING_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    max_age_hours = settings.STAGING_CACHE_MAX_AGE_HOURS if max_age_hours is None else max_age_hours
+
+    entries = sorted(store.entries(), key=lambda entry: entry[2])
+    total = sum(size for _, size, _ in entries)
+    oldest_allowed = time.time() - max_age_hours * 3600
+    removed = 0
+    for key, size, modified in entries:
+        if modified >= oldest_allowed and total <= max_bytes:
+            break
+        store.remove(key)
+        total -= size
+        removed += 1
+    if removed:
+        logger.info(f"Evicted {removed} staging cache objects ({total / 1024 / 1024:.1f} MB left)")
+    return removed
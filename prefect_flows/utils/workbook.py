@@ -0,0 +1,154 @@
+import hashlib
+import importlib.util
+import posixpath
+import threading
+import zipfile
+import xml.etree.ElementTree as ET
+from io import BytesIO
+from typing import IO
+import pandas as pd
+from prefect.logging import get_logger
+from config import settings
+
+# Espacios de nombres de SpreadsheetML usados para resolver hoja -> parte del zip
+MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PKG_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+# Partes compartidas de las que depende el contenido de cualquier hoja (textos y formatos de celda)
+SHARED_PARTS = ("xl/sharedStrings.xml", "xl/styles.xml")
+
+
+# Backends de lectura soportados, del más rápido al de respaldo.
+# calamine (python-calamine, en Rust) es opcional; openpyxl (Python puro) siempre está disponible.
+READER_BACKENDS = ("calamine", "openpyxl")
+FALLBACK_BACKEND = "openpyxl"
+
+logger = get_logger("prefect_flows.workbook")
+
+
+def resolve_backend(engine: str | None = None) -> str:
+    """
+    Retorna el backend a usar: `engine` o EXCEL_READER_BACKEND, o el de respaldo si el
+    configurado no está instalado.
+    """
+    engine = (engine or settings.EXCEL_READER_BACKEND).lower()
+    if engine not in READER_BACKENDS:
+        raise ValueError(f"Unknown Excel reader backend {engine!r}, expected one of {READER_BACKENDS}")
+    if engine == "calamine" and importlib.util.find_spec("python_calamine") is None:
+        logger.warning("python-calamine is not installed, reading Excel files with openpyxl")
+        return FALLBACK_BACKEND
+    return engine
+
+
+# Manejador de un libro Excel que se abre una sola vez y se comparte entre las ramas del ETL
+class WorkbookHandle:
+    def __init__(self, data: bytes | IO[bytes], engine: str | None = None):
+        """
+        Abre el libro a partir de sus bytes o de un archivo binario con seek (por ejemplo
+        el temporal de extract_data_spooled): descomprime el zip y lee el índice de hojas,
+        los estilos y los sharedStrings una única vez.
+        El backend sale de `engine` o de EXCEL_READER_BACKEND (por defecto calamine).
+        Si calamine no puede abrir o leer el libro, se reabre con openpyxl, que pandas carga
+        en modo read_only (cada hoja se recorre en streaming). Ambos entregan los mismos
+        DataFrames (ver benchmarks/check_reader_backends.py).
+        """
+        self._source = BytesIO(data) if isinstance(data, (bytes, bytearray)) else data
+        # Los lectores no son seguros entre hilos: las lecturas de hojas se serializan. Un lector por
+        # rama no lo evitaría: el parseo retiene el GIL y dos lecturas en hilos tardan lo mismo que
+        # en serie (benchmarks/bench_branches.py)
+        self._lock = threading.Lock()
+        self.engine = resolve_backend(engine)
+        try:
+            self._excel = pd.ExcelFile(self._source, engine=self.engine)
+        except Exception as e:
+            if self.engine == FALLBACK_BACKEND:
+                raise
+            self._use_fallback(e)
+
+    def _use_fallback(self, error: Exception) -> None:
+        logger.warning(f"Excel reader {self.engine!r} failed ({error}), falling back to {FALLBACK_BACKEND!r}")
+        self._source.seek(0)
+        self.engine = FALLBACK_BACKEND
+        self._excel = pd.ExcelFile(self._source, engine=FALLBACK_BACKEND)
+
+    @property
+    def sheet_names(self) -> list[str]:
+        """Retorna los nombres de las hojas del libro."""
+        return self._excel.sheet_names
+
+    def read_sheet(self, sheet_name: str, **kwargs) -> pd.DataFrame:
+        """
+        Retorna un DataFrame con la hoja solicitada.
+        Acepta los mismos parámetros que pd.read_excel (header, usecols, etc.).
+        """
+        with self._lock:
+            try:
+                return self._excel.parse(sheet_name=sheet_name, **kwargs)
+            except Exception as e:
+                if self.engine == FALLBACK_BACKEND:
+                    raise
+                # Una hoja que el backend rápido no puede leer se reintenta con openpyxl
+                self._excel.close()
+                self._use_fallback(e)
+                return self._excel.parse(sheet_name=sheet_name, **kwargs)
+
+    def close(self) -> None:
+        """Libera el libro y el buffer asociado."""
+        self._excel.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def as_workbook(data: "bytes | IO[bytes] | WorkbookHandle") -> WorkbookHandle:
+    """
+    Retorna un WorkbookHandle a partir de bytes o de un archivo, o el mismo manejador si ya lo es.
+    """
+    if isinstance(data, WorkbookHandle):
+        return data
+    return WorkbookHandle(data)
+
+
+def sheet_digests(source: IO[bytes]) -> dict[str, str]:
+    """
+    Retorna un digest SHA-256 por hoja (nombre -> digest) sin parsear las celdas.
+    Cada digest cubre el XML de la hoja y las partes compartidas (sharedStrings, styles):
+    los textos de todas las hojas están en sharedStrings, así que editar un texto en una hoja
+    invalida el digest de todas y ambas ramas se vuelven a ejecutar (solo los cambios numéricos
+    quedan acotados a su hoja).
+    Si el archivo no es un .xlsx legible (zip dañado, partes o relaciones faltantes), retorna un
+    diccionario vacío: sin digest, cada rama se ejecuta. Deja el archivo posicionado al inicio.
+    """
+    digests = {}
+    try:
+        with zipfile.ZipFile(source) as archive:
+            names = set(archive.namelist())
+            rels = ET.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+            targets = {rel.get("Id"): rel.get("Target") for rel in rels.iter(f"{PKG_REL_NS}Relationship")}
+
+            shared = hashlib.sha256()
+            for part in SHARED_PARTS:
+                if part in names:
+                    shared.update(archive.read(part))
+
+            workbook = ET.fromstring(archive.read("xl/workbook.xml"))
+            for sheet in workbook.iter(f"{MAIN_NS}sheet"):
+                target = targets.get(sheet.get(f"{REL_NS}id"), "")
+                # El target es relativo a xl/ salvo que empiece con "/"
+                part = target.lstrip("/") if target.startswith("/") else posixpath.normpath(f"xl/{target}")
+                if part not in names:
+                    continue
+                digest = shared.copy()
+                with archive.open(part) as stream:
+                    for chunk in iter(lambda: stream.read(1024 * 1024), b""):
+                        digest.update(chunk)
+                digests[sheet.get("name")] = digest.hexdigest()
+    except (zipfile.BadZipFile, KeyError, ET.ParseError) as e:
+        logger.warning(f"Could not compute sheet digests ({e!r}), every sheet will be processed")
+        digests = {}
+    finally:
+        source.seek(0)
+    return digests
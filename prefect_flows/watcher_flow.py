@@ -1,9 +1,11 @@
 from prefect import flow, get_run_logger
 from prefect.deployments import run_deployment
 from database.db_state import has_pending_state
+from prefect_flows.utils.profiling import profiled
 
 # Flujo que revisa periódicamente si hay archivos pendientes y dispara el ETL
 @flow
+@profiled
 def watcher_flow():
     logger = get_run_logger()
 